@@ -1,17 +1,26 @@
 import os
 import json
+import logging
+from logging.handlers import RotatingFileHandler
+from collections import ChainMap
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from services.imagegrid import ImageGridService
-from services.uploadtracker import ImageUploadTracker
+from services.uploadtracker import create_upload_tracker
 from services.findnearast import FindNearestService
 from services.arcgis import ArcGISService
-from services.image_processing import ImageProcessingService
-import pandas as pd
+from services.image_processing import ImageProcessingService, iter_image_files
+from models.upload_outcome import UploadOutcome
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Log a progress line roughly this many times per folder instead of one line per file
+PROGRESS_STEPS = 20
+
 class ToppbefaringUploader:
     def __init__(self, client_id=None, client_secret=None, token_url=None, imgr_api_url=None, tracking_file=None):
         # Use environment variables if not provided
@@ -26,14 +35,29 @@ class ToppbefaringUploader:
             raise ValueError("Missing required credentials. Please set IMAGEGRID_CLIENT_ID, IMAGEGRID_CLIENT_SECRET, IMAGEGRID_TOKEN_URL, and IMAGEGRID_API_URL in your .env file or pass them as parameters.")
 
         self.image_service = ImageGridService(self.client_id, self.client_secret, self.token_url, self.imgr_api_url)
-        self.tracker = ImageUploadTracker(self.tracking_file)
+        self.tracker = create_upload_tracker(self.tracking_file)
         self.find_nearest = FindNearestService()
         self.arcgis_service = ArcGISService()
         self.image_processor = ImageProcessingService()
         self.tenant_name = "moerenett"
         self.schema_name = "Toppbefaring"
 
-    def upload_toppbefaring_image(self, image_path, base_attributes, find_mast=True, resize_options=None):
+        # Number of images uploaded in parallel (capped to avoid saturating the ImageGrid backend)
+        self.max_workers = self.image_service.max_concurrency
+
+    def _has_been_uploaded(self, image_path, file_hash):
+        """
+        Look up file_hash in the tracker. When HASH_ALGO_FALLBACK is set, rows logged before
+        HASH_ALGO was changed hold that algorithm's hash, so a miss is retried with it.
+        """
+        result = self.tracker.has_been_uploaded(file_hash)
+        fallback = self.image_service.fallback_hash_algorithm
+        if result[0] or not fallback or fallback == self.image_service.hash_algorithm:
+            return result
+        return self.tracker.has_been_uploaded(self.image_service.calculate_file_hash(image_path, fallback))
+
+    def upload_toppbefaring_image(self, image_path, base_attributes, find_mast=True, resize_options=None,
+                                  gps=None, nearest_mast=None, filename=None):
         """
         Upload a toppbefaring image to ImageGrid with specific attributes.
         If find_mast is True, will try to find nearest mast and include mast attributes.
@@ -41,11 +65,30 @@ class ToppbefaringUploader:
 
         Args:
             image_path (str): Path to the image file
-            base_attributes (dict): Base attributes for the image
+            base_attributes (Mapping): Base attributes for the image (not modified)
             find_mast (bool): Whether to find nearest mast
             resize_options (dict): Resize options with keys: max_width, max_height, quality, overwrite
+            gps (tuple): Prefetched (latitude, longitude); read from the image when None
+            nearest_mast (dict): Prefetched nearest mast feature; looked up when None
+            filename (str): File name of image_path, if the caller already has it
+
+        Returns:
+            UploadOutcome: status ('ok', 'skipped' or 'failed'), the file hash and the upload result
         """
+        file_hash = None
+        if filename is None:
+            filename = os.path.basename(image_path)
         try:
+            # Calculate file hash first (use original path for tracking) so duplicates are rejected
+            # before any resize, EXIF or ArcGIS work
+            file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
+
+            # Check if already uploaded
+            is_uploaded, upload_time, update_time = self._has_been_uploaded(image_path, file_hash)
+            if is_uploaded:
+                logger.debug("Image %s already uploaded at %s", filename, upload_time)
+                return UploadOutcome("skipped", file_hash)
+
             # Handle resizing if requested
             upload_path = image_path
             if resize_options:
@@ -54,51 +97,58 @@ class ToppbefaringUploader:
                 quality = resize_options.get('quality', 85)
                 overwrite = resize_options.get('overwrite', False)
 
+                output_path = image_path if overwrite else None
                 if overwrite:
-                    upload_path = self.image_processor.resize_image_with_exif(
-                        image_path, max_width, max_height, quality, image_path
+                    before = os.stat(image_path)
+
+                if gps is None:
+                    # Read GPS while the image is open for resizing, instead of opening it again below
+                    latitude, longitude, upload_path = self.image_processor.process_image(
+                        image_path, max_width, max_height, quality, output_path
                     )
+                    gps = (latitude, longitude)
                 else:
                     upload_path = self.image_processor.resize_image_with_exif(
-                        image_path, max_width, max_height, quality
+                        image_path, max_width, max_height, quality, output_path
                     )
 
-            # Calculate file hash (use original path for tracking)
-            file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
-
-            # Check if already uploaded
-            is_uploaded, upload_time, update_time = self.tracker.has_been_uploaded(file_hash)
-            if is_uploaded:
-                print(f"Image {os.path.basename(image_path)} already uploaded at {upload_time}")
-                return None
+                if overwrite:
+                    # The original was replaced in place; track the resized content so a rerun
+                    # on the same folder still recognises it as uploaded
+                    after = os.stat(image_path)
+                    if (after.st_mtime_ns, after.st_size) != (before.st_mtime_ns, before.st_size):
+                        file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
 
             # Get GPS coordinates from image (use upload path for EXIF data)
-            latitude, longitude = self.find_nearest.get_gps_from_image(upload_path)
+            if gps is not None:
+                latitude, longitude = gps
+            else:
+                latitude, longitude = self.find_nearest.get_gps_from_image(upload_path)
 
             # Find nearest mast if coordinates available and find_mast is True
             mast_attributes = {}
             if find_mast and latitude and longitude:
-                nearest_mast = self.arcgis_service.find_nearest_mast(latitude, longitude)
+                if nearest_mast is None:
+                    nearest_mast = self.arcgis_service.find_nearest_mast(latitude, longitude)
                 if nearest_mast:
                     mast_attributes = self.arcgis_service.get_mast_attributes(nearest_mast)
-                    print(f"Found nearest mast: {mast_attributes.get('driftsmerking', 'Unknown')} at {nearest_mast.get('distance', 0):.2f}m")
+                    logger.debug("Found nearest mast: %s at %.2fm", mast_attributes.get('driftsmerking', 'Unknown'), nearest_mast.get('distance', 0))
                 else:
-                    print(f"No nearby mast found for {os.path.basename(image_path)}")
+                    logger.debug("No nearby mast found for %s", filename)
 
             # Upload the image
             upload_result = self.image_service.upload_image(upload_path, file_hash)
             if not upload_result:
-                print(f"Failed to upload {image_path}")
-                return None
+                logger.warning("Failed to upload %s", image_path)
+                return UploadOutcome("failed", file_hash)
 
             image_id = upload_result.get('Id')
             if not image_id:
-                print(f"No ID returned for {image_path}")
-                return None
+                logger.warning("No ID returned for %s", image_path)
+                return UploadOutcome("failed", file_hash)
 
             # Combine base attributes with mast attributes
-            combined_attributes = base_attributes.copy()
-            combined_attributes.update(mast_attributes)
+            combined_attributes = {**base_attributes, **mast_attributes}
 
             # Add GPS coordinates if available
             if latitude and longitude:
@@ -114,11 +164,11 @@ class ToppbefaringUploader:
             update_result = self.image_service.update_image_info(image_id, update_data, self.tenant_name, self.schema_name)
 
             if update_result == "Update failed":
-                print(f"Failed to update attributes for {image_path}")
-                return None
+                logger.warning("Failed to update attributes for %s", image_path)
+                return UploadOutcome("failed", file_hash)
 
             # Log the upload
-            filename = os.path.basename(image_path)
+            now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
             data = [
                 filename, latitude, longitude,
@@ -127,31 +177,30 @@ class ToppbefaringUploader:
                 combined_attributes.get('erhistorisk'), combined_attributes.get('ergroft'),
                 combined_attributes.get('kilde'), combined_attributes.get('nettmelding_elsmart'),
                 combined_attributes.get('erutvendig'), combined_attributes.get('erinnvendig'),
-                file_hash, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "ok"
+                file_hash, now_str, now_str, "ok"
             ]
 
             self.tracker.log_upload(data)
 
-            print(f"Successfully uploaded and updated {filename}")
-            return upload_result
+            logger.debug("Successfully uploaded and updated %s", filename)
+            return UploadOutcome("ok", file_hash, upload_result)
 
         except Exception as e:
-            print(f"Error uploading {image_path}: {str(e)}")
+            logger.error("Error uploading %s: %s", image_path, e)
             # Log failed upload attempt
             try:
-                filename = os.path.basename(image_path)
-                file_hash = self.image_service.calculate_file_hash(image_path, 'md5') if hasattr(self, 'image_service') else 'unknown'
+                if file_hash is None:
+                    file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm) if hasattr(self, 'image_service') else 'unknown'
+                now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 failed_data = [
                     filename, None, None, None, None, None, None, None, None, None, None, None, None,
-                    file_hash, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "failed"
+                    file_hash, now_str, now_str, "failed"
                 ]
                 self.tracker.log_upload(failed_data)
-                print(f"Logged failed upload attempt for {filename}")
+                logger.debug("Logged failed upload attempt for %s", filename)
             except Exception as log_error:
-                print(f"Failed to log upload error: {log_error}")
-            return None
+                logger.error("Failed to log upload error: %s", log_error)
+            return UploadOutcome("failed", file_hash or "unknown")
 
     def upload_from_folder(self, folder_path, base_attributes_template, find_mast=True, resize_options=None):
         """
@@ -169,38 +218,52 @@ class ToppbefaringUploader:
         skipped_count = 0
 
         # Get list of image files first
-        image_files = []
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_files.append(filename)
+        image_files = list(iter_image_files(folder_path))
 
         total_files = len(image_files)
-        print(f"Found {total_files} image files to process")
-
-        for i, filename in enumerate(image_files, 1):
-            image_path = os.path.join(folder_path, filename)
-            print(f"[{i}/{total_files}] Processing {filename}...")
-
-            # Copy attributes template
-            attributes = base_attributes_template.copy()
-
-            # Set filename in attributes
-            attributes['Name'] = filename
+        logger.info("Found %d image files to process in %s", total_files, folder_path)
+
+        # Read GPS for the whole folder up front, and with a local mast index also the nearest masts
+        gps_map = self.find_nearest.get_gps_batch([image_path for _, image_path in image_files], self.max_workers)
+        mast_map = {}
+        if find_mast and self.arcgis_service.mast_index is not None:
+            masts = self.arcgis_service.find_nearest_masts(list(gps_map.values()))
+            mast_map = dict(zip(gps_map.keys(), masts))
+
+        def _process_one(filename, image_path):
+            # Layer the filename over the shared template instead of copying it per file
+            attributes = ChainMap({'Name': filename}, base_attributes_template)
+
+            outcome = self.upload_toppbefaring_image(image_path, attributes, find_mast, resize_options,
+                                                     gps=gps_map.get(image_path), nearest_mast=mast_map.get(image_path),
+                                                     filename=filename)
+            return outcome.status
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(_process_one, filename, image_path): filename for filename, image_path in image_files}
+
+            progress_every = max(1, total_files // PROGRESS_STEPS)
+            for i, future in enumerate(as_completed(futures), 1):
+                filename = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    logger.error("Error processing %s: %s", filename, e)
+                    status = "failed"
 
-            result = self.upload_toppbefaring_image(image_path, attributes, find_mast, resize_options)
-            if result is None:
-                # Check if it was skipped (already uploaded) or failed
-                file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
-                is_uploaded, _, _ = self.tracker.has_been_uploaded(file_hash)
-                if is_uploaded:
+                if status == "ok":
+                    uploaded_count += 1
+                    logger.debug("[%d/%d] %s: Uploaded successfully", i, total_files, filename)
+                elif status == "skipped":
                     skipped_count += 1
-                    print(f"[{i}/{total_files}] {filename}: Skipped (already uploaded)")
+                    logger.debug("[%d/%d] %s: Skipped (already uploaded)", i, total_files, filename)
                 else:
                     failed_count += 1
-                    print(f"[{i}/{total_files}] {filename}: Failed")
-            else:
-                uploaded_count += 1
-                print(f"[{i}/{total_files}] {filename}: Uploaded successfully")
+                    logger.warning("[%d/%d] %s: Failed", i, total_files, filename)
+
+                if i % progress_every == 0 or i == total_files:
+                    logger.info("Progress %d/%d: %d uploaded, %d skipped, %d failed",
+                                i, total_files, uploaded_count, skipped_count, failed_count)
 
         print(f"\nUpload complete:")
         print(f"  Total files: {total_files}")
@@ -221,15 +284,21 @@ class ToppbefaringUploader:
         nearest_mast = self.arcgis_service.find_nearest_mast(latitude, longitude)
 
         if nearest_mast:
-            mast_info = self.arcgis_service.get_mast_attributes(nearest_mast)
-            mast_info['distance'] = nearest_mast.get('distance', 0)
-            mast_info['latitude'] = latitude
-            mast_info['longitude'] = longitude
-            return mast_info
+            return self._build_mast_info(nearest_mast, latitude, longitude)
         else:
             print(f"No nearby mast found for {os.path.basename(image_path)}")
             return None
 
+    def _build_mast_info(self, nearest_mast, latitude, longitude):
+        """
+        Combine mast attributes with the distance and the image's GPS coordinates.
+        """
+        mast_info = self.arcgis_service.get_mast_attributes(nearest_mast)
+        mast_info['distance'] = nearest_mast.get('distance', 0)
+        mast_info['latitude'] = latitude
+        mast_info['longitude'] = longitude
+        return mast_info
+
     def preview_mast_linking(self, folder_path):
         """
         Preview which masts will be linked to images in a folder.
@@ -241,22 +310,28 @@ class ToppbefaringUploader:
         print("Preview of mast linking:")
         print("-" * 50)
 
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_path = os.path.join(folder_path, filename)
-                mast_info = self.get_mast_info_for_image(image_path)
-
-                if mast_info:
-                    print(f"{filename}:")
-                    print(f"  GPS: ({mast_info.get('latitude'):.6f}, {mast_info.get('longitude'):.6f})")
-                    print(f"  Nearest mast: {mast_info.get('driftsmerking', 'Unknown')}")
-                    print(f"  Distance: {mast_info.get('distance', 0):.2f} meters")
-                    print(f"  Mast number: {mast_info.get('mast_nummer', 'N/A')}")
-                    print(f"  Line number: {mast_info.get('linje_nummer', 'N/A')}")
-                    print()
-                else:
-                    print(f"{filename}: No mast found")
-                    print()
+        # Read GPS for all images and look up their nearest masts in one batch
+        image_files = list(iter_image_files(folder_path))
+        gps_map = self.find_nearest.get_gps_batch([image_path for _, image_path in image_files], self.max_workers)
+        nearest_masts = self.arcgis_service.find_nearest_masts([gps_map[image_path] for _, image_path in image_files])
+
+        for (filename, image_path), nearest_mast in zip(image_files, nearest_masts):
+            mast_info = None
+            if nearest_mast:
+                latitude, longitude = gps_map[image_path]
+                mast_info = self._build_mast_info(nearest_mast, latitude, longitude)
+
+            if mast_info:
+                print(f"{filename}:")
+                print(f"  GPS: ({mast_info.get('latitude'):.6f}, {mast_info.get('longitude'):.6f})")
+                print(f"  Nearest mast: {mast_info.get('driftsmerking', 'Unknown')}")
+                print(f"  Distance: {mast_info.get('distance', 0):.2f} meters")
+                print(f"  Mast number: {mast_info.get('mast_nummer', 'N/A')}")
+                print(f"  Line number: {mast_info.get('linje_nummer', 'N/A')}")
+                print()
+            else:
+                print(f"{filename}: No mast found")
+                print()
 
     def get_upload_stats(self):
         """
@@ -270,15 +345,15 @@ class ToppbefaringUploader:
         Get detailed upload statistics including skipped files.
         """
         if os.path.exists(self.tracker.tracking_file):
-            df = pd.read_csv(self.tracker.tracking_file, sep=';', encoding='ansi')
+            df = self.tracker.load_dataframe(['filename', 'status'])
 
             total_entries = len(df)
-            uploaded = len(df[df['status'] == 'ok'])
-            failed = len(df[df['status'] == 'failed'])
+            uploaded = int((df['status'] == 'ok').sum())
+            failed = int((df['status'] == 'failed').sum())
 
             # Group by filename to find duplicates
             filename_counts = df['filename'].value_counts()
-            duplicates = len(filename_counts[filename_counts > 1])
+            duplicates = int((filename_counts > 1).sum())
 
             stats = {
                 'total_entries': total_entries,
@@ -308,69 +383,48 @@ class ToppbefaringUploader:
             'details': []
         }
 
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_path = os.path.join(folder_path, filename)
-                report['total_files'] += 1
+        for filename, image_path in iter_image_files(folder_path):
+            report['total_files'] += 1
 
-                # Calculate file hash
-                file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
-
-                # Check tracking status
-                is_uploaded, upload_time, update_time = self.tracker.has_been_uploaded(file_hash)
-
-                if is_uploaded:
-                    # Check if it was successful or failed
-                    if os.path.exists(self.tracker.tracking_file):
-                        df = pd.read_csv(self.tracker.tracking_file, sep=';', encoding='ansi')
-                        row = df[df['filehash'] == file_hash]
-                        if not row.empty:
-                            status = row.iloc[0]['status']
-                            if status == 'ok':
-                                report['tracked_uploaded'] += 1
-                                status_desc = 'uploaded'
-                            else:
-                                report['tracked_failed'] += 1
-                                status_desc = 'failed'
-                        else:
-                            report['not_tracked'] += 1
-                            status_desc = 'not_tracked'
-                    else:
-                        report['not_tracked'] += 1
-                        status_desc = 'not_tracked'
+            # Calculate file hash
+            file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
+
+            # Check tracking status
+            is_uploaded, upload_time, update_time = self.tracker.has_been_uploaded(file_hash)
+
+            if is_uploaded:
+                # Check if it was successful or failed
+                status = self.tracker.get_upload_status(file_hash)
+                if status == 'ok':
+                    report['tracked_uploaded'] += 1
+                    status_desc = 'uploaded'
                 else:
-                    report['not_tracked'] += 1
-                    status_desc = 'not_tracked'
+                    report['tracked_failed'] += 1
+                    status_desc = 'failed'
+            else:
+                report['not_tracked'] += 1
+                status_desc = 'not_tracked'
 
-                report['details'].append({
-                    'filename': filename,
-                    'filehash': file_hash,
-                    'status': status_desc,
-                    'upload_time': upload_time,
-                    'update_time': update_time
-                })
+            report['details'].append({
+                'filename': filename,
+                'filehash': file_hash,
+                'status': status_desc,
+                'upload_time': upload_time,
+                'update_time': update_time
+            })
 
         return report
 
     def cleanup_duplicate_entries(self):
         """
         Remove duplicate entries from the tracking file, keeping only the most recent entry for each filehash.
+        A SQLite tracking database cannot hold duplicates, so nothing is removed there.
         """
         if not os.path.exists(self.tracker.tracking_file):
             print("No tracking file found")
             return 0
 
-        df = pd.read_csv(self.tracker.tracking_file, sep=';', encoding='ansi')
-
-        # Sort by updatetime descending and drop duplicates based on filehash, keeping the first (most recent)
-        df['updatetime'] = pd.to_datetime(df['updatetime'], errors='coerce')
-        df = df.sort_values('updatetime', ascending=False)
-        df_cleaned = df.drop_duplicates(subset='filehash', keep='first')
-
-        # Save the cleaned dataframe
-        df_cleaned.to_csv(self.tracker.tracking_file, sep=';', index=False, encoding='ansi')
-
-        removed_count = len(df) - len(df_cleaned)
+        removed_count = self.tracker.remove_duplicates()
         print(f"Removed {removed_count} duplicate entries from tracking file")
 
         return removed_count
@@ -394,44 +448,41 @@ class ToppbefaringUploader:
         already_tracked = 0
         errors = 0
 
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_path = os.path.join(folder_path, filename)
-
-                try:
-                    # Calculate file hash
-                    file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
+        for filename, image_path in iter_image_files(folder_path):
+            try:
+                # Calculate file hash
+                file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
 
-                    # Check if already tracked
-                    is_tracked, _, _ = self.tracker.has_been_uploaded(file_hash)
+                # Check if already tracked
+                is_tracked, _, _ = self._has_been_uploaded(image_path, file_hash)
 
-                    if is_tracked:
-                        already_tracked += 1
-                        continue
+                if is_tracked:
+                    already_tracked += 1
+                    continue
 
-                    # Check if image exists in ImageGrid by trying to get its info
-                    # This is a simplified check - you might need to implement a more robust method
-                    # depending on your ImageGrid API capabilities
+                # Check if image exists in ImageGrid by trying to get its info
+                # This is a simplified check - you might need to implement a more robust method
+                # depending on your ImageGrid API capabilities
 
-                    print(f"Found untracked image: {filename} - adding to tracker")
+                print(f"Found untracked image: {filename} - adding to tracker")
 
-                    # Get basic image info
-                    latitude, longitude = self.find_nearest.get_gps_from_image(image_path)
+                # Get basic image info
+                latitude, longitude = self.find_nearest.get_gps_from_image(image_path)
 
-                    # Create a basic tracking entry
-                    data = [
-                        filename, latitude, longitude,
-                        None, None, None, None, None, None, None, None, None, None,
-                        file_hash, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "synced"
-                    ]
+                # Create a basic tracking entry
+                now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                data = [
+                    filename, latitude, longitude,
+                    None, None, None, None, None, None, None, None, None, None,
+                    file_hash, now_str, now_str, "synced"
+                ]
 
-                    self.tracker.log_upload(data)
-                    synced_count += 1
+                self.tracker.log_upload(data)
+                synced_count += 1
 
-                except Exception as e:
-                    print(f"Error syncing {filename}: {str(e)}")
-                    errors += 1
+            except Exception as e:
+                print(f"Error syncing {filename}: {str(e)}")
+                errors += 1
 
         print(f"\nSync completed:")
         print(f"  Already tracked: {already_tracked}")
@@ -442,6 +493,15 @@ class ToppbefaringUploader:
 
 # Example usage
 if __name__ == "__main__":
+    # Per-file details go to a rotating log file; the console only gets progress, warnings and errors
+    file_handler = RotatingFileHandler('toppbefaring_upload.log', maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(threadName)s %(message)s'))
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    logging.basicConfig(level=logging.INFO, handlers=[file_handler, console_handler])
+    logger.setLevel(logging.DEBUG)
+    file_handler.setLevel(logging.DEBUG)
+
     try:
         # Create uploader with credentials from environment variables
         uploader = ToppbefaringUploader()
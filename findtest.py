@@ -5,7 +5,7 @@ from services.imagegrid import ImageGridService
 from services.uploadtracker import ImageUploadTracker
 from services.findnearast import FindNearestService
 from services.arcgis import ArcGISService
-from services.image_processing import ImageProcessingService
+from services.image_processing import ImageProcessingService, iter_image_files
 
 # Load environment variables from .env file
 load_dotenv()
@@ -127,10 +127,7 @@ class ToppbefaringUploader:
         skipped_count = 0
 
         # Get list of image files first
-        image_files = []
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_files.append(filename)
+        image_files = [filename for filename, _ in iter_image_files(folder_path)]
 
         total_files = len(image_files)
         print(f"Found {total_files} image files to process")
@@ -1,31 +1,50 @@
 import os
-from datetime import datetime
+import time
+import threading
+from types import MappingProxyType
 from typing import Optional, Dict, Any, Union, List
 
+# Per-thread cache of the formatted timestamp for the current second
+_now_cache = threading.local()
+
+
 class ImageInfo:
-    def __init__(self):
-        self.default_values = {
-            'Location': None,
-            'Objektnummer': '',
-            'Anleggstype': '',
-            'Anleggstype_n': '',
-            'driftsmerking': '',
-            'erhistorisk': False,
-            'ergroft': '',
-            'kilde': '',
-            'nettmelding_elsmart': '',
-            'erutvendig': 0,
-            'erinnvendig': 0,
-            'filehash': '',
-            'mstasjon': ''
-        }
-        
-        # Standard log columns for CSV tracking
-        self.log_columns = [
-            'filename', 'filepath', 'Location', 'avstand', 'objektnummer', 
-            'linje_navn', 'linje_id', 'driftsmerking', 'erHistorisk', 'kilde', 
-            'anleggstype', 'filehash', 'uploadtime', 'updatetime', 'status'
-        ]
+    # Shared, read-only defaults; every create_*_info builds a new dict from them
+    _DEFAULTS = MappingProxyType({
+        'Location': None,
+        'Objektnummer': '',
+        'Anleggstype': '',
+        'Anleggstype_n': '',
+        'driftsmerking': '',
+        'erhistorisk': False,
+        'ergroft': '',
+        'kilde': '',
+        'nettmelding_elsmart': '',
+        'erutvendig': 0,
+        'erinnvendig': 0,
+        'filehash': '',
+        'mstasjon': ''
+    })
+
+    # Standard log columns for CSV tracking
+    _LOG_COLUMNS = (
+        'filename', 'filepath', 'Location', 'avstand', 'objektnummer',
+        'linje_navn', 'linje_id', 'driftsmerking', 'erHistorisk', 'kilde',
+        'anleggstype', 'filehash', 'uploadtime', 'updatetime', 'status'
+    )
+
+    # Read-only aliases for the previous instance attributes
+    default_values = _DEFAULTS
+    log_columns = _LOG_COLUMNS
+
+    @staticmethod
+    def _now_str() -> str:
+        """Current local time as 'YYYY-MM-DD HH:MM:SS', formatted at most once per second per thread."""
+        second = int(time.time())
+        if getattr(_now_cache, 'second', None) != second:
+            _now_cache.second = second
+            _now_cache.value = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        return _now_cache.value
 
     def create_location(self, latitude: Optional[float], longitude: Optional[float]) -> Optional[Dict[str, Any]]:
         """Create a location dictionary if coordinates are valid."""
@@ -46,9 +65,9 @@ class ImageInfo:
         **kwargs
     ) -> Dict[str, Any]:
         """Create image info for nettstasjon images."""
-        imageinfo = self.default_values.copy()
-        
-        imageinfo.update({
+        # Defaults, then the type-specific values, then any additional kwargs
+        imageinfo = {
+            **self._DEFAULTS,
             'navn': navn,
             'Location': self.create_location(latitude, longitude),
             'objektnummer': objektnummer,
@@ -58,11 +77,9 @@ class ImageInfo:
             'erhistorisk': False,
             'kilde': kilde,
             'filehash': filehash,
-            'mstasjon': mstasjon
-        })
-        
-        # Update with any additional kwargs
-        imageinfo.update(kwargs)
+            'mstasjon': mstasjon,
+            **kwargs
+        }
         
         return imageinfo
 
@@ -80,9 +97,9 @@ class ImageInfo:
         **kwargs
     ) -> Dict[str, Any]:
         """Create image info for toppbefaring images."""
-        imageinfo = self.default_values.copy()
-        
-        imageinfo.update({
+        # Defaults, then the type-specific values, then any additional kwargs
+        imageinfo = {
+            **self._DEFAULTS,
             'filename': filename,
             'Location': self.create_location(latitude, longitude),
             'objektnummer': objektnummer,
@@ -93,11 +110,9 @@ class ImageInfo:
             'kilde': kilde,
             'filehash': filehash,
             'linje_navn': linje_navn,
-            'linje_id': linje_id
-        })
-        
-        # Update with any additional kwargs
-        imageinfo.update(kwargs)
+            'linje_id': linje_id,
+            **kwargs
+        }
         
         return imageinfo
 
@@ -110,18 +125,16 @@ class ImageInfo:
         **kwargs
     ) -> Dict[str, Any]:
         """Create custom image info with specified type."""
-        imageinfo = self.default_values.copy()
-        
-        imageinfo.update({
+        # Defaults, then the type-specific values, then any additional kwargs
+        imageinfo = {
+            **self._DEFAULTS,
             'filename': filename,
             'anleggstype': anleggstype,
             'anleggstype_n': anleggstype,
             'kilde': kilde,
-            'filehash': filehash
-        })
-        
-        # Update with any additional kwargs
-        imageinfo.update(kwargs)
+            'filehash': filehash,
+            **kwargs
+        }
         
         return imageinfo
 
@@ -132,24 +145,26 @@ class ImageInfo:
         status: str = 'ok',
         avstand: Optional[float] = None,
         linje_navn: str = '',
-        linje_id: str = ''
+        linje_id: str = '',
+        now_str: Optional[str] = None
     ) -> List[Any]:
         """Create standardized log data from imageinfo dictionary."""
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_time = now_str or self._now_str()
+        get = imageinfo.get
         
         return [
-            imageinfo.get('filename', ''),
+            get('filename', ''),
             filepath,
-            imageinfo.get('Location', ''),
+            get('Location', ''),
             avstand or '',
-            imageinfo.get('objektnummer', ''),
+            get('objektnummer', ''),
             linje_navn,
             linje_id,
-            imageinfo.get('driftsmerking', ''),
-            imageinfo.get('erHistorisk', ''),
-            imageinfo.get('kilde', ''),
-            imageinfo.get('anleggstype', ''),
-            imageinfo.get('filehash', ''),
+            get('driftsmerking', ''),
+            get('erHistorisk', ''),
+            get('kilde', ''),
+            get('anleggstype', ''),
+            get('filehash', ''),
             current_time,  # uploadtime
             current_time,  # updatetime
             status
@@ -159,7 +174,8 @@ class ImageInfo:
         self,
         imageinfo: Dict[str, Any],
         filepath: str,
-        status: str = 'ok'
+        status: str = 'ok',
+        now_str: Optional[str] = None
     ) -> List[Any]:
         """Create log data specifically for nettstasjon images."""
         return self.create_log_data(
@@ -168,7 +184,8 @@ class ImageInfo:
             status=status,
             avstand=None,  # No distance calculation for nettstasjon
             linje_navn='',  # No line info for nettstasjon
-            linje_id=''
+            linje_id='',
+            now_str=now_str
         )
 
     def create_toppbefaring_log_data(
@@ -176,7 +193,8 @@ class ImageInfo:
         imageinfo: Dict[str, Any],
         filepath: str,
         status: str = 'ok',
-        avstand: Optional[float] = None
+        avstand: Optional[float] = None,
+        now_str: Optional[str] = None
     ) -> List[Any]:
         """Create log data specifically for toppbefaring images."""
         return self.create_log_data(
@@ -185,7 +203,8 @@ class ImageInfo:
             status=status,
             avstand=avstand,
             linje_navn=imageinfo.get('linje_navn', ''),
-            linje_id=imageinfo.get('linje_id', '')
+            linje_id=imageinfo.get('linje_id', ''),
+            now_str=now_str
         )
 
     def create_failed_log_data(
@@ -193,11 +212,12 @@ class ImageInfo:
         filepath: str,
         filehash: str = 'unknown',
         kilde: str = '',
-        anleggstype: str = ''
+        anleggstype: str = '',
+        now_str: Optional[str] = None
     ) -> List[Any]:
         """Create log data for failed uploads."""
         filename = os.path.basename(filepath)
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_time = now_str or self._now_str()
         
         return [
             filename,      # filename
@@ -219,4 +239,4 @@ class ImageInfo:
 
     def get_log_headers(self) -> List[str]:
         """Get the standard CSV headers for logging."""
-        return self.log_columns.copy()
+        return list(self._LOG_COLUMNS)
@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from typing import Optional, Any
+
+
+@dataclass
+class UploadOutcome:
+    """Result of a single image upload attempt.
+
+    status is one of 'ok', 'skipped' or 'failed'. file_hash is the hash computed
+    for the image so callers never have to rehash it to classify the outcome.
+    """
+    status: str
+    file_hash: Optional[str] = None
+    result: Any = None
@@ -1,74 +1,135 @@
-from PIL import Image
+import numpy as np
 import piexif
 
-def get_decimal_from_dms(dms, ref):
+from services.exif_reader import read_gps_ifd
+
+# Vekter for grader, minutter og sekunder ved omregning til desimalgrader
+DMS_WEIGHTS = np.array([1.0, 1.0 / 60.0, 1.0 / 3600.0])
+
+# GPS-tagger slått opp én gang, i stedet for attributtoppslag på piexif.GPSIFD per bilde
+_LAT, _LON, _LAT_REF, _LON_REF = (
+    piexif.GPSIFD.GPSLatitude,
+    piexif.GPSIFD.GPSLongitude,
+    piexif.GPSIFD.GPSLatitudeRef,
+    piexif.GPSIFD.GPSLongitudeRef,
+)
+
+
+def _normalize_dms(dms):
         """
-        Konverterer DMS (Degrees, Minutes, Seconds) til desimalgrader.
-        ref er 'N' eller 'S' for latitude, 'E' eller 'W' for longitude.
+        Normaliserer DMS til en (grader, minutter, sekunder)-tuple med floats.
 
         Håndterer forskjellige EXIF-formater:
         - Standard format: ((degrees, scale), (minutes, scale), (seconds, scale))
-        - Raw format: ((deg, scale), (min, scale), (sec, scale)) - som bruker ser
-        - Simple format: (degrees, minutes, seconds) som tuples
+        - Simple format: (degrees, minutes, seconds) som tall
+        Returnerer None for ukjente formater.
+        """
+        if not isinstance(dms, tuple) or len(dms) != 3:
+            return None
+        if isinstance(dms[0], tuple):
+            # Rasjonale tall: (teller, nevner)
+            return (dms[0][0] / dms[0][1], dms[1][0] / dms[1][1], dms[2][0] / dms[2][1])
+        return (float(dms[0]), float(dms[1]), float(dms[2]))
+
+
+def _normalize_ref(ref):
+        """
+        Gjør om en EXIF-referanse (b'N', 'S\\x00' osv.) til en enkel streng.
+        """
+        if isinstance(ref, bytes):
+            ref = ref.decode('ascii', errors='ignore')
+        return ref.strip('\x00 ')
+
+
+def dms_to_decimal(dms_triple, ref):
+        """
+        Regner om en normalisert (grader, minutter, sekunder)-tuple til desimalgrader.
+        ref er 'N' eller 'S' for latitude, 'E' eller 'W' for longitude.
+        """
+        decimal = dms_triple[0] + dms_triple[1] / 60.0 + dms_triple[2] / 3600.0
+        return -decimal if ref in ('S', 'W') else decimal
+
+
+def get_decimal_from_dms(dms, ref):
+        """
+        Konverterer DMS (Degrees, Minutes, Seconds) til desimalgrader.
+        ref er 'N' eller 'S' for latitude, 'E' eller 'W' for longitude.
         """
         try:
-            if isinstance(dms, tuple) and len(dms) == 3:
-                # Handle standard EXIF format: ((deg, scale), (min, scale), (sec, scale))
-                if all(isinstance(coord, tuple) and len(coord) == 2 for coord in dms):
-                    degrees = dms[0][0] / dms[0][1]
-                    minutes = dms[1][0] / dms[1][1] / 60.0
-                    seconds = dms[2][0] / dms[2][1] / 3600.0
-                    print(f"Konverterer standard EXIF format: {dms} -> {degrees}° + {minutes}' + {seconds}\" = {degrees + minutes + seconds}")
-                else:
-                    # Raw format: (degrees, minutes, seconds) as simple values
-                    degrees = float(dms[0])
-                    minutes = float(dms[1]) / 60.0
-                    seconds = float(dms[2]) / 3600.0
-                    print(f"Konverterer raw format: {dms} -> {degrees}° + {minutes}' + {seconds}\" = {degrees + minutes + seconds}")
-            else:
-                # Fallback for unexpected formats
+            triple = _normalize_dms(dms)
+            if triple is None:
                 print(f"Uventet DMS format: {dms}, type: {type(dms)}")
                 return 0.0
-
-            decimal = degrees + minutes + seconds
-            if ref in ['S', 'W']:
-                decimal = -decimal
-            return decimal
+            return dms_to_decimal(triple, _normalize_ref(ref))
 
         except (IndexError, TypeError, ZeroDivisionError, ValueError) as e:
             print(f"Feil ved DMS-konvertering: {e}, DMS: {dms}, ref: {ref}")
             return 0.0
-        
-        
-image_path = 'T:\\Linjebefaring2014\\Netteier_SFE\\Befaring_1656\\befaringsbilder\\_SF6_7858.JPG'
-image_path = 'T:\\Linjebefaring2014\\Netteier_SFE\\Befaring_1656\\befaringsbilder\\_SF6_7837.JPG'
-
-print(f"Lest bilde: {image_path}")
-
-image = Image.open(image_path)
-
-    
-if 'exif' in image.info:
-        exif_dict = piexif.load(image.info['exif'])
-        if 'GPS' in exif_dict and exif_dict['GPS']:
-            gps = exif_dict['GPS']
-            print(f"gps keys: {gps.keys()}")
-            if piexif.GPSIFD.GPSLatitude in gps and piexif.GPSIFD.GPSLongitude in gps:
-                lat = gps[piexif.GPSIFD.GPSLatitude]
-                lon = gps[piexif.GPSIFD.GPSLongitude]
-                lat_ref = gps.get(piexif.GPSIFD.GPSLatitudeRef, b'N').decode()
-                lon_ref = gps.get(piexif.GPSIFD.GPSLongitudeRef, b'E').decode()
-                
-                lat = get_decimal_from_dms(lat, lat_ref)
-                lon = get_decimal_from_dms(lon, lon_ref)
-                
-                if lat_ref == 'S':
-                    lat = -lat
-                if lon_ref == 'W':
-                    lon = -lon
-                
-                print("GPS from EXIF (piexif):")
-                print(f"Latitude: {lat}")
-                print(f"Longitude: {lon}")
-                print("\n" + "=" * 50)
-                
+
+
+def _load_gps(path):
+        """
+        Returnerer GPS-taggene for bildet. Leser bare GPS-IFD-en fra Exif-segmentet når
+        det lar seg tolke, og lar piexif lese hele filen ellers (f.eks. TIFF).
+        """
+        gps = read_gps_ifd(path)
+        if gps is not None:
+            return gps
+        return piexif.load(path).get('GPS') or {}
+
+
+def decode_many(paths):
+        """
+        Leser GPS-posisjon fra mange bilder uten å åpne dem med PIL.
+        Kun Exif-segmentet i starten av filen leses, og DMS-omregningen gjøres samlet med NumPy.
+
+        Returnerer dict path -> (latitude, longitude), med (None, None) der GPS mangler.
+        """
+        results = {}
+        found = []
+        triples = []
+        refs = []
+
+        for path in paths:
+            results[path] = (None, None)
+            try:
+                gps = _load_gps(path)
+                lat = _normalize_dms(gps.get(_LAT))
+                lon = _normalize_dms(gps.get(_LON))
+            except Exception as e:
+                print(f"Feil ved EXIF-lesing for {path}: {e}")
+                continue
+            if lat is None or lon is None:
+                continue
+
+            found.append(path)
+            triples.extend((lat, lon))
+            refs.extend((
+                _normalize_ref(gps.get(_LAT_REF, b'N')),
+                _normalize_ref(gps.get(_LON_REF, b'E')),
+            ))
+
+        if not found:
+            return results
+
+        # Rad 2k er latitude og rad 2k+1 longitude for bilde k
+        decimals = np.asarray(triples, dtype=float) @ DMS_WEIGHTS
+        decimals *= np.where(np.isin(refs, ('S', 'W')), -1.0, 1.0)
+        for k, path in enumerate(found):
+            results[path] = (float(decimals[2 * k]), float(decimals[2 * k + 1]))
+
+        return results
+
+
+if __name__ == "__main__":
+    image_path = 'T:\\Linjebefaring2014\\Netteier_SFE\\Befaring_1656\\befaringsbilder\\_SF6_7858.JPG'
+    image_path = 'T:\\Linjebefaring2014\\Netteier_SFE\\Befaring_1656\\befaringsbilder\\_SF6_7837.JPG'
+
+    print(f"Lest bilde: {image_path}")
+
+    lat, lon = decode_many([image_path])[image_path]
+    if lat is not None and lon is not None:
+        print("GPS from EXIF (piexif):")
+        print(f"Latitude: {lat}")
+        print(f"Longitude: {lon}")
+        print("\n" + "=" * 50)
@@ -1,42 +1,82 @@
 from pathlib import Path
+import os
+import sys
+import functools
 import unicodedata
 import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    _CopyFileExW = ctypes.WinDLL('kernel32', use_last_error=True).CopyFileExW
+    _CopyFileExW.argtypes = (wintypes.LPCWSTR, wintypes.LPCWSTR, ctypes.c_void_p,
+                             ctypes.c_void_p, ctypes.c_void_p, wintypes.DWORD)
+    _CopyFileExW.restype = wintypes.BOOL
+else:
+    _CopyFileExW = None
+
+# Antall filer som kopieres samtidig; nettverksdisker (SMB) tåler mange parallelle forespørsler
+COPY_MAX_WORKERS = int(os.getenv('COPY_MAX_WORKERS', '16'))
 
 ALLOWED = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_. ()")
 
+# ASCII-tegn som ikke er tillatt (inkl. kontrolltegn) byttes med '_' i ett translate-kall;
+# alt utenfor ASCII er heller ikke tillatt og tas av én regex etterpå
+_TRANSLATE_TABLE = str.maketrans({c: '_' for c in set(map(chr, range(128))) - ALLOWED})
+_NONASCII_RE = re.compile(r'[^\x00-\x7f]')
+_UNDERSCORES_RE = re.compile(r'_+')
+
+# Ren funksjon av navnet; mange mapper har de samme filnavnene (IMG_0001.JPG osv.)
+@functools.lru_cache(maxsize=65536)
 def sanitize_name(name: str) -> str:
     n = unicodedata.normalize("NFKC", name)
 
-    out = []
-    for ch in n:
-        cat = unicodedata.category(ch)
-        if ch in ALLOWED and cat[0] != 'C':
-            out.append(ch)
-        else:
-            out.append('_')
-    safe = ''.join(out)
+    safe = n.translate(_TRANSLATE_TABLE)
+    safe = _NONASCII_RE.sub('_', safe)
 
-    safe = re.sub(r'_+', '_', safe).strip()
+    safe = _UNDERSCORES_RE.sub('_', safe).strip()
     safe = safe.rstrip(' .')
 
     return safe or "unnamed"
 
-def copy_and_rename_tree(src: Path, dst: Path):
-    for p in src.rglob('*'):
-        rel = p.relative_to(src)  # beholder mappestruktur
-        new_name = sanitize_name(p.name)
-        new_rel = rel.with_name(new_name)
-        target = dst / new_rel
+def _copy_file(src, dst):
+    """
+    Kopierer én fil og bevarer tidsstempler. På Windows brukes CopyFileExW, som
+    kopierer i kjernen og lar SMB3-servere gjøre kopien på serversiden.
+    Ellers brukes shutil.copy2 (som selv bruker copy_file_range/sendfile på Linux).
+    """
+    if _CopyFileExW is not None:
+        if _CopyFileExW(src, dst, None, None, None, 0):
+            return
+        raise ctypes.WinError(ctypes.get_last_error())
+    shutil.copy2(src, dst)
+
+def copy_and_rename_tree(src: Path, dst: Path, max_workers: int = COPY_MAX_WORKERS):
+    # Sanert målmappe for hver kildemappe; undermapper legges til før os.walk går inn i dem
+    target_dirs = {os.fspath(src): os.fspath(dst)}
+    pairs = []
+
+    for dirpath, dirnames, filenames in os.walk(src):  # beholder mappestruktur
+        target_dir = target_dirs.pop(dirpath)
+        # Målmappen lages én gang per kildemappe, ikke per fil
+        os.makedirs(target_dir, exist_ok=True)
+
+        for dirname in dirnames:
+            target_dirs[os.path.join(dirpath, dirname)] = os.path.join(target_dir, sanitize_name(dirname))
+
+        for filename in filenames:
+            pairs.append((os.path.join(dirpath, filename), os.path.join(target_dir, sanitize_name(filename))))
 
-        if p.is_dir():
-            target.mkdir(parents=True, exist_ok=True)
-        else:
-            target.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(p, target)  # bevarer metadata (tidspunkter osv.)
+    # Alle mapper finnes nå; kopier filene parallelt (GIL slippes under I/O)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda pair: _copy_file(*pair), pairs))  # bevarer metadata (tidspunkter osv.)
 
 # Bruk:
-copy_and_rename_tree(
-    Path(r"T:\Linjebefaring2019\Romvesen-Eid-2708-2019\SFE Nett AS - Toppbefaring 2019\Dag 13 - Kjølsdalen mot Midthjell og rest Eid og Stårheim"),
-    Path(r"T:\Linjebefaring2019\Romvesen-Eid-2708-2019\SFE Nett AS - Toppbefaring 2019\Dag 13 - Kjølsdalen mot Midthjell og rest Eid og Stårheim_renamed")
-)
+if __name__ == "__main__":
+    copy_and_rename_tree(
+        Path(r"T:\Linjebefaring2019\Romvesen-Eid-2708-2019\SFE Nett AS - Toppbefaring 2019\Dag 13 - Kjølsdalen mot Midthjell og rest Eid og Stårheim"),
+        Path(r"T:\Linjebefaring2019\Romvesen-Eid-2708-2019\SFE Nett AS - Toppbefaring 2019\Dag 13 - Kjølsdalen mot Midthjell og rest Eid og Stårheim_renamed")
+    )
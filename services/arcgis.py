@@ -1,10 +1,30 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import logging
 from haversine import haversine, Unit
 import os
-from datetime import datetime, timedelta
+import math
+import time
+import hashlib
+import threading
+import sqlite3
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from datetime import datetime
 from dotenv import load_dotenv
 from pyproj import Transformer
+# Optional R-tree for the local mast index (pip install rtree); a UTM grid is used without it
+try:
+    from rtree import index as rtree_index
+except ImportError:
+    rtree_index = None
+
+from services.cache import get_cache_dir, file_lock, read_json, write_json_atomic, SQLiteCache
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -12,8 +32,139 @@ load_dotenv()
 # Note: This service handles coordinate transformation between WGS84 (GPS) and UTM Zone 33N (ArcGIS layer)
 # The ArcGIS layer uses ETRS89 / UTM zone 33N (EPSG:25833) coordinate system
 
+# Side length (meters) of the grid cells used by the local mast index
+MAST_INDEX_CELL_SIZE = 100
+
+# A cached token is only reused while it has at least this many seconds left
+TOKEN_MIN_REMAINING = 120
+
+# Number of grid-binned near-point query results kept in memory
+NEAR_POINT_CACHE_SIZE = 4096
+
+# Max number of IDs per "ID IN (...)" query, to stay within URL and server parsing limits
+MAST_ID_BATCH_SIZE = 500
+
+# Number of nettstasjon lookups (by driftsmerking) kept in memory
+NETTSTASJON_CACHE_SIZE = 8192
+
+# Number of UTM -> GPS transforms kept in memory (one per mast position, reused by every image of that mast)
+UTM_TRANSFORM_CACHE_SIZE = 8192
+
+# Mast lookups (by ID and near-point queries) are also stored on disk so a rerun over the same
+# folder does not query ArcGIS again; entries older than this many days are fetched again
+DISK_CACHE_TTL_DAYS = 7
+
+# Marks a key that is not in the disk cache (None is a valid cached value)
+_MISSING = object()
+
+
+def _nearest_feature(easting, northing, features):
+    """
+    Return (index, distance) of the feature closest to the UTM point, or (None, None)
+    when no feature has a point geometry. Distances are computed in one vectorized pass.
+    """
+    indices = []
+    xs = []
+    ys = []
+    for i, feature in enumerate(features):
+        geometry = feature.get('geometry')
+        if geometry and 'x' in geometry and 'y' in geometry:
+            indices.append(i)
+            xs.append(geometry['x'])
+            ys.append(geometry['y'])
+    if not indices:
+        return None, None
+
+    distances = np.hypot(easting - np.asarray(xs, dtype=float), northing - np.asarray(ys, dtype=float))
+    best = int(distances.argmin())
+    return indices[best], float(distances[best])
+
+
+class MastIndex:
+    """
+    In-memory spatial index over mast features: an R-tree when the rtree package is installed,
+    otherwise a regular UTM grid. Answers nearest-mast lookups locally instead of one ArcGIS
+    query per image. Mast coordinates are also kept as numpy arrays (xs, ys).
+    """
+
+    def __init__(self, features, cell_size=MAST_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.features = []
+        self._cells = {}
+        xs = []
+        ys = []
+
+        for feature in features:
+            geometry = feature.get('geometry')
+            if not geometry or 'x' not in geometry or 'y' not in geometry:
+                continue
+            x, y = geometry['x'], geometry['y']
+            xs.append(x)
+            ys.append(y)
+            self.features.append(feature)
+
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+
+        self._rtree = None
+        if rtree_index is not None and self.features:
+            # Bulk load is much faster than inserting one point at a time
+            self._rtree = rtree_index.Index((i, (x, y, x, y), None) for i, (x, y) in enumerate(zip(xs, ys)))
+        else:
+            for i, (x, y) in enumerate(zip(xs, ys)):
+                key = (math.floor(x / cell_size), math.floor(y / cell_size))
+                self._cells.setdefault(key, []).append((x, y, i))
+
+    def __len__(self):
+        return len(self.features)
+
+    def nearest(self, easting, northing, max_distance=100):
+        """
+        Return (feature, distance) for the closest mast within max_distance meters, or (None, None).
+        """
+        if self._rtree is not None:
+            best_index = next(iter(self._rtree.nearest((easting, northing, easting, northing), 1)), None)
+            if best_index is None:
+                return None, None
+            best_distance = math.hypot(easting - self.xs[best_index], northing - self.ys[best_index])
+            if best_distance > max_distance:
+                return None, None
+            return self.features[best_index], float(best_distance)
+
+        cx = math.floor(easting / self.cell_size)
+        cy = math.floor(northing / self.cell_size)
+        reach = math.ceil(max_distance / self.cell_size)
+
+        best_index = None
+        best_distance = float('inf')
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                for x, y, index in self._cells.get((gx, gy), ()):
+                    distance = math.hypot(easting - x, northing - y)
+                    if distance < best_distance:
+                        best_distance = distance
+                        best_index = index
+
+        if best_index is None or best_distance > max_distance:
+            return None, None
+        return self.features[best_index], best_distance
+
+
 class ArcGISService:
-    def __init__(self, base_url=None, token_url=None, username=None, password=None):
+    # Coordinate transformers built once from explicit PROJ pipelines, so creating a service
+    # skips the CRS database lookup and pipeline search of Transformer.from_crs.
+    # Both take and return (x, y) = (longitude, latitude) like from_crs(..., always_xy=True),
+    # and are safe to share between threads.
+    # WGS84 (EPSG:4326) to UTM Zone 33N (EPSG:32633)
+    _WGS84_TO_UTM33 = Transformer.from_pipeline(
+        "+proj=pipeline +step +proj=unitconvert +xy_in=deg +xy_out=rad +step +proj=utm +zone=33 +ellps=WGS84"
+    )
+    # UTM Zone 33N (EPSG:32633) to WGS84 (EPSG:4326)
+    _UTM33_TO_WGS84 = Transformer.from_pipeline(
+        "+proj=pipeline +step +inv +proj=utm +zone=33 +ellps=WGS84 +step +proj=unitconvert +xy_in=rad +xy_out=deg"
+    )
+
+    def __init__(self, base_url=None, token_url=None, username=None, password=None, preload_masts=None):
         # Use environment variables if not provided
         self.base_url = base_url or os.getenv('ARCGIS_BASE_URL', "https://map.linja.no/arcgis/rest/services/Volue/iAMViewer3/MapServer/5")
         self.token_url = token_url or os.getenv('ARCGIS_TOKEN_URL', "https://map.linja.no/arcgis/tokens/generateToken")
@@ -23,13 +174,46 @@ class ArcGISService:
 
         self.access_token = None
         self.token_refresh_time = None
+        # Serializes token refresh between threads (the cache file lock covers other processes)
+        self._token_lock = threading.Lock()
         self.query_url = f"{self.base_url}/query"
 
-        # Initialize coordinate transformers
-        # WGS84 (EPSG:4326) to UTM Zone 33N (EPSG:32633)
-        self.wgs84_to_utm = Transformer.from_crs("EPSG:4326", "EPSG:32633", always_xy=True)
-        # UTM Zone 33N (EPSG:32633) to WGS84 (EPSG:4326)
-        self.utm_to_wgs84 = Transformer.from_crs("EPSG:32633", "EPSG:4326", always_xy=True)
+        # One keep-alive session so the TLS connection to the map server is reused between queries
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Near-point queries are snapped to a grid and cached per instance, so images taken
+        # a few meters apart reuse one ArcGIS response
+        self._query_masts_near_bin = functools.lru_cache(maxsize=NEAR_POINT_CACHE_SIZE)(self._query_masts_near_bin_uncached)
+        # Lookups by ID/driftsmerking repeat a lot within a session; cache successful responses
+        self._find_nettstasjon_cached = functools.lru_cache(maxsize=NETTSTASJON_CACHE_SIZE)(self._find_nettstasjon_uncached)
+        # A mast's position never changes, so its transformed coordinates are cached per (easting, northing)
+        self._utm_to_gps_cached = functools.lru_cache(maxsize=UTM_TRANSFORM_CACHE_SIZE)(self._transform_utm_to_gps_uncached)
+        # Mast features by str(ID), None for IDs known not to exist
+        self._mast_by_id_cache = {}
+        # On-disk store for the two mast caches above (ARCGIS_DISK_CACHE=false turns it off)
+        self.disk_cache = None
+        if os.getenv('ARCGIS_DISK_CACHE', 'true').lower() in ('1', 'true', 'yes'):
+            ttl_days = float(os.getenv('ARCGIS_DISK_CACHE_TTL_DAYS', DISK_CACHE_TTL_DAYS))
+            try:
+                self.disk_cache = SQLiteCache(self._disk_cache_path(), ttl=ttl_days * 24 * 3600)
+            except sqlite3.Error as e:
+                logger.warning("Could not open ArcGIS disk cache: %s", e)
+
+        # Coordinate transformers (shared class-level instances)
+        self.wgs84_to_utm = self._WGS84_TO_UTM33
+        self.utm_to_wgs84 = self._UTM33_TO_WGS84
+
+        # Optional local index over all masts (ARCGIS_PRELOAD_MASTS=true), so nearest-mast
+        # lookups are answered in memory instead of one spatial query per image
+        if preload_masts is None:
+            preload_masts = os.getenv('ARCGIS_PRELOAD_MASTS', 'false').lower() in ('1', 'true', 'yes')
+        self.mast_index = None
+        if preload_masts:
+            self.load_mast_index()
 
     def transform_gps_to_utm(self, latitude, longitude):
         """
@@ -49,23 +233,89 @@ class ArcGISService:
             print(f"Error transforming GPS to UTM: {e}")
             return None, None
         
+    def transform_gps_to_utm_batch(self, latitudes, longitudes):
+        """
+        Transform many GPS coordinates (WGS84) to UTM Zone 33N in a single PROJ call.
+
+        Args:
+            latitudes (array-like): Latitudes in degrees
+            longitudes (array-like): Longitudes in degrees
+
+        Returns:
+            tuple: (eastings, northings) as numpy arrays in meters
+        """
+        eastings, northings = self.wgs84_to_utm.transform(
+            np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float)
+        )
+        return eastings, northings
+
     def get_mast_by_id(self, mast_id):
         """
-        Retrieve mast data by its ID.
+        Retrieve mast data by its ID. Results are cached per service instance.
 
         Args:
             mast_id (int): The ID of the mast to retrieve.
 
         Returns:
-            dict: Mast feature data or None if not found.
+            dict: Mast feature data or None if not found (shared with the cache, do not modify).
         """
-        where_clause = f"ID = {mast_id}"
-        features = self.get_mast_data(where_clause=where_clause, out_fields="*", return_geometry=True)
-        if features:
-            return features[0]  # Return the first matching feature
-        else:
+        feature = self.get_masts_by_ids([mast_id]).get(mast_id)
+        if feature is None:
             print(f"No mast found with ID {mast_id}")
-            return None
+        return feature
+
+    def get_masts_by_ids(self, mast_ids):
+        """
+        Retrieve many masts by ID, with one "ID IN (...)" query per MAST_ID_BATCH_SIZE IDs
+        that are not already cached.
+
+        Args:
+            mast_ids (iterable): Mast IDs (int or numeric str)
+
+        Returns:
+            dict: Requested ID (as passed in) -> mast feature, for the masts that were found
+                  (features are shared with the cache, do not modify)
+        """
+        mast_ids = list(mast_ids)
+        # Uncached numeric IDs, deduplicated in request order
+        missing = list(dict.fromkeys(
+            key for key in (str(mast_id).strip() for mast_id in mast_ids)
+            if key.isdigit() and key not in self._mast_by_id_cache
+        ))
+
+        if self.disk_cache is not None and missing:
+            still_missing = []
+            for key in missing:
+                feature = self.disk_cache.get(f"mast_id:{key}", _MISSING)
+                if feature is _MISSING:
+                    still_missing.append(key)
+                else:
+                    self._mast_by_id_cache[key] = feature
+            missing = still_missing
+
+        for start in range(0, len(missing), MAST_ID_BATCH_SIZE):
+            chunk = missing[start:start + MAST_ID_BATCH_SIZE]
+            try:
+                features = self._query_mast_layer(where_clause=f"ID IN ({','.join(chunk)})", out_fields="*", return_geometry=True)
+            except Exception as e:
+                print(f"Error querying ArcGIS: {e}")
+                continue
+
+            found = {}
+            for feature in features:
+                found.setdefault(str(feature.get('attributes', {}).get('ID')), feature)
+            for key in chunk:
+                # None marks IDs that the layer does not have
+                self._mast_by_id_cache[key] = found.get(key)
+            if self.disk_cache is not None:
+                self.disk_cache.set_many((f"mast_id:{key}", found.get(key)) for key in chunk)
+
+        results = {}
+        for mast_id in mast_ids:
+            feature = self._mast_by_id_cache.get(str(mast_id).strip())
+            if feature is not None:
+                results[mast_id] = feature
+        return results
 
     def transform_utm_to_gps(self, easting, northing):
         """
@@ -79,51 +329,116 @@ class ArcGISService:
             tuple: (latitude, longitude) in degrees
         """
         try:
-            longitude, latitude = self.utm_to_wgs84.transform(easting, northing)
-            return latitude, longitude
+            return self._utm_to_gps_cached(easting, northing)
         except Exception as e:
+            # Failures are not cached
             print(f"Error transforming UTM to GPS: {e}")
             return None, None
 
-    def get_access_token(self):
+    def _transform_utm_to_gps_uncached(self, easting, northing):
         """
-        Get ArcGIS access token, refreshing if necessary.
+        Transform without the cache. Raises on invalid input.
         """
-        # If token is valid, return it
-        if self.access_token and self.token_refresh_time and self.token_refresh_time > datetime.now():
-            return self.access_token
+        longitude, latitude = self.utm_to_wgs84.transform(easting, northing)
+        return latitude, longitude
 
-        # Validate required credentials
-        if not all([self.username, self.password, self.token_url]):
-            raise ValueError("Missing ArcGIS credentials. Please set ARCGIS_USERNAME, ARCGIS_PASSWORD, and ARCGIS_TOKEN_URL in your .env file.")
+    def transform_utm_to_gps_batch(self, eastings, northings):
+        """
+        Transform many UTM Zone 33N coordinates to GPS (WGS84) in a single PROJ call.
 
-        try:
-            # Request new token
-            data = {
-                'username': self.username,
-                'password': self.password,
-                'client': 'requestip',
-                'requestip': self.request_ip,
-                'expiration': 60,  # Token valid for 60 minutes
-                'f': 'json'
-            }
+        Args:
+            eastings (array-like): Eastings in meters
+            northings (array-like): Northings in meters
 
-            response = requests.post(self.token_url, data=data)
-            response.raise_for_status()
+        Returns:
+            tuple: (latitudes, longitudes) as numpy arrays in degrees
+        """
+        longitudes, latitudes = self.utm_to_wgs84.transform(
+            np.asarray(eastings, dtype=float), np.asarray(northings, dtype=float)
+        )
+        return latitudes, longitudes
 
-            token_data = response.json()
+    def _token_cache_path(self):
+        """
+        Path of the token cache file shared by all processes using the same account and token URL.
+        """
+        key = hashlib.sha1(f"{self.username}|{self.token_url}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(get_cache_dir(), f"arcgis_token_{key}.json")
 
-            if 'token' in token_data:
-                self.access_token = token_data['token']
-                # Set refresh time to 50 minutes from now (10 minutes before expiration)
-                self.token_refresh_time = datetime.now() + timedelta(minutes=50)
+    def _disk_cache_path(self):
+        """
+        Path of the on-disk mast cache, one file per mast layer.
+        """
+        key = hashlib.sha1(self.base_url.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(get_cache_dir(), f"arcgis_cache_{key}.sqlite")
+
+    def _load_cached_token(self, cache_path):
+        """
+        Use the token from the cache file if it is still valid long enough.
+        """
+        cached = read_json(cache_path)
+        if cached and cached.get('token') and cached.get('expires_at', 0) - time.time() > TOKEN_MIN_REMAINING:
+            self.access_token = cached['token']
+            self.token_refresh_time = datetime.fromtimestamp(cached['expires_at'] - TOKEN_MIN_REMAINING)
+            return True
+        return False
+
+    def get_access_token(self, force_refresh=False):
+        """
+        Get ArcGIS access token, refreshing if necessary.
+        The token is shared with other processes through a cache file, so only one
+        of them requests a new token when it expires.
+        """
+        with self._token_lock:
+            # If token is valid, return it
+            if not force_refresh and self.access_token and self.token_refresh_time and self.token_refresh_time > datetime.now():
                 return self.access_token
-            else:
-                error_msg = token_data.get('error', {}).get('message', 'Unknown error')
-                raise Exception(f"Failed to get ArcGIS token: {error_msg}")
 
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Failed to authenticate with ArcGIS: {e}")
+            # Validate required credentials
+            if not all([self.username, self.password, self.token_url]):
+                raise ValueError("Missing ArcGIS credentials. Please set ARCGIS_USERNAME, ARCGIS_PASSWORD, and ARCGIS_TOKEN_URL in your .env file.")
+
+            cache_path = self._token_cache_path()
+            if not force_refresh and self._load_cached_token(cache_path):
+                return self.access_token
+
+            # Only one process requests a new token; the others pick it up from the cache
+            with file_lock(cache_path):
+                if not force_refresh and self._load_cached_token(cache_path):
+                    return self.access_token
+
+                try:
+                    # Request new token
+                    data = {
+                        'username': self.username,
+                        'password': self.password,
+                        'client': 'requestip',
+                        'requestip': self.request_ip,
+                        'expiration': 60,  # Token valid for 60 minutes
+                        'f': 'json'
+                    }
+
+                    response = self.session.post(self.token_url, data=data)
+                    response.raise_for_status()
+
+                    token_data = response.json()
+
+                    if 'token' in token_data:
+                        self.access_token = token_data['token']
+                        # ArcGIS returns the expiry in epoch milliseconds; fall back to the requested 60 minutes
+                        expires_at = token_data['expires'] / 1000 if token_data.get('expires') else time.time() + 60 * 60
+                        self.token_refresh_time = datetime.fromtimestamp(expires_at - TOKEN_MIN_REMAINING)
+                        try:
+                            write_json_atomic(cache_path, {'token': self.access_token, 'expires_at': expires_at})
+                        except OSError as e:
+                            print(f"Could not write ArcGIS token cache {cache_path}: {e}")
+                        return self.access_token
+                    else:
+                        error_msg = token_data.get('error', {}).get('message', 'Unknown error')
+                        raise Exception(f"Failed to get ArcGIS token: {error_msg}")
+
+                except requests.exceptions.RequestException as e:
+                    raise Exception(f"Failed to authenticate with ArcGIS: {e}")
 
     def _make_authenticated_request(self, url, params=None):
         """
@@ -136,56 +451,72 @@ class ArcGISService:
             params = {}
         params['token'] = token
         
-        print(url, params)
+        logger.debug("ArcGIS request: %s %s", url, params)
 
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
             # If token is invalid, try refreshing once
-            if response.status_code == 498:  # Invalid token
-                self.access_token = None  # Force token refresh
-                token = self.get_access_token()
+            if e.response is not None and e.response.status_code == 498:  # Invalid token
+                token = self.get_access_token(force_refresh=True)
                 params['token'] = token
-                response = requests.get(url, params=params)
+                response = self.session.get(url, params=params)
                 response.raise_for_status()
                 return response.json()
             else:
                 raise Exception(f"ArcGIS API request failed: {e}")
 
     def find_nettstasjon(self, driftsmerking):
-        
+        """
+        Look up a nettstasjon by driftsmerking. Successful lookups are cached per service instance.
+
+        Returns:
+            dict: The first matching feature (shared with the cache, do not modify), or [] if none was found
+        """
+        try:
+            return self._find_nettstasjon_cached(driftsmerking)
+        except Exception as e:
+            print(f"Error querying ArcGIS: {e}")
+            return []
+
+    def _find_nettstasjon_uncached(self, driftsmerking):
+        """
+        Query the nettstasjon layer. Raises on errors so failures are not cached.
+        """
         params = {
             'where': f"DRIFTSMERKING='{driftsmerking}'",
             'outFields': "*",
             'f': 'json'
         }
 
-        try:
-            nsurl = 'https://map.linja.no/arcgis/rest/services/Volue/iAMViewer3/MapServer/1/query'
-            data = self._make_authenticated_request(nsurl, params)
+        nsurl = 'https://map.linja.no/arcgis/rest/services/Volue/iAMViewer3/MapServer/1/query'
+        data = self._make_authenticated_request(nsurl, params)
 
-            #print(data)
+        #print(data)
 
-            if 'features' in data:
-                ns_attributes = data['features'][0]
-                
-                
-                #print(ns_attributes)
-                return ns_attributes
-            else:
-                print(f"No features found. Response:")
-                return []
-        except Exception as e:
-            print(f"Error querying ArcGIS: {e}")
+        if 'features' not in data:
+            raise Exception(f"No features found. Response: {data}")
+        if not data['features']:
+            print(f"No features found. Response:")
             return []
+        return data['features'][0]
 
-            
     def get_mast_data(self, where_clause="1=1", out_fields="*", return_geometry=True):
         """
         Query the ArcGIS mast layer to get mast data.
         """
+        try:
+            return self._query_mast_layer(where_clause, out_fields, return_geometry)
+        except Exception as e:
+            print(f"Error querying ArcGIS: {e}")
+            return []
+
+    def _query_mast_layer(self, where_clause="1=1", out_fields="*", return_geometry=True):
+        """
+        Query the ArcGIS mast layer. Raises when the response has no features list.
+        """
         params = {
             'where': where_clause,
             'outFields': out_fields,
@@ -193,23 +524,81 @@ class ArcGISService:
             'f': 'json'
         }
 
-        try:
-            data = self._make_authenticated_request(self.query_url, params)
+        data = self._make_authenticated_request(self.query_url, params)
 
-            if 'features' in data:
-                return data['features']
-            else:
-                print(f"No features found. Response: {data}")
+        if 'features' not in data:
+            raise Exception(f"No features found. Response: {data}")
+        return data['features']
+
+    def get_all_mast_data(self, page_size=1000):
+        """
+        Fetch every mast feature from the layer, paging past the server's record limit.
+
+        Returns:
+            list: All mast features (empty list on error)
+        """
+        features = []
+        offset = 0
+
+        while True:
+            params = {
+                'where': '1=1',
+                'outFields': '*',
+                'returnGeometry': True,
+                'resultOffset': offset,
+                'resultRecordCount': page_size,
+                'f': 'json'
+            }
+
+            try:
+                data = self._make_authenticated_request(self.query_url, params)
+            except Exception as e:
+                logger.error("Error fetching masts from ArcGIS (offset %s): %s", offset, e)
                 return []
 
-        except Exception as e:
-            print(f"Error querying ArcGIS: {e}")
-            return []
+            if 'error' in data:
+                logger.error("ArcGIS returned an error for the mast download (offset %s): %s", offset, data['error'])
+                return []
+
+            page = data.get('features', [])
+            features.extend(page)
+
+            if not page or not data.get('exceededTransferLimit'):
+                break
+            offset += len(page)
+
+        return features
+
+    def load_mast_index(self):
+        """
+        Download all masts once and build the local nearest-mast index.
+
+        Returns:
+            MastIndex: The loaded index, or None if no masts could be downloaded; lookups then
+                       keep querying ArcGIS near each point instead of using an empty index
+        """
+        # The full layer is kept in the disk cache too, so later runs skip the paged download
+        features = self.disk_cache.get("all_masts") if self.disk_cache is not None else None
+        if not features:
+            features = self.get_all_mast_data()
+            if not features:
+                logger.warning("No masts downloaded from ArcGIS; falling back to near-point queries")
+                self.mast_index = None
+                return None
+            if self.disk_cache is not None:
+                self.disk_cache.set("all_masts", features)
+        self.mast_index = MastIndex(features)
+        print(f"Loaded {len(self.mast_index)} masts into local index")
+        return self.mast_index
 
     def get_mast_data_near_point(self, easting, northing, distance=50, spatial_ref="25833"):
         """
         Query the ArcGIS mast layer for masts near a specific UTM point.
 
+        The point is snapped to a grid with cell size = distance and the layer is queried
+        around the cell center with a radius that covers the whole cell, so nearby points
+        share one cached response. Results are then filtered against the true point.
+
         Args:
             easting (float): UTM easting coordinate
             northing (float): UTM northing coordinate
@@ -217,8 +606,39 @@ class ArcGISService:
             spatial_ref (str): Spatial reference system (default: 25833 for ETRS89/UTM33N)
 
         Returns:
-            list: List of mast features within the search distance
+            list: List of mast features within the search distance (shared with the cache, do not modify)
+        """
+        cell = distance if distance > 0 else 1
+        easting_bin = round(easting / cell) * cell
+        northing_bin = round(northing / cell) * cell
+        # Any point in the cell is at most cell * sqrt(2) / 2 from its center
+        radius = distance + cell * math.sqrt(2) / 2
+
+        try:
+            features = self._query_masts_near_bin(easting_bin, northing_bin, radius, spatial_ref)
+        except Exception as e:
+            print(f"Error querying ArcGIS near point: {e}")
+            return []
+
+        nearby = []
+        for feature in features:
+            geometry = feature.get('geometry')
+            if geometry and 'x' in geometry and 'y' in geometry and \
+               math.hypot(easting - geometry['x'], northing - geometry['y']) <= distance:
+                nearby.append(feature)
+        return nearby
+
+    def _query_masts_near_bin_uncached(self, easting, northing, distance, spatial_ref):
+        """
+        Run the spatial query around a grid cell center. Raises on errors so failures are not cached.
+        Responses are read from and stored in the disk cache when it is enabled.
         """
+        disk_key = f"near:{easting:.2f}:{northing:.2f}:{distance:.2f}:{spatial_ref}"
+        if self.disk_cache is not None:
+            cached = self.disk_cache.get(disk_key)
+            if cached is not None:
+                return tuple(cached)
+
         # Create geometry point in UTM coordinates
         geometry = f"{{\"x\":{easting:.2f},\"y\":{northing:.2f}}}"
 
@@ -247,18 +667,13 @@ class ArcGISService:
             'f': 'json'
         }
 
-        try:
-            data = self._make_authenticated_request(self.query_url, params)
+        data = self._make_authenticated_request(self.query_url, params)
 
-            if 'features' in data:
-                return data['features']
-            else:
-                print(f"No features found near point ({easting:.2f}, {northing:.2f}). Response: {data}")
-                return []
-
-        except Exception as e:
-            print(f"Error querying ArcGIS near point: {e}")
-            return []
+        if 'features' not in data:
+            raise Exception(f"No features found near point ({easting:.2f}, {northing:.2f}). Response: {data}")
+        if self.disk_cache is not None:
+            self.disk_cache.set(disk_key, data['features'])
+        return tuple(data['features'])
 
     def find_nearest_mast(self, latitude, longitude, max_distance=100):
         """
@@ -288,6 +703,22 @@ class ArcGISService:
 
         #print(f"GPS coordinates ({latitude:.6f}, {longitude:.6f}) -> UTM ({target_easting:.2f}, {target_northing:.2f})")
 
+        return self._find_nearest_mast_utm(target_easting, target_northing, max_distance)
+
+    def _find_nearest_mast_utm(self, target_easting, target_northing, max_distance=100):
+        """
+        Find the nearest mast to a UTM Zone 33N point, from the local index when loaded,
+        otherwise with an ArcGIS spatial query.
+        """
+        # Answer from the local index when it has been loaded
+        if self.mast_index is not None:
+            mast, distance = self.mast_index.nearest(target_easting, target_northing, max_distance)
+            if mast is None:
+                print(f"No masts found within {max_distance}m of GPS coordinates")
+                return None
+            # Copy so the shared indexed feature is not modified
+            return dict(mast, distance=distance)
+
         # Query ArcGIS for masts within the search distance
         nearby_masts = self.get_mast_data_near_point(target_easting, target_northing, max_distance)
 
@@ -299,27 +730,13 @@ class ArcGISService:
         else:
             print(f"Found {len(nearby_masts)} masts within {max_distance}m of GPS coordinates")
 
-        # Find the closest mast among the results
-        nearest_mast = None
-        min_distance = float('inf')
-
-        for mast in nearby_masts:
-            geometry = mast.get('geometry')
-            if geometry and 'x' in geometry and 'y' in geometry:
-                mast_easting = geometry['x']
-                mast_northing = geometry['y']
-
-                # Calculate Euclidean distance in UTM coordinates (meters)
-                distance = ((target_easting - mast_easting) ** 2 + (target_northing - mast_northing) ** 2) ** 0.5
-
-                #print(f"Mast ID {mast['attributes'].get('ID')} at UTM ({mast_easting:.2f}, {mast_northing:.2f}) is {distance:.2f}m away")
-
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_mast = mast
+        # Find the closest mast among the results (Euclidean distance in UTM meters)
+        index, min_distance = _nearest_feature(target_easting, target_northing, nearby_masts)
+        nearest_mast = nearby_masts[index] if index is not None else None
 
         if nearest_mast:
-            nearest_mast['distance'] = min_distance
+            # Copy so the cached query result is not modified
+            nearest_mast = dict(nearest_mast, distance=min_distance)
             mast_attrs = self.get_mast_attributes(nearest_mast)
             #print(f"Found nearest mast: {mast_attrs.get('driftsmerking', 'Unknown')} at {min_distance:.2f}m")
             return nearest_mast
@@ -327,6 +744,49 @@ class ArcGISService:
             print(f"No valid mast found within {max_distance}m of GPS coordinates")
             return None
 
+    def find_nearest_masts(self, coords, max_distance=100, max_workers=8):
+        """
+        Find the nearest mast for many GPS coordinates at once.
+
+        Args:
+            coords (list): List of (latitude, longitude) tuples; entries may be (None, None)
+            max_distance (float): Maximum search distance in meters
+            max_workers (int): Parallel ArcGIS queries when the local mast index is not loaded
+
+        Returns:
+            list: Nearest mast feature (with distance) or None, in the same order as coords
+        """
+        valid = [i for i, (latitude, longitude) in enumerate(coords) if latitude and longitude]
+        results = [None] * len(coords)
+        if not valid:
+            return results
+
+        # Transform all points in one call
+        eastings, northings = self.transform_gps_to_utm_batch(
+            [coords[i][0] for i in valid], [coords[i][1] for i in valid]
+        )
+
+        points = [
+            (i, float(easting), float(northing))
+            for i, easting, northing in zip(valid, eastings, northings)
+            if np.isfinite(easting) and np.isfinite(northing)
+        ]
+
+        def _lookup(point):
+            return self._find_nearest_mast_utm(point[1], point[2], max_distance)
+
+        if self.mast_index is not None:
+            masts = map(_lookup, points)
+        else:
+            # Without a local index each lookup is a separate ArcGIS query; overlap them
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                masts = list(executor.map(_lookup, points))
+
+        for (i, _, _), mast in zip(points, masts):
+            results[i] = mast
+
+        return results
+
     def get_mast_attributes(self, mast_feature):
         """
         Extract relevant attributes from a mast feature for toppbefaring.
@@ -395,6 +855,29 @@ class ArcGISService:
 
         return None, None
 
+    def get_mast_gps_coordinates_batch(self, mast_features):
+        """
+        Get GPS coordinates (WGS84) for many mast features with one batched transform.
+
+        Returns:
+            list: (latitude, longitude) per feature, (None, None) where geometry is missing
+        """
+        results = [(None, None)] * len(mast_features)
+        valid = [
+            i for i, feature in enumerate(mast_features)
+            if feature and feature.get('geometry') and 'x' in feature['geometry'] and 'y' in feature['geometry']
+        ]
+        if not valid:
+            return results
+
+        latitudes, longitudes = self.transform_utm_to_gps_batch(
+            [mast_features[i]['geometry']['x'] for i in valid],
+            [mast_features[i]['geometry']['y'] for i in valid]
+        )
+        for i, latitude, longitude in zip(valid, latitudes, longitudes):
+            results[i] = (float(latitude), float(longitude))
+        return results
+
 # Example usage
 if __name__ == "__main__":
     try:
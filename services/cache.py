@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+
+def get_cache_dir():
+    """
+    Returnerer (og oppretter) katalogen for lokale cache-filer som deles mellom prosesser.
+    Kan overstyres med UPLOAD_IMAGEGRID_CACHE_DIR.
+    """
+    cache_dir = os.getenv('UPLOAD_IMAGEGRID_CACHE_DIR')
+    if not cache_dir:
+        if sys.platform == 'win32':
+            base = os.getenv('LOCALAPPDATA') or os.path.expanduser('~')
+        else:
+            base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(base, 'upload_imagegrid')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Eksklusiv lås mellom prosesser via en egen .lock-fil ved siden av path.
+    """
+    with open(f"{path}.lock", 'a+b') as lock_file:
+        if sys.platform == 'win32':
+            lock_file.seek(0)
+            # LK_LOCK gir opp etter ~10 sekunder; prøv igjen til låsen er vår
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def read_json(path):
+    """
+    Leser en JSON-cachefil. Returnerer None hvis filen mangler eller er ugyldig.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomic(path, data):
+    """
+    Skriver JSON til en midlertidig fil og bytter den inn med os.replace,
+    så andre prosesser aldri leser en halvskrevet fil. Filen er kun lesbar for eieren.
+    """
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class SQLiteCache:
+    """
+    Nøkkel/verdi-cache i en SQLite-fil, så oppslag overlever mellom kjøringer og deles mellom
+    prosesser. Verdiene lagres som JSON. Med ttl (sekunder) regnes eldre verdier som manglende.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        # Én tilkobling deles av trådene, serialisert med låsen
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)")
+
+    def get(self, key, default=None):
+        """
+        Returnerer verdien for key, eller default hvis den mangler eller er for gammel.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        Lagrer value (må kunne skrives som JSON) under key.
+        """
+        data = json.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)", (key, data, time.time())
+            )
+
+    def set_many(self, items):
+        """
+        Lagrer mange (key, value)-par i én transaksjon.
+        """
+        now = time.time()
+        rows = [(key, json.dumps(value), now) for key, value in items]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,131 @@
+import struct
+
+# APP1 (Exif) ligger nesten alltid i starten av JPEG-filen
+EXIF_SCAN_SIZE = 64 * 1024
+
+# TIFF-tagg i IFD0 som peker til GPS-IFD-en
+GPS_IFD_POINTER = 0x8825
+
+# GPS-taggene vi leser: 1/3 = GPSLatitudeRef/GPSLongitudeRef, 2/4 = GPSLatitude/GPSLongitude
+GPS_TAGS = (1, 2, 3, 4)
+
+# TIFF-felttyper som brukes av GPS-taggene
+_TYPE_ASCII = 2
+_TYPE_RATIONAL = 5
+_TYPE_SRATIONAL = 10
+
+
+def read_exif_segment(path):
+    """
+    Leser Exif-segmentet (APP1) direkte fra JPEG-filen uten å lese resten av bildet.
+    Går gjennom markørene fra SOI til Exif-segmentet er funnet. Store segmenter foran
+    Exif (f.eks. ICC-profiler eller forhåndsvisninger) hoppes over med seek i stedet for å leses.
+
+    Returnerer segmentet fra b'Exif\x00\x00' og ut (kan gis rett til piexif.load),
+    b'' hvis JPEG-filen ikke har Exif, eller None hvis filen ikke er en JPEG
+    eller markørene ikke kunne leses.
+    """
+    with open(path, 'rb') as f:
+        data = f.read(EXIF_SCAN_SIZE)
+        if data[:2] != b'\xff\xd8':
+            return None
+
+        pos = 2
+        while True:
+            if pos + 4 > len(data):
+                # Markøren ligger etter det som er lest: hopp dit og les en ny blokk
+                f.seek(pos - len(data), 1)
+                data = f.read(EXIF_SCAN_SIZE)
+                pos = 0
+                if len(data) < 4:
+                    return None
+            if data[pos] != 0xFF:
+                return None
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                # Fyllbyte foran markøren
+                pos += 1
+                continue
+            if marker in (0xD9, 0xDA):
+                # EOI/SOS: ingen flere metadata-segmenter, bildet har ikke Exif
+                return b''
+            (length,) = struct.unpack_from('>H', data, pos + 2)
+            end = pos + 2 + length
+            if marker == 0xE1 and data[pos + 4:pos + 10] == b'Exif\x00\x00':
+                if end > len(data):
+                    # Segmentet er større enn det som er lest; les resten
+                    data += f.read(end - len(data))
+                return data[pos + 4:end]
+            pos = end
+
+
+def read_gps_ifd(path):
+    """
+    Leser kun GPS-taggene 1-4 fra Exif-segmentet med struct, uten å bygge opp hele
+    EXIF-strukturen (MakerNote o.l. hoppes over).
+
+    Returnerer en dict i samme form som piexif.load(...)['GPS'] for disse taggene
+    ({} hvis bildet ikke har GPS), eller None hvis filen ikke kunne tolkes.
+    """
+    segment = read_exif_segment(path)
+    if segment is None:
+        return None
+    if segment == b'':
+        return {}
+
+    try:
+        return _parse_gps_ifd(memoryview(segment)[6:])
+    except (struct.error, IndexError, ValueError):
+        return None
+
+
+def _parse_gps_ifd(tiff):
+    """
+    Finner GPS-IFD-en via IFD0 i en TIFF-blokk og dekoder taggene i GPS_TAGS.
+    """
+    byte_order = bytes(tiff[:2])
+    if byte_order == b'II':
+        endian = '<'
+    elif byte_order == b'MM':
+        endian = '>'
+    else:
+        raise ValueError(f"Ukjent byte-rekkefølge i TIFF-header: {byte_order!r}")
+
+    magic, ifd0_offset = struct.unpack_from(endian + 'HI', tiff, 2)
+    if magic != 42:
+        raise ValueError(f"Ugyldig TIFF-header: {magic}")
+
+    gps_offset = None
+    for tag, field_type, count, value_offset in _iter_ifd(tiff, endian, ifd0_offset):
+        if tag == GPS_IFD_POINTER:
+            gps_offset = struct.unpack_from(endian + 'I', tiff, value_offset)[0]
+            break
+    if gps_offset is None:
+        return {}
+
+    gps = {}
+    for tag, field_type, count, value_offset in _iter_ifd(tiff, endian, gps_offset):
+        if tag not in GPS_TAGS:
+            continue
+        if field_type == _TYPE_ASCII:
+            if count > 4:
+                value_offset = struct.unpack_from(endian + 'I', tiff, value_offset)[0]
+            gps[tag] = bytes(tiff[value_offset:value_offset + count]).rstrip(b'\x00')
+        elif field_type in (_TYPE_RATIONAL, _TYPE_SRATIONAL):
+            # Rasjonale tall ligger alltid utenfor oppføringen (8 byte per verdi)
+            data_offset = struct.unpack_from(endian + 'I', tiff, value_offset)[0]
+            fmt = endian + ('i' if field_type == _TYPE_SRATIONAL else 'I') * (2 * count)
+            values = struct.unpack_from(fmt, tiff, data_offset)
+            gps[tag] = tuple(zip(values[::2], values[1::2]))
+    return gps
+
+
+def _iter_ifd(tiff, endian, offset):
+    """
+    Gir (tag, type, count, offset til verdifeltet) for hver oppføring i IFD-en ved offset.
+    """
+    (entries,) = struct.unpack_from(endian + 'H', tiff, offset)
+    for i in range(entries):
+        entry = offset + 2 + 12 * i
+        tag, field_type, count = struct.unpack_from(endian + 'HHI', tiff, entry)
+        yield tag, field_type, count, entry + 8
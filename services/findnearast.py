@@ -1,11 +1,186 @@
-from haversine import haversine, Unit
+import functools
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import piexif
+import numpy as np
 import pandas as pd
 
+from services.exif_reader import read_gps_ifd
+
+# Valgfri JIT-kompilering av avstandsløkken (pip install numba)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+logger = logging.getLogger(__name__)
+
+# GPS-tagger slått opp én gang per modul
+_LAT, _LON, _LAT_REF, _LON_REF = (
+    piexif.GPSIFD.GPSLatitude,
+    piexif.GPSIFD.GPSLongitude,
+    piexif.GPSIFD.GPSLatitudeRef,
+    piexif.GPSIFD.GPSLongitudeRef,
+)
+
+def validate_coordinates_vec(lats, lons):
+    """
+    Vektorisert utgave av FindNearestService.validate_coordinates for arrays av koordinater.
+    Returnerer en bool-array; NaN gir False.
+    """
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
+    return ((lats >= -90) & (lats <= 90) & (lons >= -180) & (lons <= 180)
+            & ((np.abs(lats) >= 0.0001) | (np.abs(lons) >= 0.0001)))
+
+
+def dms_to_decimal_vec(dms, negative):
+    """
+    Vektorisert utgave av FindNearestService.get_decimal_from_dms for mange koordinater.
+    dms er en (N, 3, 2)-array med (teller, nevner) for grader, minutter og sekunder,
+    negative er en bool-array som er True for 'S'/'W'. Null i nevneren gir inf/NaN,
+    som validate_coordinates_vec forkaster.
+    """
+    dms = np.asarray(dms, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        parts = dms[:, :, 0] / dms[:, :, 1]
+    degrees = parts[:, 0] + parts[:, 1] / 60.0 + parts[:, 2] / 3600.0
+    return np.where(negative, -degrees, degrees)
+
+
+def _rational_pairs(dms):
+    """
+    Gjør en DMS-verdi om til tre (teller, nevner)-par. Godtar piexif-tupler,
+    Pillows IFDRational og enkle tall.
+    """
+    pairs = []
+    for value in dms:
+        if isinstance(value, tuple):
+            numerator, denominator = value
+            pairs.append((numerator, denominator))
+        elif hasattr(value, 'numerator'):
+            pairs.append((value.numerator, value.denominator))
+        else:
+            pairs.append((float(value), 1))
+    if len(pairs) != 3:
+        raise ValueError(f"Forventet tre DMS-verdier, fikk {len(pairs)}")
+    return pairs
+
+
+def _decode_ref(value):
+    """
+    Gjør om en GPS-referanse (b'N', 'S' osv.) til en streng.
+    """
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+# Samme jordradius som haversine-pakken bruker (middelradius), i meter
+EARTH_RADIUS_M = 6371008.8
+
+# Antall bilder med GPS-resultat (nøkkel: sti, mtime, størrelse) som holdes i minnet
+GPS_CACHE_SIZE = 4096
+
+
+def _haversine_np(phi0, lam0, cos_phi0, phis, lams, cos_phis):
+    """
+    Haversine-avstand i meter fra punktet (phi0, lam0) til alle punktene i phis/lams (numpy-arrays).
+    Alle vinkler er i radianer, og cos(latitude) er forhåndsberegnet for begge sider.
+    """
+    a = np.sin((phis - phi0) * 0.5) ** 2 + cos_phi0 * cos_phis * np.sin((lams - lam0) * 0.5) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _nearest_haversine_loop(phi0, lam0, cos_phi0, phis, lams, cos_phis):
+    """
+    Returnerer (indeks, avstand i meter) for punktet i phis/lams nærmest (phi0, lam0), i radianer.
+    Én løkke uten mellomliggende arrays; brukes JIT-kompilert når numba er installert.
+    """
+    best_i = -1
+    best_a = 2.0
+    for i in range(phis.shape[0]):
+        s_phi = math.sin((phis[i] - phi0) * 0.5)
+        s_lam = math.sin((lams[i] - lam0) * 0.5)
+        a = s_phi * s_phi + cos_phi0 * cos_phis[i] * s_lam * s_lam
+        # Avstanden øker monotont med a, så minste a gir nærmeste punkt
+        if a < best_a:
+            best_a = a
+            best_i = i
+    if best_i < 0:
+        return -1, math.inf
+    return best_i, 2.0 * EARTH_RADIUS_M * math.asin(math.sqrt(min(best_a, 1.0)))
+
+
+if njit is not None:
+    _nearest_haversine = njit(cache=True, fastmath=True)(_nearest_haversine_loop)
+else:
+    _nearest_haversine = None
+
+
+class _LatitudeIndex:
+    """
+    Radene i en DataFrame sortert på latitude. Et oppslag regner bare avstand for radene
+    i latitude-båndet som kan ligge innenfor max_distance, i stedet for hele tabellen.
+
+    Koordinatene lagres én gang i radianer, sammen med cos(latitude), så et oppslag bare
+    regner om bildets egne koordinater. Arrayene er sammenhengende float32: halvparten så
+    mye minne å lese per oppslag, og under en meter avrundingsfeil, godt innenfor terskelen på 50 m.
+    """
+
+    def __init__(self, df):
+        lats = df['latitude'].to_numpy(np.float32)
+        lons = df['longitude'].to_numpy(np.float32)
+        # Rader uten gyldige koordinater (NaN, utenfor gyldig område, 0,0) tas ikke med i indeksen
+        positions = np.flatnonzero(validate_coordinates_vec(lats, lons))
+        order = np.argsort(lats[positions], kind='stable')
+        self.positions = positions[order]
+        self.phis = np.ascontiguousarray(np.radians(lats[self.positions]))
+        self.lams = np.ascontiguousarray(np.radians(lons[self.positions]))
+        self.cos_phis = np.cos(self.phis)
+
+    def nearest(self, lat, lon, max_distance):
+        """
+        Returnerer (posisjon i DataFrame, avstand i meter) for nærmeste rad innenfor max_distance,
+        eller (None, None).
+        """
+        phi0 = math.radians(lat)
+        lam0 = math.radians(lon)
+        band = max_distance / EARTH_RADIUS_M
+        lo = np.searchsorted(self.phis, phi0 - band, side='left')
+        hi = np.searchsorted(self.phis, phi0 + band, side='right')
+        if lo == hi:
+            return None, None
+
+        phis, lams, cos_phis = self.phis[lo:hi], self.lams[lo:hi], self.cos_phis[lo:hi]
+        if _nearest_haversine is not None:
+            best, distance = _nearest_haversine(phi0, lam0, math.cos(phi0), phis, lams, cos_phis)
+        else:
+            # float32-skalarer, så regnestykket holder seg i float32 i stedet for å oppgraderes
+            distances = _haversine_np(np.float32(phi0), np.float32(lam0), np.float32(math.cos(phi0)), phis, lams, cos_phis)
+            best = int(distances.argmin())
+            distance = distances[best]
+        if distance > max_distance:
+            return None, None
+        return int(self.positions[lo + best]), float(distance)
+
+
 class FindNearestService:
-    def __init__(self):
-        pass
+    def __init__(self, df=None):
+        self._df = None
+        self._index = None
+        self._gps_from_image_cached = functools.lru_cache(maxsize=GPS_CACHE_SIZE)(self._gps_from_image_uncached)
+        if df is not None:
+            self.set_dataframe(df)
+
+    def set_dataframe(self, df):
+        """
+        Setter DataFrame (med kolonnene latitude og longitude) som find_nearest søker i,
+        og bygger oppslagsindeksen. Må kalles på nytt hvis DataFrame endres på stedet.
+        """
+        self._df = df
+        self._index = _LatitudeIndex(df)
 
     def validate_coordinates(self, lat, lon):
         """
@@ -40,16 +215,16 @@ class FindNearestService:
                     degrees = dms[0][0] / dms[0][1]
                     minutes = dms[1][0] / dms[1][1] / 60.0
                     seconds = dms[2][0] / dms[2][1] / 3600.0
-                    print(f"Konverterer standard EXIF format: {dms} -> {degrees}° + {minutes}' + {seconds}\" = {degrees + minutes + seconds}")
+                    logger.debug("Konverterer standard EXIF format: %s -> %s° + %s' + %s\" = %s", dms, degrees, minutes, seconds, degrees + minutes + seconds)
                 else:
                     # Raw format: (degrees, minutes, seconds) as simple values
                     degrees = float(dms[0])
                     minutes = float(dms[1]) / 60.0
                     seconds = float(dms[2]) / 3600.0
-                    print(f"Konverterer raw format: {dms} -> {degrees}° + {minutes}' + {seconds}\" = {degrees + minutes + seconds}")
+                    logger.debug("Konverterer raw format: %s -> %s° + %s' + %s\" = %s", dms, degrees, minutes, seconds, degrees + minutes + seconds)
             else:
                 # Fallback for unexpected formats
-                print(f"Uventet DMS format: {dms}, type: {type(dms)}")
+                logger.warning("Uventet DMS format: %s, type: %s", dms, type(dms))
                 return 0.0
 
             decimal = degrees + minutes + seconds
@@ -58,70 +233,84 @@ class FindNearestService:
             return decimal
 
         except (IndexError, TypeError, ZeroDivisionError, ValueError) as e:
-            print(f"Feil ved DMS-konvertering: {e}, DMS: {dms}, ref: {ref}")
+            logger.warning("Feil ved DMS-konvertering: %s, DMS: %s, ref: %s", e, dms, ref)
             return 0.0
 
     def get_gps_from_image(self, image_path):
         """
         Leser GPS-informasjon (latitude og longitude) fra EXIF-dataene til et bilde.
+        Resultatet huskes per (sti, mtime, størrelse), så samme uendrede fil bare leses én gang.
         """
         try:
-            image = Image.open(image_path)
+            st = os.stat(image_path)
+            return self._gps_from_image_cached(image_path, st.st_mtime_ns, st.st_size)
+        except OSError as e:
+            # Lesefeil caches ikke, så et nytt forsøk leser filen på nytt
+            logger.warning("Feil ved EXIF-lesing for %s: %s", image_path, e)
+            return None, None
 
-            
-            
-            # Check if image has EXIF data
-            if 'exif' not in image.info:
-                print(f"Ingen EXIF-data funnet i bildet: {image_path}")
-                return None, None
+    def _gps_from_image_uncached(self, image_path, mtime_ns, size):
+        """
+        Leser GPS fra filen. mtime_ns og size er bare med i cache-nøkkelen.
+        Kaster OSError ved lesefeil.
+        """
+        fast_result = self._fast_read_gps(image_path)
+        if fast_result is not None:
+            return fast_result
+
+        try:
+            with Image.open(image_path) as image:
+                # Check if image has EXIF data
+                if 'exif' not in image.info:
+                    logger.debug("Ingen EXIF-data funnet i bildet: %s", image_path)
+                    return None, None
+
+                # Load EXIF data
+                exif_data = piexif.load(image.info['exif'])
+        except OSError:
+            raise
+        except Exception as e:
+            logger.warning("Feil ved EXIF-lesing for %s: %s", image_path, e)
+            return None, None
 
-            # Load EXIF data
-            exif_data = piexif.load(image.info['exif'])
+        return self.get_gps_from_exif(exif_data, image_path)
 
+    def _fast_read_gps(self, image_path):
+        """
+        Leser GPS direkte fra Exif-segmentet med struct, uten PIL og uten å tolke resten av EXIF.
+        Returnerer (latitude, longitude) / (None, None), eller None hvis filen ikke kunne
+        tolkes slik og piexif må brukes. Kaster OSError ved lesefeil.
+        """
+        gps_data = read_gps_ifd(image_path)
+        if gps_data is None:
+            return None
+        return self.get_gps_from_exif({'GPS': gps_data}, image_path)
+
+    def get_gps_from_exif(self, exif_data, image_path):
+        """
+        Henter GPS-informasjon (latitude og longitude) fra EXIF-data som allerede er lest med piexif.load.
+        image_path brukes bare i meldinger.
+        """
+        try:
             # Check if GPS data exists
             gps_data = exif_data.get('GPS')
             
             if not gps_data:
-                print(f"Ingen GPS-data funnet i EXIF for bildet: {image_path}")
+                logger.debug("Ingen GPS-data funnet i EXIF for bildet: %s", image_path)
                 return None, None
 
-            # Debug: Print GPS data structure
-            print(f"GPS data for {image_path}: {gps_data}")
-
-            # Check if required GPS fields exist and handle different formats
-            gps_latitude = None
-            gps_longitude = None
-            gps_latitude_ref = 'N'
-            gps_longitude_ref = 'E'
-
-            # Try standard EXIF GPS tags first
-            if piexif.GPSIFD.GPSLatitude in gps_data:
-                gps_latitude = gps_data[piexif.GPSIFD.GPSLatitude]
-            if piexif.GPSIFD.GPSLongitude in gps_data:
-                gps_longitude = gps_data[piexif.GPSIFD.GPSLongitude]
-
-            # Try reference directions
-            if piexif.GPSIFD.GPSLatitudeRef in gps_data:
-                gps_latitude_ref = gps_data[piexif.GPSIFD.GPSLatitudeRef].decode()
-            if piexif.GPSIFD.GPSLongitudeRef in gps_data:
-                gps_longitude_ref = gps_data[piexif.GPSIFD.GPSLongitudeRef].decode()
-
-            # If standard tags don't work, try raw GPS data (keys 2 and 4)
-            if gps_latitude is None and 2 in gps_data:
-                gps_latitude = gps_data[2]
-                print(f"Bruker raw GPS latitude data: {gps_latitude}")
-            if gps_longitude is None and 4 in gps_data:
-                gps_longitude = gps_data[4]
-                print(f"Bruker raw GPS longitude data: {gps_longitude}")
-
-            # Try to get reference directions from raw data if available
-            if 1 in gps_data:  # GPSLatitudeRef
-                gps_latitude_ref = gps_data[1].decode() if isinstance(gps_data[1], bytes) else str(gps_data[1])
-            if 3 in gps_data:  # GPSLongitudeRef
-                gps_longitude_ref = gps_data[3].decode() if isinstance(gps_data[3], bytes) else str(gps_data[3])
+            if logger.isEnabledFor(logging.DEBUG):
+                # Hele GPS-IFD-en kan være stor; ikke formater den med mindre debug er på
+                logger.debug("GPS data for %s: %s", image_path, gps_data)
+
+            # piexif.GPSIFD-konstantene er de samme som de rå GPS-nøklene (1-4), så ett oppslag holder
+            gps_latitude = gps_data.get(_LAT)
+            gps_longitude = gps_data.get(_LON)
+            gps_latitude_ref = _decode_ref(gps_data.get(_LAT_REF, b'N'))
+            gps_longitude_ref = _decode_ref(gps_data.get(_LON_REF, b'E'))
 
             if gps_latitude is None or gps_longitude is None:
-                print(f"GPS koordinater mangler i EXIF for bildet: {image_path}")
+                logger.debug("GPS koordinater mangler i EXIF for bildet: %s", image_path)
                 return None, None
 
             # Convert to decimal degrees
@@ -130,23 +319,88 @@ class FindNearestService:
 
             # Validate coordinates
             if not self.validate_coordinates(lat, lon):
-                print(f"Ugyldige GPS koordinater for {image_path}: lat={lat}, lon={lon}")
+                logger.debug("Ugyldige GPS koordinater for %s: lat=%s, lon=%s", image_path, lat, lon)
                 return None, None
 
-            print(f"Vellykket GPS ekstraksjon for {image_path}: lat={lat}, lon={lon}")
+            logger.debug("Vellykket GPS ekstraksjon for %s: lat=%s, lon=%s", image_path, lat, lon)
             return lat, lon
 
         except KeyError as e:
-            print(f"EXIF KeyError for {image_path}: {e}")
+            logger.warning("EXIF KeyError for %s: %s", image_path, e)
             return None, None
         except Exception as e:
-            print(f"Feil ved EXIF-lesing for {image_path}: {e}")
+            logger.warning("Feil ved EXIF-lesing for %s: %s", image_path, e)
             return None, None
         
-    def find_nearest(self, image_path, df):
+    def _read_raw_gps(self, image_path):
+        """
+        Leser GPSLatitude/GPSLongitude som (teller, nevner)-par sammen med referansene, uten å regne om.
+        Returnerer (lat_dms, lat_ref, lon_dms, lon_ref), eller None hvis bildet mangler GPS.
+        """
+        try:
+            gps_data = read_gps_ifd(image_path)
+            if gps_data is None:
+                # Kunne ikke leses direkte; la Pillow finne GPS-IFD-en (0x8825) uten å dekode pikseldata
+                with Image.open(image_path) as image:
+                    gps_data = image.getexif().get_ifd(0x8825)
+        except Exception as e:
+            logger.warning("Feil ved EXIF-lesing for %s: %s", image_path, e)
+            return None
+
+        if _LAT not in gps_data or _LON not in gps_data:
+            logger.debug("GPS koordinater mangler i EXIF for bildet: %s", image_path)
+            return None
+
+        try:
+            lat_dms = _rational_pairs(gps_data[_LAT])
+            lon_dms = _rational_pairs(gps_data[_LON])
+        except (TypeError, ValueError) as e:
+            logger.warning("Uventet DMS format for %s: %s", image_path, e)
+            return None
+
+        lat_ref = _decode_ref(gps_data.get(_LAT_REF, b'N')).strip('\x00')
+        lon_ref = _decode_ref(gps_data.get(_LON_REF, b'E')).strip('\x00')
+        return lat_dms, lat_ref, lon_dms, lon_ref
+
+    def get_gps_batch(self, paths, max_workers=8):
+        """
+        Leser GPS-koordinater for mange bilder parallelt.
+        Returnerer dict path -> (latitude, longitude), med (None, None) der GPS mangler.
+
+        Trådene leser bare rådataene; omregning til desimalgrader og validering
+        gjøres for alle bildene samlet med numpy.
+        """
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            raw = list(executor.map(self._read_raw_gps, paths))
+
+        result = dict.fromkeys(paths, (None, None))
+        found = [(path, gps) for path, gps in zip(paths, raw) if gps is not None]
+        if not found:
+            return result
+
+        lats = dms_to_decimal_vec([gps[0] for _, gps in found], [gps[1] in ('S', 'W') for _, gps in found])
+        lons = dms_to_decimal_vec([gps[2] for _, gps in found], [gps[3] in ('S', 'W') for _, gps in found])
+        valid = validate_coordinates_vec(lats, lons)
+
+        for (path, _), lat, lon, ok in zip(found, lats.tolist(), lons.tolist(), valid.tolist()):
+            if ok:
+                result[path] = (lat, lon)
+            else:
+                logger.debug("Ugyldige GPS koordinater for %s: lat=%s, lon=%s", path, lat, lon)
+        return result
+
+    def find_nearest(self, image_path, df=None, max_distance=50):
         """
         Funksjon for å finne nærmeste rad basert på GPS-koordinater fra bildet og en DataFrame.
+        Indeksen over df bygges første gang og gjenbrukes så lenge samme DataFrame sendes inn.
+        Uten df brukes DataFrame satt med set_dataframe.
         """
+        if df is not None and df is not self._df:
+            self.set_dataframe(df)
+        if self._index is None:
+            raise ValueError("Ingen DataFrame å søke i. Send inn df eller kall set_dataframe først.")
+
         # Hent GPS-koordinatene fra bildet
         image_coords = self.get_gps_from_image(image_path)
 
@@ -154,32 +408,50 @@ class FindNearestService:
         if image_coords == (None, None):
             return None
 
-        # Lag en funksjon for å beregne avstanden mellom bildet og hver rad i DataFrame
-        def calculate_distance(row):
-            point = (row['latitude'], row['longitude'])
-            return haversine(image_coords, point, unit=Unit.METERS)
+        # Finn raden med den minste avstanden innenfor terskelen (juster max_distance etter behov)
+        position, distance = self._index.nearest(image_coords[0], image_coords[1], max_distance)
+        if position is None or distance >= max_distance:
+            return None
 
-        # Bruk apply for å beregne avstanden mellom bildet og hver rad i DataFrame
-        df['distance'] = df.apply(calculate_distance, axis=1)
+        nearest_row = self._df.iloc[position].copy()
+        nearest_row['distance'] = distance
 
-        # Finn raden med den minste avstanden
-        nearest_row = df.loc[df['distance'].idxmin()]
-        
         #print(f"GPS-koordinater fra skapet: ( {nearest_row['latitude']}, {nearest_row['longitude']} )")
         #print(f"Nærmeste treff er på avstand: {nearest_row['distance']} m")
 
-        if nearest_row['distance'] < 50:  # Juster terskelen etter behov
-            return nearest_row
-        else:
-            return None
-        
+        return nearest_row
+
+    def find_nearest_batch(self, gps_map, df=None, max_distance=50):
+        """
+        Som find_nearest, men for koordinater som allerede er lest, f.eks. fra get_gps_batch.
+        gps_map er dict path -> (latitude, longitude). Returnerer dict path -> nærmeste rad
+        (med 'distance'), eller None der GPS mangler eller ingen rad er innenfor max_distance.
+        """
+        if df is not None and df is not self._df:
+            self.set_dataframe(df)
+        if self._index is None:
+            raise ValueError("Ingen DataFrame å søke i. Send inn df eller kall set_dataframe først.")
+
+        result = {}
+        for path, (lat, lon) in gps_map.items():
+            result[path] = None
+            if lat is None or lon is None:
+                continue
+            position, distance = self._index.nearest(lat, lon, max_distance)
+            if position is None or distance >= max_distance:
+                continue
+            nearest_row = self._df.iloc[position].copy()
+            nearest_row['distance'] = distance
+            result[path] = nearest_row
+        return result
+
 # Eksempel på bruk
 if __name__ == "__main__":
     # Path til CSV-filen
     csv_file_path = 'path_to_your_csv_file.csv'
 
     # Les CSV-filen inn i en DataFrame
-    df = pd.read_csv(csv_file_path)
+    df = pd.read_csv(csv_file_path, dtype={'latitude': 'float32', 'longitude': 'float32'})
 
     # Opprett tjenesten og bruk den
     service = FindNearestService()
@@ -1,10 +1,58 @@
 import os
+import io
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 import piexif
 
+from services.findnearast import FindNearestService
+
+# Optional, faster JPEG decode/resize/encode (pip install pyvips, requires libvips)
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+# Filendelser som behandles som bilder ved skanning av mapper
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp'})
+
+
+def is_image_filename(filename):
+    """
+    Return True if filename has one of the supported image extensions (case-insensitive).
+    """
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_image_entries(folder_path, recursive=False):
+    """
+    Yield an os.DirEntry for every image file in folder_path (and its subfolders if recursive).
+
+    Uses os.scandir so the file type comes from the directory entry itself instead of an
+    extra stat call per file. entry.stat() is cached on the entry (and free on Windows),
+    so callers can pass it on instead of calling os.stat again.
+    """
+    with os.scandir(folder_path) as entries:
+        subfolders = []
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False) and is_image_filename(entry.name):
+                yield entry
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+    for subfolder in subfolders:
+        yield from iter_image_entries(subfolder, recursive)
+
+
+def iter_image_files(folder_path):
+    """
+    Yield (filename, path) for every image file directly inside folder_path.
+    """
+    for entry in iter_image_entries(folder_path):
+        yield entry.name, entry.path
+
+
 class ImageProcessingService:
     def __init__(self):
-        pass
+        self.find_nearest = FindNearestService()
 
     def resize_image_with_exif(self, image_path, max_width=None, max_height=None, quality=85, output_path=None):
         """
@@ -23,65 +71,159 @@ class ImageProcessingService:
         try:
             # Open the image
             with Image.open(image_path) as img:
-                # Get original dimensions
-                original_width, original_height = img.size
-
-                # If no dimensions specified, return original path
-                if max_width is None and max_height is None:
-                    return image_path
-
-                # Calculate new dimensions while maintaining aspect ratio
-                if max_width and max_height:
-                    # Calculate ratios for both dimensions
-                    width_ratio = max_width / original_width
-                    height_ratio = max_height / original_height
-                    ratio = min(width_ratio, height_ratio)
-
-                    new_width = int(original_width * ratio)
-                    new_height = int(original_height * ratio)
-                elif max_width:
-                    ratio = max_width / original_width
-                    new_width = max_width
-                    new_height = int(original_height * ratio)
-                elif max_height:
-                    ratio = max_height / original_height
-                    new_width = int(original_width * ratio)
-                    new_height = max_height
-
-                # Only resize if image is actually larger than target dimensions
-                if new_width >= original_width and new_height >= original_height:
-                    print(f"Image {os.path.basename(image_path)} is already smaller than target size")
-                    return image_path
-
-                # Load EXIF data
-                exif_data = piexif.load(img.info.get('exif', b''))
-
-                # Resize the image
-                resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-                # Determine output path
-                if output_path is None:
-                    # Create a temporary resized version
-                    base_name = os.path.splitext(os.path.basename(image_path))[0]
-                    dir_name = os.path.dirname(image_path)
-                    output_path = os.path.join(dir_name, f"{base_name}_r.jpg")
-
-                # Save with EXIF data preserved
-                if exif_data:
-                    # Convert EXIF data back to bytes
-                    exif_bytes = piexif.dump(exif_data)
-                    resized_img.save(output_path, 'JPEG', quality=quality, exif=exif_bytes)
-                else:
-                    resized_img.save(output_path, 'JPEG', quality=quality)
-
-                print(f"Resized {os.path.basename(image_path)} from {original_width}x{original_height} to {new_width}x{new_height}")
-                return output_path
+                result_path, _ = self._resize_opened_image(img, image_path, max_width, max_height, quality, output_path)
+                return result_path
 
         except Exception as e:
             print(f"Error resizing image {image_path}: {str(e)}")
             return image_path  # Return original path if resize fails
 
-    def resize_images_in_folder(self, folder_path, max_width=None, max_height=None, quality=85, overwrite=False):
+    def process_image(self, image_path, max_width=None, max_height=None, quality=85, output_path=None):
+        """
+        Read GPS coordinates and resize an image with a single file open and a single EXIF decode.
+
+        Args:
+            image_path (str): Path to the input image
+            max_width (int): Maximum width in pixels (optional)
+            max_height (int): Maximum height in pixels (optional)
+            quality (int): JPEG quality (1-100, default 85)
+            output_path (str): Path for the resized image (optional, see resize_image_with_exif)
+
+        Returns:
+            tuple: (latitude, longitude, output_path); coordinates are None when the image has no valid GPS,
+                   output_path is image_path when the image was not resized
+        """
+        try:
+            with Image.open(image_path) as img:
+                exif_bytes = img.info.get('exif')
+                exif_data = piexif.load(exif_bytes) if exif_bytes else {}
+
+                latitude, longitude = self.find_nearest.get_gps_from_exif(exif_data, image_path)
+                result_path, _ = self._resize_opened_image(
+                    img, image_path, max_width, max_height, quality, output_path
+                )
+                return latitude, longitude, result_path
+
+        except Exception as e:
+            print(f"Error processing image {image_path}: {str(e)}")
+            return None, None, image_path
+
+    def resize_image_to_bytes(self, image_path, max_width=None, max_height=None, quality=85):
+        """
+        Resize an image like resize_image_with_exif, but return the JPEG in memory instead of
+        writing it next to the original, so it can be uploaded without a temporary file.
+
+        Args:
+            image_path (str): Path to the input image
+            max_width (int): Maximum width in pixels (optional)
+            max_height (int): Maximum height in pixels (optional)
+            quality (int): JPEG quality (1-100, default 85)
+
+        Returns:
+            bytes: The resized JPEG with EXIF preserved, or None when the image already fits
+                   (or could not be resized) and the original file should be used as is
+        """
+        try:
+            with Image.open(image_path) as img:
+                encoded = self._encode_resized(img, image_path, max_width, max_height, quality)
+        except Exception as e:
+            print(f"Error resizing image {image_path}: {str(e)}")
+            return None
+        return encoded[0] if encoded else None
+
+    def _resize_opened_image(self, img, image_path, max_width, max_height, quality, output_path):
+        """
+        Resize an already opened image.
+
+        Returns:
+            tuple: (result_path, (width, height) of the result); result_path is image_path when not resized
+        """
+        encoded = self._encode_resized(img, image_path, max_width, max_height, quality)
+        if encoded is None:
+            return image_path, img.size
+        jpeg_bytes, size = encoded
+
+        # Determine output path
+        if output_path is None:
+            # Create a temporary resized version
+            base_name = os.path.splitext(os.path.basename(image_path))[0]
+            dir_name = os.path.dirname(image_path)
+            output_path = os.path.join(dir_name, f"{base_name}_r.jpg")
+
+        # Encoded to memory first, so overwriting the source file is safe
+        with open(output_path, 'wb') as output_file:
+            output_file.write(jpeg_bytes)
+        return output_path, size
+
+    def _encode_resized(self, img, image_path, max_width, max_height, quality):
+        """
+        Resize an already opened image and encode it as JPEG in memory.
+
+        Returns:
+            tuple: (jpeg_bytes, (width, height)), or None when the image does not need resizing
+        """
+        # Get original dimensions
+        original_width, original_height = img.size
+
+        # If no dimensions specified, keep the original
+        if max_width is None and max_height is None:
+            return None
+
+        # Skip the decode/re-encode entirely when the image already fits (size is read from the header)
+        if (max_width is None or original_width <= max_width) and \
+           (max_height is None or original_height <= max_height):
+            print(f"Image {os.path.basename(image_path)} is already smaller than target size")
+            return None
+
+        # Calculate new dimensions while maintaining aspect ratio
+        if max_width and max_height:
+            # Calculate ratios for both dimensions
+            width_ratio = max_width / original_width
+            height_ratio = max_height / original_height
+            ratio = min(width_ratio, height_ratio)
+
+            new_width = int(original_width * ratio)
+            new_height = int(original_height * ratio)
+        elif max_width:
+            ratio = max_width / original_width
+            new_width = max_width
+            new_height = int(original_height * ratio)
+        elif max_height:
+            ratio = max_height / original_height
+            new_width = int(original_width * ratio)
+            new_height = max_height
+
+        if pyvips is not None and img.format == 'JPEG':
+            # libvips shrinks on load (libjpeg-turbo DCT scaling) and keeps the EXIF block as is
+            thumbnail = pyvips.Image.thumbnail(image_path, new_width, height=new_height, size='down', no_rotate=True)
+            jpeg_bytes = thumbnail.jpegsave_buffer(Q=quality)
+            print(f"Resized {os.path.basename(image_path)} from {original_width}x{original_height} to {thumbnail.width}x{thumbnail.height}")
+            return jpeg_bytes, (thumbnail.width, thumbnail.height)
+
+        # The EXIF block is copied unchanged, so the original bytes are passed straight to save()
+        # instead of a piexif.load/dump round-trip (images without EXIF are resized without it)
+        exif_bytes = img.info.get('exif')
+
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when the target is that much smaller.
+        # Ask for twice the target size so LANCZOS still has enough pixels to downsample from.
+        if img.format == 'JPEG':
+            img.draft(img.mode, (new_width * 2, new_height * 2))
+
+        # Resize the image
+        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+        # Save with EXIF data preserved
+        buffer = io.BytesIO()
+        if exif_bytes:
+            resized_img.save(buffer, 'JPEG', quality=quality, exif=exif_bytes)
+        else:
+            resized_img.save(buffer, 'JPEG', quality=quality)
+
+        print(f"Resized {os.path.basename(image_path)} from {original_width}x{original_height} to {new_width}x{new_height}")
+        return buffer.getvalue(), (new_width, new_height)
+
+    def resize_images_in_folder(self, folder_path, max_width=None, max_height=None, quality=85, overwrite=False,
+                                max_workers=None):
         """
         Resize all images in a folder while preserving EXIF data.
 
@@ -91,6 +233,7 @@ class ImageProcessingService:
             max_height (int): Maximum height in pixels
             quality (int): JPEG quality (1-100)
             overwrite (bool): Whether to overwrite original files or create resized versions
+            max_workers (int): Number of worker processes (default: number of CPUs)
 
         Returns:
             tuple: (resized_count, skipped_count)
@@ -102,18 +245,19 @@ class ImageProcessingService:
         resized_count = 0
         skipped_count = 0
 
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_path = os.path.join(folder_path, filename)
+        image_paths = [path for _, path in iter_image_files(folder_path)]
 
-                if overwrite:
-                    output_path = image_path
-                else:
-                    output_path = None  # Will create _resized version
-
-                result_path = self.resize_image_with_exif(
-                    image_path, max_width, max_height, quality, output_path
+        # Each resize is an independent, CPU-bound decode/resample/encode; run them in separate processes
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    _resize_worker, image_path, max_width, max_height, quality,
+                    image_path if overwrite else None  # None creates a _r version
                 )
+                for image_path in image_paths
+            ]
+            for image_path, future in zip(image_paths, futures):
+                result_path, _, _ = future.result()
 
                 if result_path != image_path:
                     resized_count += 1
@@ -123,6 +267,57 @@ class ImageProcessingService:
         print(f"Resize complete. Resized: {resized_count}, Skipped: {skipped_count}")
         return resized_count, skipped_count
 
+    def pipeline(self, folder_path, df, max_distance=50, max_width=None, max_height=None, quality=85,
+                 overwrite=False, max_workers=None):
+        """
+        Scan a folder, read GPS, find the nearest row in df and resize the matched images, in one pass.
+
+        GPS is read from the Exif segment only (in threads), the nearest-row lookups run against
+        the prebuilt latitude index in one batch, and only images with a match are decoded and
+        resized (in worker processes). Images without GPS or a match are never fully opened.
+
+        Args:
+            folder_path (str): Path to the folder containing images
+            df (DataFrame): Rows with latitude/longitude columns to match against
+            max_distance (float): Max distance in meters for a match
+            max_width (int): Maximum width in pixels (optional)
+            max_height (int): Maximum height in pixels (optional)
+            quality (int): JPEG quality (1-100)
+            overwrite (bool): Whether to overwrite original files or create resized versions
+            max_workers (int): Number of worker processes for resizing (default: number of CPUs)
+
+        Returns:
+            list: (image_path, nearest_row, result_path) per image in folder order; nearest_row is None
+                  without a match, result_path is image_path when the image was not resized
+        """
+        if not os.path.exists(folder_path):
+            print(f"Folder {folder_path} does not exist")
+            return []
+
+        image_paths = [path for _, path in iter_image_files(folder_path)]
+        gps_map = self.find_nearest.get_gps_batch(image_paths)
+        nearest = self.find_nearest.find_nearest_batch(gps_map, df, max_distance)
+
+        result_paths = dict.fromkeys(image_paths)
+        matched = [image_path for image_path in image_paths if nearest[image_path] is not None]
+        if matched and (max_width is not None or max_height is not None):
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        _resize_worker, image_path, max_width, max_height, quality,
+                        image_path if overwrite else None  # None creates a _r version
+                    )
+                    for image_path in matched
+                ]
+                for image_path, future in zip(matched, futures):
+                    result_paths[image_path], _, _ = future.result()
+
+        print(f"Pipeline complete. Images: {len(image_paths)}, Matched: {len(matched)}")
+        return [
+            (image_path, nearest[image_path], result_paths[image_path] or image_path)
+            for image_path in image_paths
+        ]
+
     def get_image_info(self, image_path):
         """
         Get basic information about an image.
@@ -141,14 +336,58 @@ class ImageProcessingService:
                     'format': img.format,
                     'mode': img.mode,
                     'has_exif': bool(img.info.get('exif')),
-                    'file_size': os.path.getsize(image_path) if os.path.exists(image_path) else 0
+                    'file_size': os.path.getsize(image_path)
                 }
                 return info
         except Exception as e:
             print(f"Error getting image info for {image_path}: {str(e)}")
             return None
 
-    def batch_resize_with_progress(self, folder_path, max_width=None, max_height=None, quality=85, overwrite=False):
+    def resize_with_info(self, image_path, max_width=None, max_height=None, quality=85, output_path=None):
+        """
+        Resize an image like resize_image_with_exif and describe it before and after,
+        reading the header only once instead of reopening the file for each get_image_info.
+
+        Returns:
+            tuple: (result_path, original_info, resized_info) with infos shaped like get_image_info;
+                   the infos are None if the image could not be opened
+        """
+        try:
+            with Image.open(image_path) as img:
+                original_info = {
+                    'width': img.size[0],
+                    'height': img.size[1],
+                    'format': img.format,
+                    'mode': img.mode,
+                    'has_exif': bool(img.info.get('exif')),
+                    'file_size': os.path.getsize(image_path)
+                }
+                try:
+                    result_path, (width, height) = self._resize_opened_image(
+                        img, image_path, max_width, max_height, quality, output_path
+                    )
+                except Exception as e:
+                    print(f"Error resizing image {image_path}: {str(e)}")
+                    return image_path, original_info, original_info
+        except Exception as e:
+            print(f"Error getting image info for {image_path}: {str(e)}")
+            return image_path, None, None
+
+        if result_path == image_path:
+            return result_path, original_info, original_info
+
+        # Resized output is always JPEG; the EXIF block is carried over when the original had one
+        resized_info = dict(
+            original_info,
+            width=width,
+            height=height,
+            format='JPEG',
+            file_size=os.path.getsize(result_path)
+        )
+        return result_path, original_info, resized_info
+
+    def batch_resize_with_progress(self, folder_path, max_width=None, max_height=None, quality=85, overwrite=False,
+                                   max_workers=None):
         """
         Resize images in a folder with progress reporting.
 
@@ -158,6 +397,7 @@ class ImageProcessingService:
             max_height (int): Maximum height in pixels
             quality (int): JPEG quality (1-100)
             overwrite (bool): Whether to overwrite original files or create resized versions
+            max_workers (int): Number of worker processes (default: number of CPUs)
 
         Returns:
             dict: Processing results with counts and details
@@ -166,10 +406,7 @@ class ImageProcessingService:
             return {'error': f"Folder {folder_path} does not exist"}
 
         # Get list of image files
-        image_files = []
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_files.append(filename)
+        image_files = [filename for filename, _ in iter_image_files(folder_path)]
 
         total_files = len(image_files)
         processed = 0
@@ -188,53 +425,55 @@ class ImageProcessingService:
 
         print(f"Starting batch resize of {total_files} images...")
 
-        for filename in image_files:
-            image_path = os.path.join(folder_path, filename)
-            processed += 1
-
-            try:
-                # Get original info
-                original_info = self.get_image_info(image_path)
+        # Details are kept in file order even though the images finish in any order
+        details = [None] * total_files
 
-                if overwrite:
-                    output_path = image_path
-                else:
-                    output_path = None
-
-                result_path = self.resize_image_with_exif(
-                    image_path, max_width, max_height, quality, output_path
-                )
-
-                # Get resized info
-                resized_info = self.get_image_info(result_path) if result_path != image_path else original_info
-
-                if result_path != image_path:
-                    resized += 1
-                    status = 'resized'
-                else:
-                    skipped += 1
-                    status = 'skipped'
-
-                results['details'].append({
-                    'filename': filename,
-                    'status': status,
-                    'original_size': f"{original_info['width']}x{original_info['height']}" if original_info else 'unknown',
-                    'resized_size': f"{resized_info['width']}x{resized_info['height']}" if resized_info else 'unknown',
-                    'original_file_size': original_info['file_size'] if original_info else 0,
-                    'resized_file_size': resized_info['file_size'] if resized_info else 0
-                })
-
-                print(f"[{processed}/{total_files}] {filename}: {status}")
-
-            except Exception as e:
-                errors += 1
-                results['details'].append({
-                    'filename': filename,
-                    'status': 'error',
-                    'error': str(e)
-                })
-                print(f"[{processed}/{total_files}] {filename}: ERROR - {str(e)}")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _resize_worker, os.path.join(folder_path, filename), max_width, max_height, quality,
+                    os.path.join(folder_path, filename) if overwrite else None, True
+                ): index
+                for index, filename in enumerate(image_files)
+            }
 
+            for future in as_completed(futures):
+                index = futures[future]
+                filename = image_files[index]
+                image_path = os.path.join(folder_path, filename)
+                processed += 1
+
+                try:
+                    result_path, original_info, resized_info = future.result()
+
+                    if result_path != image_path:
+                        resized += 1
+                        status = 'resized'
+                    else:
+                        skipped += 1
+                        status = 'skipped'
+
+                    details[index] = {
+                        'filename': filename,
+                        'status': status,
+                        'original_size': f"{original_info['width']}x{original_info['height']}" if original_info else 'unknown',
+                        'resized_size': f"{resized_info['width']}x{resized_info['height']}" if resized_info else 'unknown',
+                        'original_file_size': original_info['file_size'] if original_info else 0,
+                        'resized_file_size': resized_info['file_size'] if resized_info else 0
+                    }
+
+                    print(f"[{processed}/{total_files}] {filename}: {status}")
+
+                except Exception as e:
+                    errors += 1
+                    details[index] = {
+                        'filename': filename,
+                        'status': 'error',
+                        'error': str(e)
+                    }
+                    print(f"[{processed}/{total_files}] {filename}: ERROR - {str(e)}")
+
+        results['details'] = details
         results['processed'] = processed
         results['resized'] = resized
         results['skipped'] = skipped
@@ -322,6 +561,19 @@ class ImageProcessingService:
             'pixel_count_target': target_width * target_height
         }
 
+def _resize_worker(image_path, max_width, max_height, quality, output_path, with_info=False):
+    """
+    Resize one image in a worker process (module level so ProcessPoolExecutor can pickle it).
+
+    Returns:
+        tuple: (result_path, original_info, resized_info); the infos are None unless with_info is True
+    """
+    processor = ImageProcessingService()
+    if with_info:
+        return processor.resize_with_info(image_path, max_width, max_height, quality, output_path)
+    return processor.resize_image_with_exif(image_path, max_width, max_height, quality, output_path), None, None
+
+
 # Example usage
 if __name__ == "__main__":
     processor = ImageProcessingService()
@@ -1,14 +1,147 @@
+import io
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import stat
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from datetime import datetime, timedelta
 import json
+import email.utils
+import logging
+import time
 import hashlib
+import mmap
 from dotenv import load_dotenv
+from services.cache import get_cache_dir, file_lock, read_json, write_json_atomic
+
+# Valgfrie, raskere hash-algoritmer for duplikatsjekk (pip install blake3 / xxhash)
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Valgfri strømming av multipart-opplastinger rett fra disk (pip install requests-toolbelt)
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except ImportError:
+    MultipartEncoder = None
+
+# Valgfri, raskere JSON for nyttelast og svar (pip install orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def json_dumps(obj):
+    """
+    Serialiserer obj til UTF-8-kodet JSON (bytes), med orjson hvis den er installert.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def json_loads(data):
+    """
+    Leser JSON fra bytes eller str, med orjson hvis den er installert.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Filer større enn dette hashes via mmap, mindre filer leses i biter
+MMAP_HASH_THRESHOLD = 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# xxh128 har samme lengde som md5, så hasher med den får algoritmenavnet foran
+# ("xxh128:<hex>") og kan ikke forveksles med md5-rader i upload-loggen
+PREFIXED_HASH_ALGORITHMS = frozenset({'xxh128'})
+
+# Andre navn på samme algoritme; xxh3 beregnes som xxh3_128 og lagres derfor som xxh128
+HASH_ALGORITHM_ALIASES = {'xxh3': 'xxh128'}
+
+# Antall filhasher (nøkkel: sti, algoritme, mtime, størrelse) som huskes i minnet
+FILE_HASH_CACHE_SIZE = 65536
+
+# Blokkvis sha256 (HASH_ALGO=sha256-blk16m): blokkene hashes parallelt, så store filer bruker alle kjerner
+PARALLEL_HASH_ALGORITHM = 'sha256-blk16m'
+PARALLEL_HASH_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Samplet fingeravtrykk (HASH_ALGO=sampled, som imohash): filer over terskelen hashes bare
+# med størrelse og tre utsnitt (start, midt, slutt) i stedet for hele filen. Raskt for
+# duplikatsjekk, men to filer som bare er ulike utenfor utsnittene får samme verdi.
+SAMPLED_HASH_ALGORITHM = 'sampled'
+SAMPLED_HASH_THRESHOLD = 3 * 1024 * 1024
+SAMPLED_HASH_SAMPLE_SIZE = 64 * 1024
+
+# Token fornyes så mye før utløp, så en pågående opplasting ikke får et utløpt token
+TOKEN_EXPIRY_MARGIN = 60
+
+# Retry-adapteren prøver bare idempotente kall (GET o.l.) på nytt. POST-kall som får 429
+# sendes på nytt av _send, med kroppen bygget på nytt, maks så mange ganger
+RATE_LIMIT_RETRIES = 3
+# Ventetid før første nye forsøk (dobles for hvert forsøk) når svaret mangler Retry-After,
+# og øvre grense for ventetiden
+RATE_LIMIT_BACKOFF = 0.5
+RATE_LIMIT_MAX_WAIT = 60
+
+# Antall filehash-oppslag mot ImageGrid som huskes i minnet
+EXISTS_CACHE_SIZE = 100_000
+# "Finnes ikke" sjekkes på nytt etter så mange sekunder, så bilder lastet opp av andre blir funnet
+EXISTS_NEGATIVE_TTL = 60
+
+# Felter i from_record som ikke sendes som egne felter av process_record
+PROCESS_RECORD_EXCLUDED = frozenset({"filename", "longitude", "latitude"})
+
+# Antall bildesjekker (nøkkel: sti, mtime, størrelse) som huskes i minnet
+IMAGE_CHECK_CACHE_SIZE = 65536
+
+# Øvre grense for samtidige kall mot ImageGrid-API-et, se get_upload_concurrency
+MAX_UPLOAD_CONCURRENCY = 10
+
+# Magiske bytes i starten av filen for formatene vi laster opp (WEBP sjekkes for seg)
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF8', 'GIF'),
+    (b'BM', 'BMP'),
+)
+
+
+def sniff_image_format(head):
+    """
+    Finner bildeformatet ut fra de første 12 bytene av filen. Returnerer None hvis det er ukjent.
+    """
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def get_upload_concurrency():
+    """
+    Antall samtidige kall mot ImageGrid-API-et (UPLOAD_MAX_CONCURRENCY, maks MAX_UPLOAD_CONCURRENCY).
+    Grensen gjelder totalt, også når opplastingen fordeles på flere prosesser.
+    """
+    return min(int(os.getenv('UPLOAD_MAX_CONCURRENCY', '8')), MAX_UPLOAD_CONCURRENCY)
+
+
 class ImageGridService:
     def __init__(self, client_id=None, client_secret=None, token_url=None, imgr_api_url=None):
         # Use environment variables if not provided
@@ -22,25 +155,99 @@ class ImageGridService:
             raise ValueError("Missing required credentials. Please set IMAGEGRID_CLIENT_ID, IMAGEGRID_CLIENT_SECRET, IMAGEGRID_TOKEN_URL, and IMAGEGRID_API_URL in your .env file or pass them as parameters.")
 
         self.access_token = None
-        self.token_refresh_time = None
+        self.refresh_token = None
+        # time.monotonic() når tokenet må fornyes; veggklokken kan hoppe (NTP, sommertid)
+        self._token_expiry_monotonic = None
+        # Opplastingstrådene deler tokenet; låsen sørger for at bare én tråd henter nytt
+        self._token_lock = threading.Lock()
+        # fileHash -> (resultat fra check_image_exists, time.monotonic() da det ble sjekket)
+        self._exists_cache = {}
+        self._exists_lock = threading.Lock()
+        self._is_image_file_cached = functools.lru_cache(maxsize=IMAGE_CHECK_CACHE_SIZE)(self._is_image_file_uncached)
+        self._file_hash_cached = functools.lru_cache(maxsize=FILE_HASH_CACHE_SIZE)(self._calculate_file_hash_uncached)
         self.tenant_name = "moerenett"
 
+        # Én Session med keep-alive, så TCP/TLS-oppkoblingen gjenbrukes mellom opplastinger.
+        # Poolen dimensjoneres etter antall parallelle opplastinger.
+        # Retry gjelder bare urllib3 sine standardmetoder (ikke POST); 429 på POST håndteres i _send
+        self.max_concurrency = get_upload_concurrency()
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_concurrency * 2, max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Hash-algoritme for filehash. ImageGrid sin filehash-indeks er bygget med md5,
+        # så andre algoritmer bør bare brukes mot nye logger/tenanter.
+        self.hash_algorithm = os.getenv('HASH_ALGO', 'md5')
+        # Algoritmen eldre rader i upload-loggen ble skrevet med (f.eks. md5 etter bytte til blake3).
+        # Når den er satt, slås filer som ikke finnes med ny hash opp på nytt med denne.
+        self.fallback_hash_algorithm = os.getenv('HASH_ALGO_FALLBACK') or None
+
     def check_image_format(self, image_path):
         try:
-            with Image.open(image_path) as img:
-                # img.format gir bildeformatet som 'JPEG', 'PNG', etc.
-                print(f"The file is a valid image of type: {img.format}")
-                return img.format
+            # De vanlige formatene kjennes igjen på de første bytene, uten å gå via Pillow
+            with open(image_path, 'rb') as f:
+                image_format = sniff_image_format(f.read(12))
+            if image_format is None:
+                with Image.open(image_path) as img:
+                    # img.format gir bildeformatet som 'JPEG', 'PNG', etc.
+                    image_format = img.format
+            logger.debug("The file is a valid image of type: %s", image_format)
+            return image_format
         except IOError:
-            print("The file is not a valid image.")
+            logger.debug("The file is not a valid image: %s", image_path)
             return None
     
-    def get_access_token(self):
-        # Hvis token er gyldig, returner det
-        if self.access_token and self.token_refresh_time > datetime.now():
-            return self.access_token
+    def _token_cache_path(self):
+        """
+        Sti til token-cachen som deles av alle prosesser med samme klient og token-URL.
+        """
+        key = hashlib.sha1(f"{self.client_id}|{self.token_url}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(get_cache_dir(), f"imagegrid_token_{key}.json")
+
+    def _set_token(self, token, expires_in, refresh_token=None):
+        """
+        Tar i bruk et token som utløper om expires_in sekunder.
+        """
+        self.access_token = token
+        self.refresh_token = refresh_token
+        self._token_expiry_monotonic = time.monotonic() + expires_in - TOKEN_EXPIRY_MARGIN
+        # Alle kall går via sessionen; sett Authorization der én gang per nytt token
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def _load_cached_token(self, cache_path, stale_token=None):
+        """
+        Bruker tokenet fra cache-filen hvis det er gyldig lenge nok og ikke er stale_token.
+        """
+        cached = read_json(cache_path)
+        if not cached or not cached.get('token') or cached['token'] == stale_token:
+            return False
+        # expires_at er veggklokke (delt mellom prosesser). Gjenstående tid begrenses til
+        # tokenets levetid, så en klokke som er stilt tilbake ikke forlenger tokenet.
+        expires_in = min(cached.get('expires_at', 0) - time.time(), cached.get('lifetime', float('inf')))
+        if expires_in > TOKEN_EXPIRY_MARGIN:
+            self._set_token(cached['token'], expires_in, cached.get('refresh_token'))
+            return True
+        return False
 
-        #print("Requesting new access token")
+    def _request_token(self):
+        """
+        Henter nytt token fra token-endepunktet. Bruker refresh_token når vi har et,
+        ellers (eller hvis det er avvist) client credentials.
+        """
+        if self.refresh_token:
+            data = {
+                "grant_type": "refresh_token",
+                "refresh_token": self.refresh_token,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret
+            }
+            response = self.session.post(self.token_url, data=data, headers={'Authorization': None})
+            if response.status_code == 200:
+                return json_loads(response.content)
+            # Refresh-tokenet er utløpt eller trukket tilbake
+            self.refresh_token = None
 
         # Data til POST-forespørselen for å få token
         data = {
@@ -50,40 +257,164 @@ class ImageGridService:
             "scope": "imgr.grid.api admin.api file.api"
         }
 
-        # Send POST-forespørselen for å få token
-        response = requests.post(self.token_url, data=data)
+        # Send POST-forespørselen for å få token (uten det gamle tokenet fra sessionen)
+        response = self.session.post(self.token_url, data=data, headers={'Authorization': None})
 
         if response.status_code == 200:
-            token_result = response.json()
-            self.access_token = token_result.get("access_token")
-            #print(f"Token: {self.access_token}")
-            
-            self.token_refresh_time = datetime.now() + timedelta(minutes=30)
-            return self.access_token
+            return json_loads(response.content)
         else:
             raise Exception(f"Failed to get access token: {response.text}")
 
+    def get_access_token(self, stale_token=None):
+        """
+        Returnerer et gyldig token. Tokenet deles med andre prosesser via en cache-fil,
+        så bare én av dem henter nytt når det utløper.
+        stale_token er et token serveren har avvist (401); det brukes ikke selv om det ikke er utløpt.
+        """
+        with self._token_lock:
+            # Hvis token er gyldig, returner det
+            if self.access_token and self.access_token != stale_token and \
+                    self._token_expiry_monotonic is not None and time.monotonic() < self._token_expiry_monotonic:
+                return self.access_token
+
+            cache_path = self._token_cache_path()
+            if self._load_cached_token(cache_path, stale_token):
+                return self.access_token
+
+            # Bare én prosess henter nytt token; de andre plukker det opp fra cache-filen
+            with file_lock(cache_path):
+                if self._load_cached_token(cache_path, stale_token):
+                    return self.access_token
+
+                #print("Requesting new access token")
+                token_result = self._request_token()
+
+                # Bruk levetiden fra token-svaret når den finnes, ellers 30 minutter
+                expires_in = token_result.get("expires_in")
+                lifetime = int(expires_in) if expires_in else 30 * 60
+                self._set_token(token_result.get("access_token"), lifetime,
+                                token_result.get("refresh_token", self.refresh_token))
+                #print(f"Token: {self.access_token}")
+
+                cached = {'token': self.access_token, 'expires_at': time.time() + lifetime, 'lifetime': lifetime}
+                if self.refresh_token:
+                    cached['refresh_token'] = self.refresh_token
+                try:
+                    write_json_atomic(cache_path, cached)
+                except OSError as e:
+                    logger.warning("Could not write ImageGrid token cache %s: %s", cache_path, e)
+                return self.access_token
+
+    def _send(self, method, url, body=None, **kwargs):
+        """
+        Sender et autentisert kall via sessionen, som allerede har Authorization-headeren.
+        Tokenet fornyes bare når levetiden fra token-svaret er ute, eller når vi får 401
+        (token trukket tilbake før utløp); da sendes kallet én gang til.
+        body er en valgfri funksjon som gir flere argumenter til kallet for hvert forsøk,
+        for innhold som bare kan leses én gang (filer, strømmede multipart-kropper).
+        """
+        # Uten lås så lenge tokenet ikke er nær utløp; ellers hentes nytt via get_access_token
+        token = self.access_token
+        expiry = self._token_expiry_monotonic
+        if token is None or expiry is None or time.monotonic() >= expiry:
+            token = self.get_access_token()
+        response = self.session.request(method, url, **kwargs, **(body() if body else {}))
+        if response.status_code == 401:
+            # Frigjør tilkoblingen før nytt forsøk (med stream=True er svaret ikke lest ferdig)
+            response.close()
+            self.get_access_token(stale_token=token)
+            response = self.session.request(method, url, **kwargs, **(body() if body else {}))
+
+        # GET o.l. er allerede prøvd på nytt av Retry-adapteren; POST prøves her, der body()
+        # bygger en ny kropp (spoler filen tilbake) for hvert forsøk
+        if method.upper() not in Retry.DEFAULT_ALLOWED_METHODS:
+            for attempt in range(RATE_LIMIT_RETRIES):
+                if response.status_code != 429:
+                    break
+                wait = self._retry_after(response, RATE_LIMIT_BACKOFF * 2 ** attempt)
+                response.close()
+                logger.warning("ImageGrid svarte 429 på %s %s; prøver igjen om %.1f s.", method, url, wait)
+                time.sleep(wait)
+                response = self.session.request(method, url, **kwargs, **(body() if body else {}))
+        return response
+
+    @staticmethod
+    def _retry_after(response, default):
+        """
+        Ventetid i sekunder fra Retry-After (sekunder eller HTTP-dato), ellers default.
+        Begrenset til RATE_LIMIT_MAX_WAIT.
+        """
+        value = response.headers.get('Retry-After')
+        wait = default
+        if value:
+            try:
+                wait = float(value)
+            except ValueError:
+                try:
+                    wait = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        return min(max(wait, 0), RATE_LIMIT_MAX_WAIT)
+
     def is_image_file(self,file_path):
         """
         Sjekk om filen er et gyldig bilde.
         Returnerer True hvis det er et bilde, False ellers.
+        Resultatet huskes per (sti, mtime, størrelse), så en uendret fil bare sjekkes én gang.
         """
-        if not os.path.isfile(file_path):
-            print(f"Filen {file_path} eksisterer ikke.")
+        try:
+            st = os.stat(file_path)
+            if not stat.S_ISREG(st.st_mode):
+                raise FileNotFoundError(file_path)
+            return self._is_image_file_cached(file_path, st.st_mtime_ns, st.st_size)
+        except OSError:
+            # Lesefeil caches ikke
+            logger.warning("Filen %s eksisterer ikke.", file_path)
             return False
 
-        image_type = self.check_image_format( file_path )
+    def _is_image_file_uncached(self, file_path, mtime_ns, size):
+        """
+        Sjekker filen uten cache. mtime_ns og size er bare med i cache-nøkkelen.
+        Kaster OSError hvis filen ikke kan leses.
+        """
+        # Samme 12 bytes som check_image_format leser
+        with open(file_path, 'rb') as f:
+            image_type = sniff_image_format(f.read(12))
+
+        if image_type is None:
+            image_type = self.check_image_format( file_path )
 
         if image_type:
-            print(f"{file_path} er et gyldig bilde av typen {image_type}.")
+            logger.debug("%s er et gyldig bilde av typen %s.", file_path, image_type)
             return True
         else:
-            print(f"{file_path} er ikke et gyldig bilde.")
+            logger.debug("%s er ikke et gyldig bilde.", file_path)
             return False
 
-    def calculate_file_hash(self, file_path, algorithm_name):
+    def calculate_file_hash(self, file_path, algorithm_name, stat_result=None):
+        """
+        Returnerer filehash for filen. Resultatet huskes per (sti, algoritme, mtime, størrelse),
+        så opplastingsløkkene kan spørre om samme fil flere ganger uten å lese den på nytt.
+        stat_result er os.stat for filen hvis kalleren allerede har den (f.eks. fra os.scandir).
+        """
+        st = stat_result if stat_result is not None else os.stat(file_path)
+        algorithm_name = algorithm_name.lower()
+        algorithm_name = HASH_ALGORITHM_ALIASES.get(algorithm_name, algorithm_name)
+        return self._file_hash_cached(file_path, algorithm_name, st.st_mtime_ns, st.st_size)
+
+    def _calculate_file_hash_uncached(self, file_path, algorithm_name, mtime_ns, size):
+        """
+        Hasher filen uten cache. mtime_ns og size er bare med i cache-nøkkelen.
+        """
+        if algorithm_name.lower() == PARALLEL_HASH_ALGORITHM:
+            return self.calculate_file_hash_parallel(file_path)
+        if algorithm_name.lower() == SAMPLED_HASH_ALGORITHM:
+            return self.calculate_file_hash_sampled(file_path)
+
         # Åpne filen i binær modus for lesing
         with open(file_path, 'rb') as file:
+            file_size = os.fstat(file.fileno()).st_size
+
             # Opprett en hash-objekt basert på algoritme-navnet
             if algorithm_name.lower() == 'md5':
                 hasher = hashlib.md5()
@@ -91,49 +422,166 @@ class ImageGridService:
                 hasher = hashlib.sha1()
             elif algorithm_name.lower() == 'sha256':
                 hasher = hashlib.sha256()
+            elif algorithm_name.lower() == 'blake3':
+                if blake3 is None:
+                    raise ImportError("HASH_ALGO=blake3 krever blake3-pakken (pip install blake3).")
+                # Store filer hashes med flere tråder (BLAKE3 sitt tre-modus); små filer med én
+                max_threads = blake3.blake3.AUTO if file_size > MMAP_HASH_THRESHOLD else 1
+                hasher = blake3.blake3(max_threads=max_threads)
+            elif algorithm_name.lower() in ('xxh3', 'xxh128'):
+                if xxhash is None:
+                    raise ImportError(f"HASH_ALGO={algorithm_name} krever xxhash-pakken (pip install xxhash).")
+                hasher = xxhash.xxh3_128()
             else:
                 raise ValueError(f"Hash-algoritmen {algorithm_name} er ikke støttet.")
 
-            # Les filen i biter og oppdater hash-objektet
-            while chunk := file.read(8192):
-                hasher.update(chunk)
-            
+            # Store filer: la hash-objektet lese direkte fra en minnemappet fil
+            if not (file_size > MMAP_HASH_THRESHOLD and self._hash_mapped(file, hasher)):
+                if hasattr(hashlib, 'file_digest'):
+                    # Python 3.11+: lesesløyfen kjøres i C uten Python-allokeringer per bit
+                    hashlib.file_digest(file, lambda: hasher)
+                else:
+                    # Les filen i biter og oppdater hash-objektet
+                    while chunk := file.read(HASH_CHUNK_SIZE):
+                        hasher.update(chunk)
+
             # Returner hash-verdien som en heksadesimal streng
+            if algorithm_name.lower() in PREFIXED_HASH_ALGORITHMS:
+                return f"{algorithm_name.lower()}:{hasher.hexdigest()}"
             return hasher.hexdigest()
 
-    def upload_image(self, image_path, fileHash):
+    def _hash_mapped(self, file, hasher):
+        """
+        Oppdaterer hasher direkte fra en minnemappet fil, uten kopi til Python-buffere.
+        Returnerer False hvis filen ikke kan mappes (f.eks. over sys.maxsize på 32-bit Python,
+        eller enkelte nettverksstasjoner), så kalleren kan lese den i biter i stedet.
+        """
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, OverflowError):
+            return False
+        with mapped:
+            # Filen leses én gang fra start til slutt; la kjernen lese forover (ikke på Windows)
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mapped)
+        return True
+
+    def calculate_file_hash_parallel(self, file_path, chunk_size=PARALLEL_HASH_BLOCK_SIZE, max_workers=None):
+        """
+        Blokkvis sha256: hver blokk på chunk_size bytes hashes i en egen tråd, og resultatet er
+        sha256 av blokk-digestene i rekkefølge.
+        Verdien er IKKE lik vanlig sha256 av filen, og avhenger av chunk_size, så den har
+        eget algoritmenavn (sha256-blk16m) og kan ikke sammenlignes med andre filehasher.
+        """
+        fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            file_size = os.fstat(fd).st_size
+
+            def hash_block(offset):
+                if hasattr(os, 'pread'):
+                    # pread leser på en gitt posisjon uten delt filposisjon, så trådene kan dele fd
+                    data = os.pread(fd, chunk_size, offset)
+                else:
+                    # Windows har ikke pread; hver blokk får sitt eget filhåndtak
+                    with open(file_path, 'rb') as f:
+                        f.seek(offset)
+                        data = f.read(chunk_size)
+                return hashlib.sha256(data).digest()
+
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+                digests = list(executor.map(hash_block, range(0, file_size, chunk_size)))
+        finally:
+            os.close(fd)
+
+        return hashlib.sha256(b''.join(digests)).hexdigest()
+
+    def calculate_file_hash_sampled(self, file_path, sample_size=SAMPLED_HASH_SAMPLE_SIZE):
+        """
+        Fingeravtrykk av filstørrelsen og tre utsnitt på sample_size bytes (start, midt, slutt).
+        Filer opp til SAMPLED_HASH_THRESHOLD hashes i sin helhet. Bruker alltid blake2b (stdlib),
+        så verdien er lik på alle maskiner uansett hvilke valgfrie pakker som er installert.
+        Verdien har prefikset "sampled:" og kan ikke sammenlignes med andre filehasher.
+        """
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(file_path, 'rb') as file:
+            file_size = os.fstat(file.fileno()).st_size
+            hasher.update(file_size.to_bytes(8, 'little'))
+            if file_size <= SAMPLED_HASH_THRESHOLD:
+                hasher.update(file.read())
+            else:
+                for offset in (0, (file_size - sample_size) // 2, file_size - sample_size):
+                    file.seek(offset)
+                    hasher.update(file.read(sample_size))
+        return f"{SAMPLED_HASH_ALGORITHM}:{hasher.hexdigest()}"
+
+    def iter_file_hashes(self, paths, algorithm_name=None, max_workers=1, stats=None):
+        """
+        Gir (path, filehash) i samme rekkefølge som paths etter hvert som filene er hashet,
+        mens hashingen av de neste filene fortsetter i bakgrunnen. Kalleren kan dermed starte
+        opplastingen av de første filene mens resten fortsatt leses fra disk.
+        Én hash-tråd som standard, så disken leses sekvensielt. Filer som ikke kan leses gir None.
+        stats er os.stat-resultater i samme rekkefølge som paths (None der de mangler).
+        """
+        algorithm_name = algorithm_name or self.hash_algorithm
+        paths = list(paths)
+        stats = list(stats) if stats is not None else [None] * len(paths)
+
+        def hash_one(path, stat_result):
+            try:
+                return self.calculate_file_hash(path, algorithm_name, stat_result)
+            except OSError as e:
+                logger.warning("Kunne ikke hashe %s: %s", path, e)
+                return None
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='imagegrid-hash')
+        try:
+            yield from zip(paths, executor.map(hash_one, paths, stats))
+        finally:
+            # Avbryt hashing som ikke er startet hvis kalleren slutter å lese tidlig
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        if not self.is_image_file(image_path):
-            print(f"Opplasting avbrutt. {image_path} er ikke et gyldig bilde.")
+    def upload_image(self, image_path, fileHash, validate=True, data=None):
+        """
+        Laster opp bildet hvis fileHash ikke allerede finnes i ImageGrid.
+        validate=False hopper over bildesjekken når kalleren allerede har gjort den.
+        data er JPEG-bytes som lastes opp i stedet for filen (f.eks. et nedskalert bilde fra
+        ImageProcessingService.resize_image_to_bytes); filnavnet tas fortsatt fra image_path.
+        """
+        if validate and not self.is_image_file(image_path):
+            logger.warning("Opplasting avbrutt. %s er ikke et gyldig bilde.", image_path)
             return None
 
         image_exists = self.check_image_exists(fileHash )
         if image_exists:
-            print(f"Bildet {image_path} er allerede lastet opp.")
+            logger.debug("Bildet %s er allerede lastet opp.", image_path)
             return image_exists
-        token = self.get_access_token()
-
-        headers = {
-            'Authorization': f'Bearer {token}',
-            # Ikke spesifiser 'Content-Type' for multipart, requests håndterer det automatisk
-        }
-
-        # Åpne bildet i binærmodus
-        with open(image_path, 'rb') as image_file:
+        # Åpne bildet i binærmodus, eller les det fra minnet hvis det allerede er kodet
+        with (io.BytesIO(data) if data is not None else open(image_path, 'rb')) as image_file:
             # Spesifiser filnavnet, filen og MIME-typen korrekt i files-dictionary
             utf8_filename = os.path.basename(image_path).encode('utf-8')
-            
-            files = {'file': (utf8_filename, image_file, 'image/jpeg')}
             upload_url = f"{self.imgr_api_url}/api/v1.0/moerenett/upload"
 
-            # Send POST-forespørselen med filer
-            response = requests.post(upload_url, headers=headers, files=files)
+            def body():
+                # Spol tilbake i tilfelle kallet sendes på nytt etter 401
+                image_file.seek(0)
+                fields = {'file': (utf8_filename, image_file, 'image/jpeg')}
+                if MultipartEncoder is not None:
+                    # Kroppen strømmes fra disk i stedet for å bygges opp i minnet
+                    encoder = MultipartEncoder(fields=fields)
+                    return {'data': encoder, 'headers': {'Content-Type': encoder.content_type}}
+                # Ikke spesifiser 'Content-Type' for multipart, requests håndterer det automatisk
+                return {'files': fields}
 
-            print(response.text)
+            # Send POST-forespørselen med filer
+            response = self._send('POST', upload_url, body=body, stream=True)
 
             if response.status_code == 200:
-                print("Image uploaded successfully.")
-                return response.json()
+                logger.debug("Image uploaded successfully: %s (status %s)", image_path, response.status_code)
+                # Et husket "finnes ikke" for denne hashen gjelder ikke lenger
+                with self._exists_lock:
+                    self._exists_cache.pop(fileHash, None)
+                return json_loads(response.content)
             else:
                 error_message = response.text
                 raise Exception(f"Failed to upload image: {error_message}")
@@ -146,71 +594,85 @@ class ImageGridService:
         """
         prepared_data = {}
 
-        # Sjekk om latitude og longitude er tilstede, og bygg opp lokasjonsdata
-        if "latitude" in from_record and from_record["latitude"] is not None and \
-        "longitude" in from_record and from_record["longitude"] is not None:
+        # Bygg opp lokasjonsdata hvis både latitude og longitude er satt
+        latitude = from_record.get("latitude")
+        longitude = from_record.get("longitude")
+        if latitude is not None and longitude is not None:
             prepared_data["Location"] = {
                 "type": "Point",
-                "coordinates": [
-                    float(from_record["longitude"]),
-                    float(from_record["latitude"])
-                ]
+                "coordinates": [float(longitude), float(latitude)]
             }
 
-        # Gå gjennom andre felter og legg dem til i prepared_data, ekskluder 'filename', 'longitude', og 'latitude'
-        for col, value in from_record.items():
-            if col not in ["filename", "longitude", "latitude"] and value is not None:
-                prepared_data[col] = str(value)
+        # Andre felter legges til som tekst i ett pass, unntatt 'filename', 'longitude' og 'latitude'
+        prepared_data.update(
+            (col, str(value)) for col, value in from_record.items()
+            if col not in PROCESS_RECORD_EXCLUDED and value is not None
+        )
 
-        # Konverter dictionary til JSON
-        json_data = json.dumps(prepared_data)
-        return json_data
+        # Konverter dictionary til JSON (UTF-8-bytes, klar til å sendes)
+        return json_dumps(prepared_data)
     
 
     def update_image_info(self, image_id, record, tenant_name="moerenett", schema_name="Distribusjonsnett"):
-        token = self.get_access_token()
-
         url = f"{self.imgr_api_url}api/v1.0/{tenant_name}/{schema_name}/{image_id}/runschematasks"
         
-        print(f"runschematasks_URL->>> {url}")
+        logger.debug("runschematasks_URL->>> %s", url)
 
         #print( f"Record->>> {record}")
         # Konverter 'record' til JSON
-        json_data = json.dumps(record, ensure_ascii=False)
-        json_data = json_data.encode('utf-8')
+        json_data = json_dumps(record)
         #print(f"JSON data: {json_data}")
 
-        # Sett opp headers og innhold
+        # Sett opp headers og innhold (Authorization ligger på sessionen)
         headers = {
-            'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
 
         # Send POST-forespørselen for å oppdatere bildet
-        response = requests.post(url, headers=headers, data=json_data)
-        print("Status code:", response.status_code)
-        print(response.json())
+        response = self._send('POST', url, headers=headers, data=json_data)
+        logger.debug("Status code: %s", response.status_code)
         if response.status_code == 200:
-            #   print(response.json())
-            print("Update successful.")
-            return response.json()
+            result = json_loads(response.content)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Update successful: %s", result)
+            return result
         else:
             error_message = response.text
-            print(f"Failed to update image: {image_id} {error_message}")
+            logger.warning("Failed to update image: %s %s", image_id, error_message)
             return "Update failed"
     
 
     def check_image_exists(self, fileHash):
-        
-        token = self.get_access_token()
+        """
+        Slår opp fileHash i ImageGrid. Returnerer første treff, eller False hvis bildet ikke finnes.
+        Treff huskes for resten av kjøringen; "finnes ikke" i EXISTS_NEGATIVE_TTL sekunder.
+        """
+        with self._exists_lock:
+            cached = self._exists_cache.get(fileHash)
+        if cached is not None:
+            result, checked_at = cached
+            if result or time.monotonic() - checked_at < EXISTS_NEGATIVE_TTL:
+                return result
+
+        result = self._lookup_hash(fileHash)
+        with self._exists_lock:
+            if len(self._exists_cache) >= EXISTS_CACHE_SIZE:
+                # Fjern det eldste oppslaget (dict holder innsettingsrekkefølgen)
+                self._exists_cache.pop(next(iter(self._exists_cache)))
+            self._exists_cache[fileHash] = (result, time.monotonic())
+        return result
+
+    def _lookup_hash(self, fileHash):
+        """
+        Søker etter fileHash i ImageGrid uten cache. Kaster ved feil, så feil huskes ikke.
+        """
         headers = {
-            'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
 
         check_url = f"{self.imgr_api_url}api/v1.0/{self.tenant_name}/search?key=filehash&value={fileHash}&skip=0&limit=50"
-        response = requests.get(check_url, headers=headers)
-        imageinfo = response.json()
+        response = self._send('GET', check_url, headers=headers)
+        imageinfo = json_loads(response.content)
 
         if response.status_code == 200:
             if len(imageinfo["results"]) == 0:
@@ -225,6 +687,18 @@ class ImageGridService:
             error_message = response.text
             raise Exception(f"Failed to check if image exists: {error_message}")
 
+    def close(self):
+        """
+        Lukker sessionen og tilkoblingene i poolen.
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 # Eksempel på hvordan du bruker klassen
 if __name__ == "__main__":
     try:
@@ -0,0 +1,222 @@
+import logging
+import sqlite3
+import threading
+import atexit
+import pandas as pd
+
+from models.image_info import ImageInfo
+from services.uploadtracker import CSV_ENCODING, detect_csv_encoding
+
+logger = logging.getLogger(__name__)
+
+# log_upload committer etter så mange rader (og ved flush/close), i stedet for én transaksjon per rad
+COMMIT_BATCH_SIZE = 100
+
+
+class SQLiteUploadTracker:
+    """
+    Opplastingslogg i en SQLite-database med filehash som primærnøkkel.
+    Har samme grensesnitt som ImageUploadTracker, men oppslag på filehash er et
+    indeksert SELECT i stedet for et søk gjennom hele CSV-filen.
+    """
+
+    def __init__(self, tracking_file='image_upload_log.db'):
+        self.tracking_file = tracking_file
+        self.image_info = ImageInfo()
+        self._columns = self.get_columns()
+        # Én tilkobling deles av opplastingstrådene, serialisert med låsen
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.tracking_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # I WAL-modus er NORMAL trygt mot korrupsjon; bare de siste commitene kan gå tapt ved strømbrudd
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Rader lagt inn av log_upload som ikke er committet ennå
+        self._pending = 0
+
+        column_defs = ', '.join(
+            f'"{col}" TEXT PRIMARY KEY' if col == 'filehash' else f'"{col}"'
+            for col in self._columns
+        )
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS upload_log ({column_defs})")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS upload_log_filepath ON upload_log (filepath)")
+            # Ferdigbehandlede filer med os.stat-verdiene de hadde, se has_been_seen
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_files (filepath TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, filehash TEXT)"
+            )
+
+        # Ny rad for en kjent filehash oppdaterer en rad som ikke er 'ok' (f.eks. et tidligere
+        # mislykket forsøk), men beholder første uploadtime. En fullført rad ('ok') endres aldri,
+        # som i CSV-trackeren der første rad for en filehash gjelder
+        quoted = ', '.join(f'"{col}"' for col in self._columns)
+        updates = ', '.join(f'"{col}"=excluded."{col}"' for col in self._columns if col not in ('filehash', 'uploadtime'))
+        self._upsert_sql = (
+            f"INSERT INTO upload_log ({quoted}) VALUES ({', '.join('?' * len(self._columns))}) "
+            f"ON CONFLICT(filehash) DO UPDATE SET {updates} WHERE upload_log.\"status\" IS NOT 'ok'"
+        )
+        atexit.register(self.close)
+
+    def get_columns(self):
+        """Get standardized column definitions from ImageInfo class."""
+        return self.image_info.get_log_headers()
+
+    def _to_row(self, data):
+        """
+        Konverterer en loggrad til verdier SQLite kan lagre (dict o.l. lagres som tekst).
+        """
+        if len(data) != len(self._columns):
+            raise ValueError(f"{len(self._columns)} columns passed, passed data had {len(data)} columns")
+        return [value if value is None or isinstance(value, (str, int, float)) else str(value) for value in data]
+
+    def load_dataframe(self, columns=None):
+        """
+        Leser loggen som DataFrame, kun med kolonnene i columns (alle hvis None).
+        """
+        columns = columns or self._columns
+        unknown = set(columns) - set(self._columns)
+        if unknown:
+            raise ValueError(f"Ukjente kolonner: {sorted(unknown)}")
+
+        quoted = ', '.join(f'"{col}"' for col in columns)
+        with self._lock:
+            df = pd.read_sql_query(f"SELECT {quoted} FROM upload_log ORDER BY rowid", self._conn)
+        if 'status' in df.columns:
+            df['status'] = df['status'].astype('category')
+        return df
+
+    def invalidate_index(self):
+        """
+        Ingen minneindeks å forkaste; finnes for samme grensesnitt som CSV-trackeren.
+        """
+
+    def get_upload_status(self, filehash):
+        """
+        Returnerer status for filehash fra loggen, eller None hvis den ikke er logget.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM upload_log WHERE filehash = ?", (filehash,)).fetchone()
+        return row[0] if row else None
+
+    def has_been_uploaded(self, filehash):
+        """
+        Sjekker om bildet allerede er lastet opp basert på filehash.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uploadtime, updatetime FROM upload_log WHERE filehash = ?", (filehash,)
+            ).fetchone()
+        logger.debug("Checking upload status for filehash %s: %s in log.", filehash, 'found' if row else 'not found')
+        if row:
+            return True, row[0], row[1]
+        return False, None, None
+
+    def path_has_been_uploaded(self, filepath):
+        """
+        Sjekker om bildet allerede er lastet opp basert på filepath.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uploadtime, updatetime FROM upload_log WHERE filepath = ? ORDER BY rowid LIMIT 1", (filepath,)
+            ).fetchone()
+        if row:
+            return True, row[0], row[1]
+        return False, None, None
+
+    def has_been_seen(self, filepath, mtime_ns, size):
+        """
+        Sjekker om filen er ferdigbehandlet tidligere og ikke endret siden (samme mtime og størrelse).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, size FROM seen_files WHERE filepath = ?", (filepath,)
+            ).fetchone()
+        return row is not None and row[0] == mtime_ns and row[1] == size
+
+    def mark_seen(self, filepath, mtime_ns, size, filehash):
+        """
+        Husker at filen (med denne mtime og størrelsen) er ferdigbehandlet. Committes sammen med log_upload.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO seen_files (filepath, mtime_ns, size, filehash) VALUES (?, ?, ?, ?)",
+                (filepath, mtime_ns, size, filehash)
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_BATCH_SIZE:
+                self._commit()
+
+    def log_upload(self, data):
+        """
+        Legger inn eller oppdaterer raden. Radene committes i batcher på COMMIT_BATCH_SIZE;
+        oppslag via trackeren ser dem med en gang, andre prosesser etter commit.
+        """
+        row = self._to_row(data)
+        with self._lock:
+            self._conn.execute(self._upsert_sql, row)
+            self._pending += 1
+            if self._pending >= COMMIT_BATCH_SIZE:
+                self._commit()
+        record = dict(zip(self._columns, data))
+        logger.debug("Bildet %s ble lastet opp og logget med filehash %s.", record['filename'], record['filehash'])
+
+    def remove_duplicates(self):
+        """
+        filehash er primærnøkkel, så loggen kan ikke inneholde duplikater.
+        """
+        return 0
+
+    def get_number_of_uploads(self):
+        """
+        Returnerer antall opplastinger i loggen.
+        """
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM upload_log GROUP BY status").fetchall())
+        return counts.get('ok', 0), counts.get('failed', 0)
+
+    def import_csv(self, csv_path):
+        """
+        Engangsimport av en eksisterende CSV-logg (semikolon, UTF-8 eller eldre ANSI-tegnsett).
+        Rader med samme filehash slås sammen; første uploadtime beholdes.
+
+        Returns:
+            int: Antall rader lest fra CSV-filen
+        """
+        df = pd.read_csv(csv_path, sep=';', encoding=detect_csv_encoding(csv_path), usecols=lambda col: col in self._columns)
+        df = df.reindex(columns=self._columns)
+        df = df.astype(object).where(df.notna(), None)
+        rows = [self._to_row(row) for row in df.itertuples(index=False, name=None)]
+        with self._lock, self._conn:
+            self._conn.executemany(self._upsert_sql, rows)
+        print(f"Importerte {len(rows)} rader fra {csv_path} til {self.tracking_file}")
+        return len(rows)
+
+    def to_csv(self, csv_path):
+        """
+        Eksporterer loggen til CSV i samme format som ImageUploadTracker.
+        """
+        self.load_dataframe().to_csv(csv_path, sep=';', index=False, encoding=CSV_ENCODING)
+
+    def _commit(self):
+        """
+        Committer rader fra log_upload. Må kalles med self._lock holdt.
+        """
+        self._conn.commit()
+        self._pending = 0
+
+    def flush(self):
+        """
+        Committer rader fra log_upload som ikke er committet ennå.
+        """
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """
+        Committer gjenværende rader og lukker databasen. Kalles automatisk ved avslutning.
+        """
+        with self._lock:
+            if self._conn is None:
+                return
+            self._commit()
+            self._conn.close()
+            self._conn = None
@@ -2,6 +2,13 @@ import os
 import pandas as pd
 from datetime import datetime
 import sys
+import threading
+import time
+import queue
+import csv
+import atexit
+import logging
+from collections import Counter
 
 # Add models directory to path
 models_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
@@ -9,81 +16,353 @@ if models_path not in sys.path:
     sys.path.append(models_path)
 
 from models.image_info import ImageInfo
+from services.cache import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+# Skriveren samler opptil så mange rader før de legges til i CSV-filen i ett kall
+WRITE_BATCH_SIZE = 64
+# ... eller venter maks så lenge (sekunder) på flere rader etter den første
+WRITE_BATCH_WAIT = 0.2
+
+# Loggen lagres som UTF-8 med BOM, så Excel fortsatt åpner den med riktige tegn.
+# Eldre logger skrevet med encoding='ansi' (cp1252) konverteres én gang ved oppstart.
+CSV_ENCODING = 'utf-8-sig'
+LEGACY_CSV_ENCODING = 'ansi'
+
+_STOP = object()
+
+
+def detect_csv_encoding(path):
+    """
+    Returnerer CSV_ENCODING hvis filen er gyldig UTF-8 (med eller uten BOM), ellers LEGACY_CSV_ENCODING.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return LEGACY_CSV_ENCODING
+    return CSV_ENCODING
+
+
+def convert_legacy_csv(path):
+    """
+    Skriver en ANSI-kodet logg om til CSV_ENCODING på stedet. Returnerer True hvis filen ble konvertert.
+    """
+    if detect_csv_encoding(path) == CSV_ENCODING:
+        return False
+    with open(path, 'r', newline='', encoding=LEGACY_CSV_ENCODING, errors='replace') as f:
+        text = f.read()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding=CSV_ENCODING) as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    logger.info("Konverterte %s fra %s til %s.", path, LEGACY_CSV_ENCODING, CSV_ENCODING)
+    return True
+
 
 class ImageUploadTracker:
 
     def __init__(self, tracking_file='image_upload_log.csv'):
         self.tracking_file = tracking_file
         self.image_info = ImageInfo()
+        # Serialiserer lesing/skriving av CSV-filen når flere opplastingstråder deler trackeren
+        self._lock = threading.Lock()
+        # Holdes mens CSV-filen skrives (av skrivetråden eller remove_duplicates). Tas etter self._lock
+        # når begge trengs; skrivetråden tar bare denne, så flush() kan kalles med self._lock holdt
+        self._file_lock = threading.Lock()
+        # Lazy-lastet indeks over filehash -> (status, uploadtime, updatetime)
+        self._index = None
+        # filepath -> (uploadtime, updatetime), bygget sammen med indeksen
+        self._path_index = None
+        # Antall rader per status, bygget sammen med indeksen og oppdatert ved hver log_upload
+        self._status_counts = None
+        # Sist leste DataFrame, nøklet på (mtime, størrelse, kolonner) for loggfilen
+        self._df_cache = None
+        # Ferdigbehandlede filer: filepath -> [mtime_ns, størrelse, filehash], i en fil ved siden av loggen
+        self._seen = None
+        self._seen_lock = threading.Lock()
+        # Én bakgrunnstråd skriver loggrader i batcher, så opplastingstrådene slipper å vente på disk
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, name='upload-log-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
         
-        # Sjekk om CSV-filen finnes, hvis ikke, opprett den med de ønskede feltene
+        # Sjekk om CSV-filen finnes, hvis ikke, opprett den med bare overskriftsraden
         if not os.path.exists(self.tracking_file):
-            # Opprett en tom DataFrame med de nødvendige kolonnene
-            columns = self.get_columns()
-            df = pd.DataFrame(columns=columns)
-            # Lagre DataFrame som CSV med semikolon som separator og ANSI-tegnsett
-            df.to_csv(self.tracking_file, sep=';', index=False, encoding='ansi')
+            self._write_rows([])
+        else:
+            convert_legacy_csv(self.tracking_file)
 
     def get_columns(self):
         """Get standardized column definitions from ImageInfo class."""
         return self.image_info.get_log_headers()
     
+    def load_dataframe(self, columns=None):
+        """
+        Leser loggfilen som DataFrame, kun med kolonnene i columns (alle hvis None).
+        Resultatet gjenbrukes så lenge filen ikke er endret på disk, så flere
+        statistikk-/oppryddingskall i samme kjøring parser CSV-filen bare én gang.
+        Returnert DataFrame deles mellom kallere og skal ikke endres.
+        """
+        # Ta med rader som fortsatt ligger i skrivekøen
+        self.flush()
+        return self._read_dataframe(columns)
+
+    def _read_dataframe(self, columns=None):
+        """
+        Som load_dataframe, men uten å vente på skrivekøen.
+        """
+        if not os.path.exists(self.tracking_file):
+            return pd.DataFrame(columns=columns or self.get_columns())
+
+        stat = os.stat(self.tracking_file)
+        key = (stat.st_mtime_ns, stat.st_size, tuple(columns) if columns else None)
+        cache = self._df_cache
+        if cache is not None and cache[0] == key:
+            return cache[1]
+
+        # Smale kolonner og faste dtypes: filehash som streng, status som kategori
+        dtype = {'filehash': 'string', 'status': 'category'}
+        if columns:
+            dtype = {col: kind for col, kind in dtype.items() if col in columns}
+        df = pd.read_csv(self.tracking_file, sep=';', encoding=CSV_ENCODING, engine='c',
+                         usecols=columns, dtype=dtype)
+        self._df_cache = (key, df)
+        return df
+
+    def _ensure_index(self):
+        """
+        Bygger en minneindeks filehash -> (status, uploadtime, updatetime), filepath-indeksen og tellingen per status
+        første gang de trengs, slik at oppslag ikke leser hele CSV-filen på nytt for hvert bilde.
+        Filen leses i ett pass med csv-modulen, uten å bygge en DataFrame.
+        Må kalles med self._lock holdt.
+        """
+        if self._index is not None:
+            return
+
+        # Ta med rader som fortsatt ligger i skrivekøen
+        self.flush()
+
+        index = {}
+        path_index = {}
+        status_counts = Counter()
+        if os.path.exists(self.tracking_file):
+            with open(self.tracking_file, 'r', newline='', encoding=CSV_ENCODING, errors='replace') as f:
+                reader = csv.reader(f, delimiter=';')
+                header = next(reader, None)
+                if header:
+                    positions = [header.index(col) for col in ('filehash', 'status', 'uploadtime', 'updatetime')]
+                    # Eldre logger kan mangle filepath-kolonnen
+                    path_position = header.index('filepath') if 'filepath' in header else None
+                    for row in reader:
+                        if len(row) != len(header):
+                            continue
+                        # Tomme felt tilsvarer manglende verdier
+                        filehash, status, uploadtime, updatetime = (row[i] or None for i in positions)
+                        status_counts[status] += 1
+                        # Første rad for hver filehash/filepath vinner, som ved oppslag direkte i CSV-filen
+                        index.setdefault(filehash, (status, uploadtime, updatetime))
+                        if path_position is not None and row[path_position]:
+                            path_index.setdefault(row[path_position], (uploadtime, updatetime))
+        self._index = index
+        self._path_index = path_index
+        self._status_counts = status_counts
+
+    def invalidate_index(self):
+        """
+        Forkaster minneindeksen, f.eks. etter at CSV-filen er skrevet om utenfor trackeren.
+        """
+        with self._lock:
+            self._index = None
+            self._path_index = None
+            self._status_counts = None
+
+    def get_upload_status(self, filehash):
+        """
+        Returnerer status for filehash fra loggen, eller None hvis den ikke er logget.
+        """
+        with self._lock:
+            self._ensure_index()
+            entry = self._index.get(filehash)
+        return entry[0] if entry else None
+
     def has_been_uploaded(self, filehash):
         """
         Sjekker om bildet allerede er lastet opp basert på filehash.
         """
-        if os.path.exists(self.tracking_file):
-            df = pd.read_csv(self.tracking_file, sep=';', encoding='ansi')
-            # Sjekk om filehash finnes i DataFrame
-            row = df[df['filehash'] == filehash]
-            print(f"Checking upload status for filehash {filehash}: Found {len(row)} entries.")
-            if not row.empty:
-                return True, row.iloc[0]['uploadtime'], row.iloc[0]['updatetime']
+        with self._lock:
+            self._ensure_index()
+            entry = self._index.get(filehash)
+        logger.debug("Checking upload status for filehash %s: %s in log.", filehash, 'found' if entry else 'not found')
+        if entry:
+            return True, entry[1], entry[2]
         return False, None, None
 
     def path_has_been_uploaded(self, filepath):
         """
         Sjekker om bildet allerede er lastet opp basert på filepath.
         """
-        if os.path.exists(self.tracking_file):
-            df = pd.read_csv(self.tracking_file, sep=';', encoding='ansi')
-            # Sjekk om filepath finnes i DataFrame
-            row = df[df['filepath'] == filepath]
-            if not row.empty:
-                return True, row.iloc[0]['uploadtime'], row.iloc[0]['updatetime']
+        with self._lock:
+            self._ensure_index()
+            entry = self._path_index.get(filepath)
+        if entry:
+            return True, entry[0], entry[1]
         return False, None, None
 
+    def _seen_store(self):
+        """
+        Åpner filen med ferdigbehandlede filer første gang den trengs.
+        """
+        with self._seen_lock:
+            if self._seen is None:
+                self._seen = SQLiteCache(self.tracking_file + '.seen.sqlite')
+            return self._seen
+
+    def has_been_seen(self, filepath, mtime_ns, size):
+        """
+        Sjekker om filen er ferdigbehandlet tidligere og ikke endret siden (samme mtime og størrelse).
+        Billig sjekk med os.stat-verdier, så uendrede filer kan hoppes over uten å hashes.
+        """
+        entry = self._seen_store().get(filepath)
+        return entry is not None and entry[0] == mtime_ns and entry[1] == size
+
+    def mark_seen(self, filepath, mtime_ns, size, filehash):
+        """
+        Husker at filen (med denne mtime og størrelsen) er ferdigbehandlet, se has_been_seen.
+        """
+        self._seen_store().set(filepath, [mtime_ns, size, filehash])
+
     def log_upload(self, data):
-        # Last inn eksisterende CSV, eller opprett en ny DataFrame hvis filen ikke finnes
-        if os.path.exists(self.tracking_file):
-            df = pd.read_csv(self.tracking_file, sep=';', encoding='ansi')
+        """
+        Legger en loggrad i kø for bakgrunnsskriveren. Minneindeksen oppdateres med en gang,
+        slik at has_been_uploaded ser raden før den er skrevet til disk.
+        """
+        columns = self.get_columns()
+        if len(data) != len(columns):
+            raise ValueError(f"{len(columns)} columns passed, passed data had {len(data)} columns")
+        row = dict(zip(columns, data))
+
+        with self._lock:
+            if self._index is not None:
+                self._index.setdefault(row['filehash'], (row['status'], row['uploadtime'], row['updatetime']))
+                if row['filepath']:
+                    self._path_index.setdefault(row['filepath'], (row['uploadtime'], row['updatetime']))
+                self._status_counts[row['status']] += 1
+
+        if self._closed:
+            self._write_rows([data])
         else:
-            columns = self.get_columns()
-            df = pd.DataFrame(columns=columns)
-        
-        # Legg til den nye opplastingen i DataFrame
-        new_data = pd.DataFrame([data], columns=df.columns)
-        df = pd.concat([df, new_data], ignore_index=True)
-        
-        # Lagre DataFrame tilbake til CSV med semikolon som separator og ANSI-tegnsett
-        df.to_csv(self.tracking_file, sep=';', index=False, encoding='ansi')
-        print(f"Bildet {data[0]} ble lastet opp og logget med filehash {data[9]}.")
+            self._queue.put(list(data))
+        logger.debug("Bildet %s ble lastet opp og logget med filehash %s.", row['filename'], row['filehash'])
+
+    def _writer_loop(self):
+        """
+        Tømmer køen i batcher på opptil WRITE_BATCH_SIZE rader og legger dem til i CSV-filen.
+        """
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_BATCH_WAIT
+            while len(batch) < WRITE_BATCH_SIZE and batch[-1] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is _STOP
+            rows = [row for row in batch if row is not _STOP]
+            try:
+                if rows:
+                    self._write_rows(rows)
+            except Exception as e:
+                logger.error("Kunne ikke skrive %s rader til %s: %s", len(rows), self.tracking_file, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_rows(self, rows):
+        """
+        Legger rader til i CSV-filen med samme format som pandas (semikolon, UTF-8 med BOM).
+        BOM skrives bare når filen opprettes.
+        """
+        with self._file_lock:
+            write_header = not os.path.exists(self.tracking_file)
+            with open(self.tracking_file, 'a', newline='', encoding=CSV_ENCODING) as f:
+                writer = csv.writer(f, delimiter=';', lineterminator='\n')
+                if write_header:
+                    writer.writerow(self.get_columns())
+                writer.writerows(rows)
+                f.flush()
+
+    def flush(self):
+        """
+        Venter til alle loggrader i køen er skrevet til CSV-filen.
+        """
+        if not self._closed:
+            self._queue.join()
+
+    def close(self):
+        """
+        Skriver gjenværende rader og stopper bakgrunnsskriveren. Kalles automatisk ved avslutning.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def remove_duplicates(self):
+        """
+        Fjerner duplikater fra loggen og beholder nyeste rad (updatetime) for hver filehash.
+        Returnerer antall fjernede rader.
+        """
+        # Skriv køede rader først, og hold skrivetråden ute mens filen leses og skrives om,
+        # så rader som logges underveis verken går tapt eller blandes inn i omskrivingen
+        self.flush()
+        with self._lock, self._file_lock:
+            df = self._read_dataframe()
+
+            # Nyeste rad per filehash i ett gruppert pass (ingen full sortering).
+            # Tider som ikke kan tolkes regnes som eldst, som NaT sist ved sortering før.
+            # Tidene brukes bare til rangering, så updatetime skrives tilbake uendret
+            ranked = pd.to_datetime(df['updatetime'], format='%Y-%m-%d %H:%M:%S',
+                                    errors='coerce', cache=True).fillna(pd.Timestamp.min)
+            keep_idx = ranked.groupby(df['filehash'], sort=False, dropna=False).idxmax()
+            df_cleaned = df.loc[keep_idx.sort_values()]
+
+            df_cleaned.to_csv(self.tracking_file, sep=';', index=False, encoding=CSV_ENCODING, lineterminator='\n')
+            self._index = None
+            self._path_index = None
+            self._status_counts = None
+
+        return len(df) - len(df_cleaned)
 
     def get_number_of_uploads(self):
         """
         Returnerer antall opplastinger i loggen.
         """
         if os.path.exists(self.tracking_file):
-            df = pd.read_csv(self.tracking_file, sep=';', encoding='ansi')
+            # Tellingen bygges med indeksen og holdes oppdatert av log_upload
+            with self._lock:
+                self._ensure_index()
+                return self._status_counts['ok'], self._status_counts['failed']
+        return 0
 
-            # Filtrer DataFrame for rader der status er 'opplastet' (eller tilsvarende)
-            uploaded_df = df[df['status'] == 'ok']
-            failed_df = df[df['status'] == 'failed']
 
-            # Tell antall rader med status 'opplastet'
-            #antall_opplastet = len(opplastet_df), len(failed_df)
-            return len(uploaded_df), len(failed_df)
-        return 0
+def create_upload_tracker(tracking_file='image_upload_log.csv'):
+    """
+    Returnerer SQLiteUploadTracker for .db/.sqlite-filer, ellers CSV-baserte ImageUploadTracker.
+    """
+    if os.path.splitext(tracking_file)[1].lower() in ('.db', '.sqlite', '.sqlite3'):
+        from services.sqlitetracker import SQLiteUploadTracker
+        return SQLiteUploadTracker(tracking_file)
+    return ImageUploadTracker(tracking_file)
 
 
 # Eksempel på bruk
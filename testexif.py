@@ -2,6 +2,8 @@ import subprocess
 import sys
 import os
 import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import xml.etree.ElementTree as ET
 import piexif
@@ -16,6 +18,49 @@ def check_exiftool():
     except (subprocess.CalledProcessError, FileNotFoundError):
         return False
 
+# Only the GPS tags are needed from exiftool when scanning many files
+EXIFTOOL_GPS_TAGS = ['-GPSLatitude', '-GPSLongitude', '-GPSLatitudeRef', '-GPSLongitudeRef']
+
+def scan_exif_batch(paths):
+    """
+    Reads the GPS tags for many files (images and .nksc sidecars) with a single exiftool process,
+    instead of starting exiftool once per file.
+    Returns a dict normalized path -> exiftool JSON record, for the files exiftool could read.
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+
+    # Pass the file list through an argfile so it is not limited by the command line length
+    with tempfile.NamedTemporaryFile('w', suffix='.args', delete=False, encoding='utf-8') as argfile:
+        argfile.write('\n'.join(paths))
+    try:
+        # -fast2 stops before maker notes; exit code is non-zero if any single file fails
+        result = subprocess.run(
+            ['exiftool', '-charset', 'filename=utf8', '-j', '-fast2', *EXIFTOOL_GPS_TAGS, '-@', argfile.name],
+            capture_output=True, text=True, encoding='utf-8'
+        )
+    finally:
+        os.remove(argfile.name)
+
+    if not result.stdout.strip():
+        return {}
+    return {os.path.normpath(record['SourceFile']): record for record in json.loads(result.stdout)}
+
+def _exiftool_record(path, metadata=None):
+    """
+    exiftool JSON record for path, from prefetched metadata (see scan_exif_batch) when given,
+    otherwise from a separate exiftool call. Returns None if prefetched metadata has no record.
+    """
+    if metadata is not None:
+        return metadata.get(os.path.normpath(path))
+    result = subprocess.run([
+        'exiftool', 
+        '-j',  # JSON output
+        path
+    ], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip())[0]
+
 def parse_dms_string(dms_str):
     """
     Parse DMS string like '59,30,7.123' to decimal degrees.
@@ -57,32 +102,51 @@ def get_decimal_from_dms(dms, ref):
     except (IndexError, TypeError, ZeroDivisionError, ValueError):
         return 0.0
 
-def print_exif_data(image_path):
+def print_exif_data(image_path, fallback_exiftool=False, metadata=None):
     """
     Reads and prints GPS data from an image file using piexif, checks XMP, sidecar .nksc file, dumps all metadata to JSON, and saves raw EXIF data.
+
+    piexif is tried first and needs no external process. exiftool (for the .nksc sidecar and the
+    full JSON dump) is only started when fallback_exiftool is True and no GPS was found otherwise.
+    metadata is an optional dict from scan_exif_batch; the sidecar and image records are then
+    taken from it instead of starting exiftool (the dump then only holds the GPS tags).
     """
-    if not check_exiftool():
-        print("exiftool is not installed. Please download and install it from https://exiftool.org/ and add it to your PATH.")
-        return
-    
     if not os.path.exists(image_path):
         print(f"File not found: {image_path}")
         return
     
     try:
         # Open image with PIL for XMP and raw EXIF
-        image = Image.open(image_path)
-        
+        with Image.open(image_path) as image:
+            exif_bytes = image.info.get('exif')
+            xmp_data = image.info.get('xmp')
+
         # Save raw EXIF data
-        if 'exif' in image.info:
+        if exif_bytes:
             exif_file = image_path + '.exif'
             with open(exif_file, 'wb') as f:
-                f.write(image.info['exif'])
+                f.write(exif_bytes)
             print(f"Raw EXIF data saved to {exif_file}")
         else:
             print("No EXIF data found in image.")
+
+        # Extract GPS from EXIF using piexif (the common case, no subprocess needed)
+        if exif_bytes:
+            exif_dict = piexif.load(exif_bytes)
+            if 'GPS' in exif_dict and exif_dict['GPS']:
+                gps = exif_dict['GPS']
+                if piexif.GPSIFD.GPSLatitude in gps and piexif.GPSIFD.GPSLongitude in gps:
+                    lat = get_decimal_from_dms(gps[piexif.GPSIFD.GPSLatitude], 
+                                             gps.get(piexif.GPSIFD.GPSLatitudeRef, b'N').decode())
+                    lon = get_decimal_from_dms(gps[piexif.GPSIFD.GPSLongitude], 
+                                             gps.get(piexif.GPSIFD.GPSLongitudeRef, b'E').decode())
+                    
+                    print("GPS from EXIF (piexif):")
+                    print(f"Latitude: {lat}")
+                    print(f"Longitude: {lon}")
+                    print("\n" + "=" * 50)
+                    return  # If found in EXIF, stop here
         
-        xmp_data = image.info.get('xmp')
         if xmp_data:
             print("XMP data found:")
             print(xmp_data)
@@ -116,19 +180,20 @@ def print_exif_data(image_path):
         else:
             print("No XMP data found.")
         
+        if not fallback_exiftool:
+            print("No GPS found (run with fallback_exiftool=True to check the .nksc sidecar and dump all metadata).")
+            return
+
+        if metadata is None and not check_exiftool():
+            print("exiftool is not installed. Please download and install it from https://exiftool.org/ and add it to your PATH.")
+            return
+
         # Check for Nikon sidecar .nksc file
         sidecar_path = os.path.splitext(image_path)[0] + '.nksc'
         if os.path.exists(sidecar_path):
             print(f"Nikon sidecar file found: {sidecar_path}")
             try:
-                result = subprocess.run([
-                    'exiftool', 
-                    '-j',  # JSON output
-                    sidecar_path
-                ], capture_output=True, text=True, check=True)
-                
-                sidecar_json = result.stdout.strip()
-                sidecar_data = json.loads(sidecar_json)[0]
+                sidecar_data = _exiftool_record(sidecar_path, metadata) or {}
                 
                 lat = sidecar_data.get('GPSLatitude')
                 lon = sidecar_data.get('GPSLongitude')
@@ -153,31 +218,9 @@ def print_exif_data(image_path):
         else:
             print("No Nikon sidecar .nksc file found.")
         
-        # Extract GPS from EXIF using piexif
-        if 'exif' in image.info:
-            exif_dict = piexif.load(image.info['exif'])
-            if 'GPS' in exif_dict and exif_dict['GPS']:
-                gps = exif_dict['GPS']
-                if piexif.GPSIFD.GPSLatitude in gps and piexif.GPSIFD.GPSLongitude in gps:
-                    lat = get_decimal_from_dms(gps[piexif.GPSIFD.GPSLatitude], 
-                                             gps.get(piexif.GPSIFD.GPSLatitudeRef, b'N').decode())
-                    lon = get_decimal_from_dms(gps[piexif.GPSIFD.GPSLongitude], 
-                                             gps.get(piexif.GPSIFD.GPSLongitudeRef, b'E').decode())
-                    
-                    print("GPS from EXIF (piexif):")
-                    print(f"Latitude: {lat}")
-                    print(f"Longitude: {lon}")
-                    print("\n" + "=" * 50)
-                    return  # If found in EXIF, stop here
-        
         # If no GPS found, dump all metadata
-        result = subprocess.run([
-            'exiftool', 
-            '-j',  # JSON output
-            image_path
-        ], capture_output=True, text=True, check=True)
-        
-        json_output = result.stdout.strip()
+        data = _exiftool_record(image_path, metadata) or {'SourceFile': image_path}
+        json_output = json.dumps([data], indent=4, ensure_ascii=False)
         
         # Save to JSON file
         json_file = 'exifdump2.json'
@@ -186,9 +229,6 @@ def print_exif_data(image_path):
         
         print(f"All metadata dumped to {json_file}")
         
-        # Parse JSON for GPS (fallback)
-        data = json.loads(json_output)[0]
-        
         print(f"GPS data for {image_path}:")
         print("=" * 50)
         
@@ -222,10 +262,29 @@ def print_exif_data(image_path):
     except Exception as e:
         print(f"Error processing {image_path}: {e}")
 
+def print_exif_data_batch(paths, workers=None, fallback_exiftool=False):
+    """
+    Runs print_exif_data for many images in separate processes (piexif is pure Python,
+    so threads would be serialized by the GIL).
+    """
+    paths = list(paths)
+    metadata = [None] * len(paths)
+    if fallback_exiftool and check_exiftool():
+        # One exiftool process for all images and sidecars instead of up to two per image
+        sidecars = [os.path.splitext(path)[0] + '.nksc' for path in paths]
+        scanned = scan_exif_batch(paths + [sidecar for sidecar in sidecars if os.path.exists(sidecar)])
+        metadata = [
+            {key: scanned[key] for key in (os.path.normpath(path), os.path.normpath(sidecar)) if key in scanned}
+            for path, sidecar in zip(paths, sidecars)
+        ]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        list(executor.map(print_exif_data, paths, [fallback_exiftool] * len(paths), metadata))
+
 if __name__ == "__main__":
     """ if len(sys.argv) != 2:
         print("Usage: python exif_inspector.py <image_path>")
         sys.exit(1) """
 
+    fallback_exiftool = '--fallback-exiftool' in sys.argv
     image_path = 'T:\\Linjebefaring2014\\Netteier_SFE\\Befaring_1656\\befaringsbilder\\_SF6_7837.JPG'
-    print_exif_data(image_path)
\ No newline at end of file
+    print_exif_data(image_path, fallback_exiftool)
\ No newline at end of file
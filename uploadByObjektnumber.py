@@ -4,10 +4,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from datetime import datetime
 from dotenv import load_dotenv
 from services.imagegrid import ImageGridService
-from services.uploadtracker import ImageUploadTracker
+from services.uploadtracker import ImageUploadTracker, CSV_ENCODING
 from services.findnearast import FindNearestService
 from services.arcgis import ArcGISService
-from services.image_processing import ImageProcessingService
+from services.image_processing import ImageProcessingService, iter_image_entries
 import pandas as pd
 
 # Load environment variables from .env file
@@ -37,7 +37,7 @@ class ToppbefaringUploader:
 
         # Load tracking data
         try:
-            self.df = pd.read_csv(self.tracking_file, sep=';', encoding='ansi')
+            self.df = pd.read_csv(self.tracking_file, sep=';', encoding=CSV_ENCODING)
             self.existing_files = set(self.df['filepath'].dropna().tolist())
         except FileNotFoundError:
             self.df = pd.DataFrame()
@@ -47,7 +47,6 @@ class ToppbefaringUploader:
         upload_result = None
         try:
             # Handle resizing if requested
-            upload_path = image_path
             max_width = 7680 
             max_height = 4320
             quality = 90
@@ -66,7 +65,7 @@ class ToppbefaringUploader:
                 return "Skipped" """
             
             # Calculate file hash (use original path for tracking)
-            file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
+            file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
             
             #print(f"Checking if image {os.path.basename(image_path)} exists in ImageGrid...")
             exist_in_imagegrid = self.image_service.check_image_exists(file_hash)
@@ -122,11 +121,12 @@ class ToppbefaringUploader:
                 #return None
 
             else:
-                upload_path = self.image_processor.resize_image_with_exif(
+                # Resized in memory (None when the image already fits), so no temporary file is written
+                resized = self.image_processor.resize_image_to_bytes(
                     image_path, max_width, max_height, quality
                 )
                 # Upload the image
-                upload_result = self.image_service.upload_image(upload_path, file_hash)
+                upload_result = self.image_service.upload_image(image_path, file_hash, data=resized)
 
                 #print(f"Upload result: {upload_result}")
 
@@ -136,13 +136,6 @@ class ToppbefaringUploader:
                     # continue to finally block for logging
                     return None
 
-                # Delete the resized file if it was created
-                try:
-                    if upload_path != image_path and os.path.exists(upload_path):
-                        os.remove(upload_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete temporary file {upload_path}: {str(e)}")
-
                 image_id = upload_result.get('id') if upload_result else None
 
                 status = "new_image"
@@ -158,9 +151,6 @@ class ToppbefaringUploader:
             combined_attributes.update(mast_attributes)
 
             #print(f"mast_attributes attributes: {mast_attributes}")
-            # Add GPS coordinates if available
-            if latitude and longitude:
-                longitude, latitude = self.arcgis_service.transform_utm_to_gps(mast_attributes.get('geometry', {}).get('x', longitude), mast_attributes.get('geometry', {}).get('y', latitude))
 
             print(f"Combined attributes for {os.path.basename(image_path)}: {combined_attributes}")
 
@@ -226,7 +216,7 @@ class ToppbefaringUploader:
             # Log failed upload attempt
             try:
                 filename = os.path.basename(image_path)
-                file_hash = self.image_service.calculate_file_hash(image_path, 'md5') if hasattr(self, 'image_service') else 'unknown'
+                file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm) if hasattr(self, 'image_service') else 'unknown'
                 # Lag failed_data med samme rekkefølge og antall kolonner som log_data/imageinfo
                 failed_data = [
                     filename,                # filename
@@ -266,12 +256,8 @@ class ToppbefaringUploader:
         failed_count = 0
         skipped_count = 0
 
-        # Get list of image files first
-        image_files = []
-        for root, dirs, files in os.walk(folder_path):
-            for filename in files:
-                if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                    image_files.append(os.path.join(root, filename))
+        # Get list of image files first (also in subfolders)
+        image_files = [entry.path for entry in iter_image_entries(folder_path, recursive=True)]
 
         total_files = len(image_files)
         print(f"Found {total_files} image files to process")
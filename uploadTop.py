@@ -1,11 +1,13 @@
 import os
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from services.imagegrid import ImageGridService
 from services.uploadtracker import ImageUploadTracker
 from services.findnearast import FindNearestService
 from services.arcgis import ArcGISService
-from services.image_processing import ImageProcessingService
+from services.image_processing import ImageProcessingService, iter_image_entries
+from models.upload_outcome import UploadOutcome
 
 # Load environment variables from .env file
 load_dotenv()
@@ -31,23 +33,32 @@ class ToppbefaringUploader:
         self.image_processor = ImageProcessingService()
         self.tenant_name = "moerenett"
         self.schema_name = "Toppbefaring"
+        # Images are uploaded in parallel; each one mostly waits on HTTP round trips
+        self.max_workers = self.image_service.max_concurrency
 
-    def upload_toppbefaring_image(self, image_path, base_attributes, find_mast=True, resize_options=None):
+    def upload_toppbefaring_image(self, image_path, base_attributes, find_mast=True, resize_options=None, file_hash=None):
+        """
+        Upload a toppbefaring image and log it in the tracker.
+        file_hash is the hash of image_path if the caller already has it; computed here otherwise.
+
+        Returns:
+            UploadOutcome: status ('ok', 'skipped' or 'failed'), the file hash and the upload result
+        """
         try:
             # Handle resizing if requested
-            upload_path = image_path
             max_width = 7680 
             max_height = 4320
             quality = 90
             
             # Calculate file hash (use original path for tracking)
-            file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
+            if file_hash is None:
+                file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
 
             # Check if already uploaded
             is_uploaded, upload_time, update_time = self.tracker.has_been_uploaded(file_hash)
             if is_uploaded:
                 print(f"Image {os.path.basename(image_path)} already uploaded at {upload_time}")
-                return None
+                return UploadOutcome("skipped", file_hash)
             
             print(f"Checking if image {os.path.basename(image_path)} exists in ImageGrid...")
             exist_in_imagegrid = self.image_service.check_image_exists(file_hash)
@@ -72,7 +83,7 @@ class ToppbefaringUploader:
                     "exists_in_imagegrid"
                 ]
                 self.tracker.log_upload(log_data)
-                return None
+                return UploadOutcome("skipped", file_hash)
             
             
             # Get GPS coordinates from image (use upload path for EXIF data)
@@ -103,26 +114,20 @@ class ToppbefaringUploader:
                         "No nearby mast found"
                     ]
                     self.tracker.log_upload(log_data)
-                    return None
+                    return UploadOutcome("skipped", file_hash)
                 
-            upload_path = self.image_processor.resize_image_with_exif(
+            # Resized in memory (None when the image already fits), so no temporary file is written
+            resized = self.image_processor.resize_image_to_bytes(
                 image_path, max_width, max_height, quality
             )
             # Upload the image
-            upload_result = self.image_service.upload_image(upload_path, file_hash)
+            upload_result = self.image_service.upload_image(image_path, file_hash, data=resized)
 
             print(f"Upload result: {upload_result}")
 
             if not upload_result:
                 print(f"Failed to upload {image_path}")
-                return None
-
-            # Delete the resized file if it was created
-            try:
-                if upload_path != image_path and os.path.exists(upload_path):
-                    os.remove(upload_path)
-            except Exception as e:
-                print(f"Warning: Could not delete temporary file {upload_path}: {str(e)}")
+                return UploadOutcome("failed", file_hash)
 
             image_id = upload_result.get('id')
 
@@ -130,11 +135,10 @@ class ToppbefaringUploader:
             #image_id = '04ea4093-eac9-4330-b102-423549138bbb'
             if not image_id:
                 print(f"No ID returned for {image_path}")
-                return None
+                return UploadOutcome("failed", file_hash)
 
-            # Combine base attributes with mast attributes
-            combined_attributes = base_attributes.copy()
-            combined_attributes.update(mast_attributes)
+            # Combine base attributes with mast attributes (one merged copy)
+            combined_attributes = {**base_attributes, **mast_attributes}
 
             #print(f"mast_attributes attributes: {mast_attributes}")
             # Add GPS coordinates if available
@@ -166,7 +170,7 @@ class ToppbefaringUploader:
             #print(f"Update result: {update_result}")
             if update_result == "Update failed":
                 print(f"Failed to update attributes for {image_path}")
-                return None
+                return UploadOutcome("failed", file_hash)
 
             # Log the upload with all fields from imageinfo
             log_data = [
@@ -189,14 +193,15 @@ class ToppbefaringUploader:
             self.tracker.log_upload(log_data)
 
             print(f"Successfully uploaded and updated {imageinfo.get('filename')}")
-            return upload_result
+            return UploadOutcome("ok", file_hash, upload_result)
 
         except Exception as e:
             print(f"Error uploading {image_path}: {str(e)}")
             # Log failed upload attempt
             try:
                 filename = os.path.basename(image_path)
-                file_hash = self.image_service.calculate_file_hash(image_path, 'md5') if hasattr(self, 'image_service') else 'unknown'
+                if file_hash is None:
+                    file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm) if hasattr(self, 'image_service') else 'unknown'
                 # Lag failed_data med samme rekkefølge og antall kolonner som log_data/imageinfo
                 failed_data = [
                     filename,                # filename
@@ -217,7 +222,7 @@ class ToppbefaringUploader:
                 print(f"Logged failed upload attempt for {filename}")
             except Exception as log_error:
                 print(f"Failed to log upload error: {log_error}")
-            return None
+            return UploadOutcome("failed", file_hash)
 
     def upload_from_folder(self, folder_path, base_attributes_template, find_mast=True, resize_options=None):
         """
@@ -234,41 +239,67 @@ class ToppbefaringUploader:
         failed_count = 0
         skipped_count = 0
 
-        # Get list of image files first
-        image_files = []
-        for filename in os.listdir(folder_path):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                image_files.append(filename)
+        # Get list of image files first; the directory entries carry the stat used below
+        image_entries = list(iter_image_entries(folder_path))
+        image_files = [entry.name for entry in image_entries]
 
         total_files = len(image_files)
         print(f"Found {total_files} image files to process")
 
-        for i, filename in enumerate(image_files, 1):
+        # Files handled in an earlier run and unchanged since (same mtime and size) are skipped
+        # on os.stat alone, before they are opened or hashed
+        pending = []
+        for entry in image_entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                stat = None
+            if stat is not None and self.tracker.has_been_seen(entry.path, stat.st_mtime_ns, stat.st_size):
+                skipped_count += 1
+                continue
+            pending.append((entry.name, stat))
+        if skipped_count:
+            print(f"Skipping {skipped_count} unchanged files handled in an earlier run")
+
+        def _process_one(filename, file_hash, stat):
             image_path = os.path.join(folder_path, filename)
-            print(f"[{i}/{total_files}] Processing {filename}...")
-
-            # Copy attributes template
-            attributes = base_attributes_template.copy()
-
-            # Set filename in attributes
-            attributes['Name'] = filename
 
-            result = self.upload_toppbefaring_image(image_path, attributes, find_mast, resize_options)
-
-            
-            if result is None:
-                # Check if it was skipped (already uploaded) or failed
-                file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
-                is_uploaded, _, _ = self.tracker.has_been_uploaded(file_hash)
-                if is_uploaded:
+            # Attributes template with the filename, built in a single copy
+            attributes = {**base_attributes_template, 'Name': filename}
+
+            # The outcome carries the status, so the image is not hashed again to classify it
+            outcome = self.upload_toppbefaring_image(image_path, attributes, find_mast, resize_options, file_hash)
+            if outcome.status in ("ok", "skipped") and stat is not None and outcome.file_hash:
+                self.tracker.mark_seen(image_path, stat.st_mtime_ns, stat.st_size, outcome.file_hash)
+            return outcome.status
+
+        # The tracker and the ImageGrid session/token are shared safely between the worker threads;
+        # uploads (POST) that get 429 are retried by _send, honouring Retry-After
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Hash every file once and pass the hash down to the upload. Files are submitted as soon
+            # as they are hashed, so uploads start while the rest of the folder is still being read
+            image_paths = [os.path.join(folder_path, filename) for filename, _ in pending]
+            futures = {executor.submit(_process_one, filename, file_hash, stat): filename
+                       for (filename, stat), (_, file_hash) in zip(pending, self.image_service.iter_file_hashes(
+                           image_paths, stats=[stat for _, stat in pending]))}
+
+            for i, future in enumerate(as_completed(futures), skipped_count + 1):
+                filename = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"Error processing {filename}: {e}")
+                    status = "failed"
+
+                if status == "ok":
+                    uploaded_count += 1
+                    print(f"[{i}/{total_files}] {filename}: Uploaded successfully")
+                elif status == "skipped":
                     skipped_count += 1
                     print(f"[{i}/{total_files}] {filename}: Skipped (already uploaded)")
                 else:
                     failed_count += 1
                     print(f"[{i}/{total_files}] {filename}: Failed")
-            else:
-                uploaded_count += 1
-                print(f"[{i}/{total_files}] {filename}: Uploaded successfully")
 
         print(f"\nUpload complete:")
         print(f"  Total files: {total_files}")
@@ -6,12 +6,13 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from dotenv import load_dotenv
-from services.imagegrid import ImageGridService
+from services.imagegrid import ImageGridService, get_upload_concurrency
 from services.uploadtracker import ImageUploadTracker
 from services.findnearast import FindNearestService
 from services.arcgis import ArcGISService
-from services.image_processing import ImageProcessingService
+from services.image_processing import ImageProcessingService, iter_image_entries
 
 # Add models directory to path if needed
 models_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
@@ -24,8 +25,13 @@ import pandas as pd
 # Load environment variables from .env file
 load_dotenv()
 
+# Antall undermapper (nettstasjoner) som lastes opp samtidig, hver i sin egen prosess.
+# UPLOAD_MAX_CONCURRENCY fordeles mellom prosessene, så grensen mot API-et gjelder totalt.
+SUBFOLDER_WORKERS = 4
+
 class DistribusjonUploader:
-    def __init__(self, client_id=None, client_secret=None, token_url=None, imgr_api_url=None, tracking_file=None):
+    def __init__(self, client_id=None, client_secret=None, token_url=None, imgr_api_url=None, tracking_file=None,
+                 max_workers=None):
         # Use environment variables if not provided
         self.client_id = client_id or os.getenv('IMAGEGRID_CLIENT_ID')
         self.client_secret = client_secret or os.getenv('IMAGEGRID_CLIENT_SECRET')
@@ -45,6 +51,8 @@ class DistribusjonUploader:
         self.image_info = ImageInfo()
         self.tenant_name = "moerenett"
         self.schema_name = "Distribusjonsnett"
+        # Antall bilder som lastes opp samtidig; hvert bilde venter mest på HTTP-kall
+        self.max_workers = max_workers or self.image_service.max_concurrency
 
         
 
@@ -52,13 +60,12 @@ class DistribusjonUploader:
         upload_result = None
         try:
             # Handle resizing if requested
-            upload_path = image_path
             max_width = 7680 
             max_height = 4320
             quality = 90
 
             # Calculate file hash (use original path for tracking)
-            #file_hash = self.image_service.calculate_file_hash(image_path, 'md5')
+            #file_hash = self.image_service.calculate_file_hash(image_path, self.image_service.hash_algorithm)
             
             #print(f"Checking if image {os.path.basename(image_path)} exists in ImageGrid...")
             exist_in_imagegrid = self.image_service.check_image_exists(file_hash)
@@ -72,11 +79,12 @@ class DistribusjonUploader:
                 #return None
 
             else:
-                upload_path = self.image_processor.resize_image_with_exif(
+                # Resized in memory (None when the image already fits), so no temporary file is written
+                resized = self.image_processor.resize_image_to_bytes(
                     image_path, max_width, max_height, quality
                 )
                 # Upload the image
-                upload_result = self.image_service.upload_image(upload_path, file_hash)
+                upload_result = self.image_service.upload_image(image_path, file_hash, data=resized)
                 #print(f"Upload result: {upload_result}")
 
                 if not upload_result:
@@ -93,13 +101,6 @@ class DistribusjonUploader:
                     self.tracker.log_upload(log_data)
                     return status
 
-                # Delete the resized file if it was created
-                try:
-                    if upload_path != image_path and os.path.exists(upload_path):
-                        os.remove(upload_path)
-                except Exception as e:
-                    print(f"Warning: Could not delete temporary file {upload_path}: {str(e)}")
-
                 image_id = upload_result.get('id') if upload_result else None
 
                 status = "new_image"
@@ -173,7 +174,7 @@ class DistribusjonUploader:
             try:
                 failed_data = self.image_info.create_failed_log_data(
                     filepath=image_path,
-                    filehash=self.image_service.calculate_file_hash(image_path, 'md5') if hasattr(self, 'image_service') else 'unknown',
+                    filehash=file_hash or 'unknown',
                     kilde=self.kilde,
                     anleggstype='Nettstasjon'
                 )
@@ -197,6 +198,17 @@ class DistribusjonUploader:
         
         trackerfile = os.path.join(folder_path, "upload_log.csv")
         self.tracker = ImageUploadTracker(trackerfile)
+        # Trackeren lukkes til slutt, så køede loggrader skrives også når atexit ikke kjøres
+        # (prosesser i ProcessPoolExecutor avsluttes uten atexit)
+        try:
+            self._upload_tracked_folder(folder_path, resize_options)
+        finally:
+            self.tracker.close()
+
+    def _upload_tracked_folder(self, folder_path, resize_options):
+        """
+        Laster opp bildene i folder_path med self.tracker som allerede er åpnet av upload_from_folder.
+        """
         uploaded_count = 0
         failed_count = 0
         skipped_count = 0
@@ -213,49 +225,62 @@ class DistribusjonUploader:
         
         #filename,latitude,longitude,anleggstype,anleggstype_n,navn,driftsmerking,erhistorisk,ergroft,kilde,nettmelding_elsmart,erutvendig,erinnvendig
        
-        # Get list of image files first
-        image_files = []
-        for root, dirs, files in os.walk(folder_path):
-            for filename in files:
-                if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp')):
-                    image_files.append(os.path.join(root, filename))
-
-        total_files = len(image_files)
+        # Get list of image files first (also in subfolders); the entries carry their stat
+        image_entries = list(iter_image_entries(folder_path, recursive=True))
+        image_paths = [entry.path for entry in image_entries]
+
+        total_files = len(image_paths)
         print(f"Found {total_files} image files to process")
         updated_count = 0
         failed_update_count = 0
 
-        for i, filename in enumerate(image_files, 1):
-            image_path = os.path.join(folder_path, filename)
-            
-            filehash = self.image_service.calculate_file_hash(image_path, 'md5')
-            
-            print(f"Processing file {i}/{total_files}: {filename} with hash {filehash}")
+        def _process_one(image_path, filename, filehash):
+            print(f"Processing file {filename} with hash {filehash}")
 
             exist_in_logfile, upload_time, update_time = self.tracker.has_been_uploaded(filehash)
 
             if exist_in_logfile:
-                skipped_count += 1
-                print(f"[{i}/{total_files}] {filename}: Skipped (already uploaded)")
-                continue
-            #print(f"[{i}/{total_files}] Processing {filename}...")
-            result = self.upload_distribusjon_image(image_path, filehash, attributes, resize_options)
-            
-
-            if result == "Skipped":
-                skipped_count += 1
-                #print(f"[{i}/{total_files}] {filename}: Skipped (already uploaded)")
-            elif result == "updated_image":
-                updated_count += 1
-                #print(f"[{i}/{total_files}] {filename}: Updated (already uploaded)")
-            elif result == "failed_upload" or  result is None:
-                failed_count += 1
-                print(f"[{i}/{total_files}] {filename}: Failed")
-            elif result == "failed_update":
-                failed_update_count += 1
-            else:
-                uploaded_count += 1
-                print(f"[{i}/{total_files}] {filename}: Uploaded successfully")
+                return "Skipped"
+            return self.upload_distribusjon_image(image_path, filehash, attributes, resize_options)
+
+        # Bildene lastes opp parallelt; trackeren og ImageGrid-sessionen (med token) deles trygt
+        # mellom trådene, og opplastinger (POST) som får 429 prøves på nytt av _send etter Retry-After
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Filene sendes til opplasting så snart de er hashet, så opplastingen starter
+            # mens resten av mappen fortsatt leses fra disk
+            stats = []
+            for entry in image_entries:
+                try:
+                    stats.append(entry.stat(follow_symlinks=False))
+                except OSError:
+                    # Hashingen stat'er filen selv og logger feilen
+                    stats.append(None)
+            # entry.path er allerede full sti (også i undermapper); filnavnet tas fra entry.name
+            futures = {executor.submit(_process_one, image_path, entry.name, filehash): entry.name
+                       for entry, (image_path, filehash) in zip(image_entries, self.image_service.iter_file_hashes(image_paths, stats=stats))}
+
+            for i, future in enumerate(as_completed(futures), 1):
+                filename = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error processing {filename}: {e}")
+                    result = None
+
+                if result == "Skipped":
+                    skipped_count += 1
+                    print(f"[{i}/{total_files}] {filename}: Skipped (already uploaded)")
+                elif result == "updated_image":
+                    updated_count += 1
+                    #print(f"[{i}/{total_files}] {filename}: Updated (already uploaded)")
+                elif result == "failed_upload" or  result is None:
+                    failed_count += 1
+                    print(f"[{i}/{total_files}] {filename}: Failed")
+                elif result == "failed_update":
+                    failed_update_count += 1
+                else:
+                    uploaded_count += 1
+                    print(f"[{i}/{total_files}] {filename}: Uploaded successfully")
 
         print(f"\nUpload complete:")
         print(f"  Total files: {total_files}")
@@ -266,6 +291,37 @@ class DistribusjonUploader:
         print(f"  Failed: {failed_count}")
 
 
+def _upload_subfolder(subfolder_path, max_workers):
+    """
+    Laster opp én undermappe i en egen prosess, med egen uploader (egen session og tracker)
+    og max_workers samtidige opplastinger.
+    """
+    try:
+        DistribusjonUploader(max_workers=max_workers).upload_from_folder(subfolder_path)
+    except Exception as e:
+        print(f"Error uploading folder {subfolder_path}: {str(e)}")
+
+
+def upload_subfolders(folder_path, max_workers=SUBFOLDER_WORKERS):
+    """
+    Laster opp alle undermappene i folder_path parallelt. Hver undermappe er en egen nettstasjon
+    med egen upload_log.csv, så de kan behandles i hver sin prosess uten felles tilstand;
+    prosessene gir hashing og nedskalering hver sin kjerne.
+    UPLOAD_MAX_CONCURRENCY deles mellom prosessene, så det totale antallet samtidige kall
+    mot ImageGrid ikke øker; det startes derfor aldri flere prosesser enn den grensen.
+    """
+    with os.scandir(folder_path) as entries:
+        subfolders = [entry.path for entry in entries if entry.is_dir()]
+    print(f"Found {len(subfolders)} image folders in {folder_path}")
+    if not subfolders:
+        return
+
+    concurrency = get_upload_concurrency()
+    workers = max(1, min(max_workers, len(subfolders), concurrency))
+    uploads_per_worker = max(1, concurrency // workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_upload_subfolder, subfolders, [uploads_per_worker] * len(subfolders)))
+
 
 # Example usage
 if __name__ == "__main__":
@@ -281,12 +337,7 @@ if __name__ == "__main__":
         uploader = DistribusjonUploader()
         uploader.upload_from_folder(testfolder)
 
-        for image_folder_path in os.listdir(folder_path):
-            if os.path.isdir(os.path.join(folder_path, image_folder_path)):
-                print(f"Found image folder: {image_folder_path}")
-                
-                uploader = DistribusjonUploader()
-                uploader.upload_from_folder(os.path.join(folder_path, image_folder_path))
+        upload_subfolders(folder_path)
 
 
     except Exception as main_e: